@@ -0,0 +1,240 @@
+"""
+离线分类器基准测试
+用固定随机种子生成与爬虫输出结构相同的合成帖子，不访问 Reddit，也不调用 LLM。
+覆盖 classify_posts / classify_task_posts / extract_budget / score_text，
+报告每秒处理帖子数和峰值内存，结果保存为 JSON，可与之前的结果对比。
+
+用法:
+    python bench_classifier.py
+    python bench_classifier.py --sizes 1000 10000 --output before.json
+    python bench_classifier.py --compare before.json --max-regression 0.2
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time as time_module
+import tracemalloc
+
+import classifier
+import llm_classifier
+import task_classifier
+from classification_cache import clear_classification_cache
+from rules import get_rules
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_SEED = 42
+DEFAULT_OUTPUT = "bench_results.json"
+
+# ===== 合成语料 =====
+# 信号短语按类别分组，保证各类信号都有一定命中率
+SIGNAL_PHRASES = {
+    "need": [
+        "i wish there was a tool for this", "i'd pay for something like that", "why isn't there an app",
+        "someone should build this", "is there a tool that", "looking for a solution", "tired of manually copying",
+        "there should be an easier way", "need a way to", "any alternative to", "how do you all handle",
+        "we need", "biggest pain point", "my workflow", "automate", "build a saas", "pivot", "validation",
+        "side project", "market research", "customer feedback", "would you pay", "feedback on", "launched",
+        "monetize", "mvp", "indie hacker", "recurring revenue", "finding customers", "lead gen",
+    ],
+    "personal": [
+        "help me", "my laptop", "can't log in", "how do i fix", "stopped working", "broken",
+        "error message", "not working", "please help", "urgent", "troubleshoot",
+    ],
+    "skill": [
+        "scraper", "web scraping", "automation", "telegram bot", "python script", "chrome extension",
+        "web app", "api integration", "data extraction", "n8n workflow", "zapier", "dashboard",
+        "google sheets", "csv export", "discord bot", "react frontend", "node.js", "sql database",
+        "lead list", "monitoring alerts", "cron job", "pdf report", "selenium", "playwright",
+    ],
+    "danger": [
+        "nsfw", "remote desktop", "login to my account", "write my essay", "homework", "fake review",
+        "hack", "crack", "phishing", "buy likes",
+    ],
+    "offer": [
+        "[for hire]", "i can build", "hire me", "my portfolio", "$30/hr", "per hour",
+    ],
+    "non_tech": [
+        "virtual assistant", "content writer", "ghostwriter", "seo article", "grow my instagram",
+        "social media marketing", "copywriting", "translation", "transcription", "data entry",
+    ],
+    "budget": [
+        "budget: $150", "paying $50", "200 usd", "$1,000", "pay 75 dollars", "$12.50", "budget 300",
+    ],
+}
+FILLER_WORDS = (
+    "the a and to of for with our my we this that it is on in at by from team users small people "
+    "project work time day week need want make get use new more some help thing site page data "
+    "app tool business client service product build quick simple looking anyone"
+).split()
+# 每个帖子在标题/正文中插入信号短语的概率（按类别）
+SIGNAL_DENSITY = {
+    "need": 0.35, "personal": 0.15, "skill": 0.45, "danger": 0.06,
+    "offer": 0.10, "non_tech": 0.12, "budget": 0.25,
+}
+TITLE_PREFIXES = ["[TASK] ", "[Task] ", "[For Hire] ", "[Hiring] ", "", "", "", ""]
+FLAIRS = ["Task", "TASK", "Hiring", "For Hire", "Offer", "Job", "", "", "", "Meta"]
+SUBREDDITS = ["slavelabour", "forhire", "hiring", "freelance", "SideProject", "Entrepreneur", "SaaS"]
+
+
+def make_corpus(n, seed=DEFAULT_SEED, now=None):
+    """
+    生成 n 个合成帖子，字段与 scraper 输出一致
+    - 标题 4~14 个词，正文 0~120 个词（截断到 500 字符，与 scraper 相同）
+    - 信号短语按 SIGNAL_DENSITY 随机插入，同一个 seed 结果完全相同
+    """
+    rnd = random.Random(seed)
+    now = now or time_module.time()
+    posts = []
+    for i in range(n):
+        title_words = [rnd.choice(FILLER_WORDS) for _ in range(rnd.randint(4, 14))]
+        text_words = [rnd.choice(FILLER_WORDS) for _ in range(rnd.randint(0, 120))]
+        for family, density in SIGNAL_DENSITY.items():
+            if rnd.random() < density:
+                # 大约三分之一的信号出现在标题里
+                target = title_words if rnd.random() < 0.33 else text_words
+                target.insert(rnd.randint(0, len(target)), rnd.choice(SIGNAL_PHRASES[family]))
+        title = " ".join(title_words)
+        if rnd.random() < 0.3:
+            title = title.capitalize()
+        posts.append({
+            "id": f"bench{i}",
+            "title": rnd.choice(TITLE_PREFIXES) + title,
+            "text": " ".join(text_words)[:500],
+            "score": rnd.choice([0, 1, 2, 3, 5, 8, 11, 20, 25, 60, 150]),
+            "num_comments": rnd.choice([0, 1, 2, 5, 9, 10, 15, 21, 40]),
+            "url": f"https://www.reddit.com/r/bench/comments/bench{i}",
+            "created": now - rnd.randint(0, 7 * 86400),
+            "subreddit": rnd.choice(SUBREDDITS),
+            "author": f"user{rnd.randint(1, 5000)}",
+            "flair": rnd.choice(FLAIRS),
+        })
+    return posts
+
+
+# ===== 基准项 =====
+
+def _run_score_text(posts):
+    for post in posts:
+        text = post["title"] + " " + post["text"]
+        task_classifier.score_text(text, task_classifier.SKILL_MATCH_SIGNALS)
+        classifier.score_text(text, classifier.NEED_SIGNALS)
+
+
+def _run_extract_budget(posts):
+    for post in posts:
+        task_classifier.extract_budget(post["title"] + " " + post["text"])
+
+
+BENCHMARKS = {
+    "classify_posts": classifier.classify_posts,
+    "classify_task_posts": task_classifier.classify_task_posts,
+    "extract_budget": _run_extract_budget,
+    "score_text": _run_score_text,
+}
+
+
+def _measure(fn, posts, repeat):
+    """返回 (最快一次的耗时秒数, tracemalloc 峰值字节数)"""
+    best = None
+    for _ in range(repeat):
+        # 每次都清空分类结果缓存，测的是规则匹配本身而不是缓存命中
+        clear_classification_cache()
+        gc.collect()
+        start = time_module.perf_counter()
+        fn(posts)
+        elapsed = time_module.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # 内存单独测一次：tracemalloc 会拖慢执行，不能和计时混在一起
+    clear_classification_cache()
+    gc.collect()
+    tracemalloc.start()
+    fn(posts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(sizes, seed=DEFAULT_SEED, repeat=3, names=None):
+    # 基准测试不调用 LLM
+    llm_classifier.override_llm(None)
+
+    names = names or list(BENCHMARKS)
+    results = []
+    for size in sizes:
+        posts = make_corpus(size, seed=seed)
+        for name in names:
+            # 大语料只跑一次，避免耗时过长
+            runs = repeat if size <= 10000 else 1
+            elapsed, peak = _measure(BENCHMARKS[name], posts, runs)
+            result = {
+                "benchmark": name,
+                "posts": size,
+                "seconds": round(elapsed, 4),
+                "posts_per_sec": round(size / elapsed, 1) if elapsed > 0 else None,
+                "peak_memory_mb": round(peak / 1024 / 1024, 2),
+            }
+            print(f"[BENCH] {name:<20} {size:>7} posts  {result['posts_per_sec']:>11,.0f} posts/s  "
+                  f"peak {result['peak_memory_mb']:.2f} MB")
+            results.append(result)
+
+    return {
+        "created": int(time_module.time()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": seed,
+        "rules": get_rules().summary(),
+        "results": results,
+    }
+
+
+def compare_results(current, baseline, max_regression):
+    """
+    与之前保存的结果对比，返回变慢超过 max_regression（比例）的基准项
+    """
+    previous = {(r["benchmark"], r["posts"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["benchmark"], result["posts"]))
+        if not old or not old.get("posts_per_sec") or not result.get("posts_per_sec"):
+            continue
+        change = result["posts_per_sec"] / old["posts_per_sec"] - 1
+        print(f"[BENCH] {result['benchmark']:<20} {result['posts']:>7} posts  {change:+.1%} throughput  "
+              f"memory {old['peak_memory_mb']:.2f} -> {result['peak_memory_mb']:.2f} MB")
+        if change < -max_regression:
+            regressions.append({**result, "baseline_posts_per_sec": old["posts_per_sec"], "change": round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the classification hot path")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="corpus sizes")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="corpus random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per benchmark (best is kept)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to save the JSON results")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="fail when throughput drops by more than this fraction (with --compare)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, seed=args.seed, repeat=args.repeat, names=args.only)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.max_regression)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} benchmark(s) regressed more than {args.max_regression:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
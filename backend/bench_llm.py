@@ -0,0 +1,140 @@
+"""
+LLM 分析路径压测（使用本地模拟服务，不产生费用）
+在不同并发数和故障组合下运行 enrich_tasks_with_llm，报告吞吐量和单次请求延迟分位数（p50 / p95 / p99）。
+LLM 缓存和本地分诊模型在压测期间关闭，额度限制使用当前环境变量配置。
+
+用法:
+    python bench_llm.py
+    python bench_llm.py --posts 60 --concurrency 1 4 8 --mixes clean flaky --batch-size 1 5
+    python bench_llm.py --url http://127.0.0.1:8911/v1/chat/completions   # 使用已经启动的模拟服务
+"""
+import argparse
+import json
+import sys
+import time as time_module
+
+import llm_cache
+import llm_classifier
+import triage_model
+from bench_classifier import make_corpus
+from mock_llm_server import start_mock_server
+from models import TaskPost
+
+# 故障组合：模拟服务配置
+FAILURE_MIXES = {
+    "clean": {"latency": "lognormal:300:0.3"},
+    "flaky": {"latency": "lognormal:300:0.5", "error_rate": 0.05, "malformed_rate": 0.05, "fenced_rate": 0.3},
+    "degraded": {"latency": "lognormal:900:0.8", "error_rate": 0.15, "rate_limit_rate": 0.1, "malformed_rate": 0.1,
+                 "missing_rate": 0.2},
+}
+
+
+def make_candidates(n, seed=42):
+    """生成 n 个待分析的 skill_match 帖子"""
+    posts = []
+    for index, post in enumerate(make_corpus(n, seed=seed)):
+        record = TaskPost.from_post(post)
+        record.task_category = "skill_match"
+        record.skill_score = 2
+        record.budget = None
+        record.freshness_label = "Fresh"
+        record.freshness_minutes = index
+        posts.append(record)
+    return posts
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _timed_chat_completion(latencies, original):
+    """记录每次请求的客户端延迟"""
+    def wrapper(*args, **kwargs):
+        start = time_module.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            latencies.append(time_module.perf_counter() - start)
+    return wrapper
+
+
+def run_case(url, posts, concurrency, batch_size, deadline):
+    # 只请求本地模拟服务，忽略 .env 里的 LLM_ENDPOINTS / LLM_API_KEY
+    llm_classifier.override_llm(url)
+    # 连接池大小跟随并发数
+    llm_classifier.LLM_CONCURRENCY = concurrency
+    llm_classifier._SESSION = None
+
+    latencies = []
+    original = llm_classifier._chat_completion
+    llm_classifier._chat_completion = _timed_chat_completion(latencies, original)
+    try:
+        for post in posts:
+            post["llm_analysis"] = None
+        start = time_module.perf_counter()
+        llm_classifier.enrich_tasks_with_llm(posts, max_analyze=len(posts), concurrency=concurrency,
+                                             deadline=deadline, batch_size=batch_size)
+        elapsed = time_module.perf_counter() - start
+    finally:
+        llm_classifier._chat_completion = original
+
+    enriched = sum(1 for post in posts if post.get("llm_analysis"))
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "enriched": enriched,
+        "enriched_per_sec": round(enriched / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 1) if latencies else None
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for LLM enrichment against a local mock server")
+    parser.add_argument("--posts", type=int, default=40, help="posts to enrich per case")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--mixes", nargs="+", choices=list(FAILURE_MIXES), default=list(FAILURE_MIXES))
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1])
+    parser.add_argument("--deadline", type=float, default=120, help="enrichment deadline per case (seconds)")
+    parser.add_argument("--url", help="use an already running mock server instead of starting one per mix")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_llm_results.json")
+    args = parser.parse_args(argv)
+
+    # 每个帖子都要真正请求一次
+    llm_cache.LLM_CACHE_ENABLED = False
+    triage_model.TRIAGE_ENABLED = False
+
+    results = []
+    for mix in ([None] if args.url else args.mixes):
+        server, url = (None, args.url) if args.url else start_mock_server({**FAILURE_MIXES[mix], "seed": args.seed})
+        try:
+            for batch_size in args.batch_size:
+                for concurrency in args.concurrency:
+                    posts = make_candidates(args.posts, seed=args.seed)
+                    result = run_case(url, posts, concurrency, batch_size, args.deadline)
+                    result.update({"mix": mix or "external", "concurrency": concurrency, "batch_size": batch_size})
+                    latency = result["latency_ms"]
+                    print(f"[BENCH] {result['mix']:<9} c={concurrency:<2} batch={batch_size:<2} "
+                          f"{result['enriched']:>3}/{args.posts} enriched in {result['seconds']:>6.2f}s  "
+                          f"{result['requests']:>3} requests  p50 {latency['p50']} ms  p95 {latency['p95']} ms  "
+                          f"p99 {latency['p99']} ms")
+                    results.append(result)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created": int(time_module.time()), "posts": args.posts, "results": results}, f, indent=2)
+    print(f"[BENCH] Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+分类结果缓存
+定时扫描时同一个帖子会在 time_filter 窗口里停留好几天，每轮都重新跑正则没有意义。
+- 按 (分类器, 帖子 id) 缓存正则打分结果，同时记录内容哈希（title + text + flair）和规则集哈希
+- 帖子被编辑或规则变化时哈希不一致，自动重新分类
+- 只缓存只依赖文本的部分，时间相关（freshness）和互动相关（score / num_comments）的字段每次重新计算
+- demand / task 两个分类器各自一个缓存，条目数超过上限时按 LRU 淘汰
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CLASSIFY_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFY_CACHE_MAX_ENTRIES", "5000"))
+
+
+def content_hash(post):
+    """帖子中影响分类结果的文本内容的哈希"""
+    raw = "\0".join((post.get("title", ""), post.get("text", ""), post.get("flair", "") or ""))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def rules_hash(*pattern_groups):
+    """规则集哈希：任意一条 pattern 增删改都会改变哈希"""
+    raw = json.dumps(pattern_groups, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ClassificationCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "edited": 0, "rules_changed": 0, "evictions": 0}
+
+    def get(self, key, digest, rules):
+        """命中返回缓存的打分结果；未命中、帖子被编辑或规则变化时返回 None"""
+        if self.max_entries <= 0 or not key:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            cached_digest, cached_rules, value = entry
+            if cached_digest != digest or cached_rules != rules:
+                self.stats["edited" if cached_digest != digest else "rules_changed"] += 1
+                self.stats["misses"] += 1
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, digest, rules, value):
+        if self.max_entries <= 0 or not key:
+            return
+        with self.lock:
+            self.entries[key] = (digest, rules, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+            return count
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["max_entries"] = self.max_entries
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def _get_cache(kind):
+    with _CACHES_LOCK:
+        cache = _CACHES.get(kind)
+        if cache is None:
+            cache = _CACHES[kind] = ClassificationCache(CLASSIFY_CACHE_MAX_ENTRIES)
+        return cache
+
+
+def get_cached(kind, post, rules):
+    """返回 (缓存结果或 None, 内容哈希)，内容哈希供未命中时 store_cached 使用"""
+    digest = content_hash(post)
+    return _get_cache(kind).get(post.get("id"), digest, rules), digest
+
+
+def store_cached(kind, post, digest, rules, value):
+    _get_cache(kind).put(post.get("id"), digest, rules, value)
+
+
+def get_classification_cache_stats():
+    """各分类器缓存的命中率和条目数 {kind: stats}"""
+    with _CACHES_LOCK:
+        caches = dict(_CACHES)
+    return {kind: cache.get_stats() for kind, cache in caches.items()}
+
+
+def clear_classification_cache():
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    return sum(cache.clear() for cache in caches)
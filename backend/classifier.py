@@ -1,5 +1,11 @@
 import re
 
+from classification_cache import get_cached, store_cached
+from models import DemandPost
+from ranking import demand_rank_key, top_k as select_top_k
+from rules import get_rules
+
+# 内置规则（未设置 RULES_FILE 时使用，见 rules.py）
 # 产品需求信号词
 NEED_SIGNALS = [
     r"i wish there was",
@@ -62,25 +68,37 @@ def score_text(text, patterns):
             matched.append(pattern)
     return score, matched
 
-def classify_posts(posts):
+def classify_posts(posts, top_k=None, rules=None):
+    """
+    top_k: 只需要前 k 名时传入，用堆选择代替完整排序，结果与完整排序的前 k 个相同
+    rules: 使用的 RuleSet，默认取当前生效版本（整批帖子用同一个版本）
+    文本和规则都没变的帖子复用缓存的信号词匹配结果，互动加权每次重新计算
+    """
+    if rules is None:
+        rules = get_rules()
     results = []
     for post in posts:
-        full_text = f"{post['title']} {post['text']}"
-        
-        need_score, need_matches = score_text(full_text, NEED_SIGNALS)
-        personal_score, personal_matches = score_text(full_text, PERSONAL_SIGNALS)
+        # 分类字段直接写在记录上，不复制帖子内容
+        result = DemandPost.from_post(post)
+
+        scored, digest = get_cached("demand", result, rules.hash)
+        if scored is None:
+            hits = rules.demand_matcher.match(f"{result.title} {result.text}")
+            scored = (len(hits["need"]), hits["need"], len(hits["personal"]), hits["personal"])
+            store_cached("demand", result, digest, rules.hash, scored)
+        need_score, need_matches, personal_score, personal_matches = scored
         
         # 评论数和点赞数作为加权因素
         engagement_bonus = 0
-        if post["num_comments"] >= 10:
+        if result.num_comments >= 10:
             engagement_bonus += 1
-        if post["score"] >= 20:
+        if result.score >= 20:
             engagement_bonus += 1
         
         need_score += engagement_bonus
         
         # 高互动帖子标记
-        high_engagement = post["num_comments"] > 20 or post["score"] > 10
+        high_engagement = result.num_comments > 20 or result.score > 10
         
         if need_score > personal_score and need_score >= 2:
             category = "product_need"
@@ -100,20 +118,22 @@ def classify_posts(posts):
             category = "unclear"
             confidence = 0.3
         
-        results.append({
-            **post,
-            "category": category,
-            "confidence": round(confidence, 2),
-            "need_score": need_score,
-            "personal_score": personal_score,
-            "need_matches": need_matches,
-            "personal_matches": personal_matches,
-        })
+        result.category = category
+        result.confidence = round(confidence, 2)
+        result.need_score = need_score
+        result.personal_score = personal_score
+        result.need_matches = need_matches
+        result.personal_matches = personal_matches
+        result.rule_version = rules.version
+        results.append(result)
     
+    if top_k is not None:
+        return select_top_k(results, top_k, demand_rank_key)
+
     # 按需求分数降序排列，product_need 优先，其次 worth_looking
     results.sort(key=lambda x: (
-        x["category"] == "product_need",
-        x["category"] == "worth_looking",
-        x["need_score"]
+        x.category == "product_need",
+        x.category == "worth_looking",
+        x.need_score
     ), reverse=True)
     return results
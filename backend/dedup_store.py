@@ -0,0 +1,293 @@
+"""
+已通知帖子 id 的持久化去重存储（代替 main.py 中只在内存里、重启就清空的 set）
+- SQLite（WAL 模式），文件放在持久化 volume 上时重新部署后仍然有效（默认路径在应用目录内，
+  启动时会打印警告）；多个进程共用同一个文件也安全（busy_timeout 等待写锁）
+- 前面加一个内存 Bloom 过滤器：绝大多数没通知过的帖子只查内存（O(1)），
+  只有 Bloom 判断"可能存在"的才查 SQLite 确认，因此误判不会导致漏通知
+- 其他进程新写入的 id 按自增序号增量同步到本进程的 Bloom 过滤器（最多每 DEDUP_SYNC_INTERVAL 秒一次）
+- 过期时间跟扫描窗口挂钩：帖子发布时间 + DEDUP_TTL_SECONDS（定时扫描只看最近一周的帖子，
+  默认 8 天，超过后帖子不会再被扫描到），过期条目定期删除，存储大小有上限
+- pending 表: 所有通知通道都失败的帖子（完整内容 JSON），下次扫描重新入队，发送成功后删除，
+  同样按帖子发布时间过期（增量扫描不会再抓到这些帖子，不保存的话通知就丢了）
+- get_stats() 报告条目数、待重发帖子数、Bloom 过滤器占用内存和估算误判率、数据库文件大小
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time as time_module
+
+from storage import data_path, persistence_warning
+
+DEDUP_STORE_PATH = os.getenv("DEDUP_STORE_PATH") or data_path("dedup_store.sqlite3")
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(8 * 86400)))
+# Bloom 过滤器的初始容量和目标误判率，条目超过容量时按两倍重建
+DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "50000"))
+DEDUP_BLOOM_ERROR_RATE = float(os.getenv("DEDUP_BLOOM_ERROR_RATE", "0.001"))
+DEDUP_SYNC_INTERVAL = float(os.getenv("DEDUP_SYNC_INTERVAL", "1"))
+
+# 过期条目最多每隔多久清理一次（秒）
+_PURGE_INTERVAL = 3600
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(1, capacity)
+        self.size = max(64, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def false_positive_rate(self):
+        """按已加入的条目数估算当前误判率"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class DedupStore:
+    def __init__(self, path, ttl, bloom_capacity=DEDUP_BLOOM_CAPACITY, sync_interval=DEDUP_SYNC_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.bloom_capacity = bloom_capacity
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.stats = {"checks": 0, "bloom_negatives": 0, "db_lookups": 0, "bloom_false_positives": 0,
+                      "added": 0, "expired": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notified (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_id TEXT NOT NULL UNIQUE,
+                notified_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_notified_expires ON notified (expires_at)")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending (
+                post_id TEXT PRIMARY KEY,
+                post TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                failed_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+        self.last_purge = 0.0
+        with self.lock:
+            self._rebuild_bloom()
+
+    # ========== 在 self.lock 内调用 ==========
+
+    def _rebuild_bloom(self):
+        """从数据库重建 Bloom 过滤器（启动、清理过期条目、超过容量时）"""
+        count = self.conn.execute("SELECT COUNT(*) FROM notified").fetchone()[0]
+        while count > self.bloom_capacity:
+            self.bloom_capacity *= 2
+        self.bloom = BloomFilter(self.bloom_capacity, DEDUP_BLOOM_ERROR_RATE)
+        self.synced_seq = 0
+        self.last_sync = 0.0
+        self._sync(force=True)
+
+    def _sync(self, force=False):
+        """把其他进程新写入的 id 加入 Bloom 过滤器"""
+        now = time_module.monotonic()
+        if not force and now - self.last_sync < self.sync_interval:
+            return
+        self.last_sync = now
+        rows = self.conn.execute(
+            "SELECT seq, post_id FROM notified WHERE seq > ? ORDER BY seq", (self.synced_seq,)
+        ).fetchall()
+        for seq, post_id in rows:
+            self.bloom.add(post_id)
+            self.synced_seq = seq
+        if self.bloom.count > self.bloom.capacity:
+            self._rebuild_bloom()
+
+    def _purge_expired(self, now):
+        if now - self.last_purge < _PURGE_INTERVAL:
+            return
+        self.last_purge = now
+        removed = self.conn.execute("DELETE FROM notified WHERE expires_at <= ?", (now,)).rowcount
+        self.conn.execute("DELETE FROM pending WHERE expires_at <= ?", (now,))
+        self.conn.commit()
+        if removed:
+            self.stats["expired"] += removed
+            self._rebuild_bloom()
+
+    # ========== 对外接口 ==========
+
+    def filter_new(self, post_ids):
+        """返回 post_ids 中还没有通知过的 id 集合（一次扫描的批量检查）"""
+        post_ids = list(post_ids)
+        now = time_module.time()
+        with self.lock:
+            self._sync()
+            self.stats["checks"] += len(post_ids)
+            maybe = [post_id for post_id in post_ids if post_id in self.bloom]
+            self.stats["bloom_negatives"] += len(post_ids) - len(maybe)
+            found = set()
+            # 分批查询，避免超过 SQLite 参数个数上限
+            for start in range(0, len(maybe), 500):
+                chunk = maybe[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(row[0] for row in self.conn.execute(
+                    f"SELECT post_id FROM notified WHERE post_id IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, now),
+                ))
+            self.stats["db_lookups"] += len(maybe)
+            self.stats["bloom_false_positives"] += len(maybe) - len(found)
+        return {post_id for post_id in post_ids if post_id not in found}
+
+    def __contains__(self, post_id):
+        return not self.filter_new([post_id])
+
+    def _expires_at(self, created, now):
+        # 至少保留一小时，避免发布时间异常的帖子立即过期
+        return max((created or now) + self.ttl, now + 3600)
+
+    def add(self, posts):
+        """
+        标记为已通知（同时从待重发队列删除）。
+        posts: 帖子（按发布时间 + ttl 过期）或 id 字符串（按当前时间 + ttl 过期）
+        """
+        now = time_module.time()
+        rows = []
+        for post in posts:
+            if isinstance(post, str):
+                post_id, created = post, now
+            else:
+                post_id, created = post["id"], post.get("created")
+            rows.append((post_id, now, self._expires_at(created, now)))
+        if not rows:
+            return 0
+        with self.lock:
+            self.conn.executemany(
+                """
+                INSERT INTO notified (post_id, notified_at, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(post_id) DO UPDATE SET notified_at = excluded.notified_at, expires_at = excluded.expires_at
+                """,
+                rows,
+            )
+            self.conn.executemany("DELETE FROM pending WHERE post_id = ?", [(row[0],) for row in rows])
+            self.conn.commit()
+            for post_id, _, _ in rows:
+                self.bloom.add(post_id)
+            self.stats["added"] += len(rows)
+            self._purge_expired(now)
+            if self.bloom.count > self.bloom.capacity:
+                self._rebuild_bloom()
+        return len(rows)
+
+    def add_pending(self, posts):
+        """保存所有通知通道都失败的帖子，返回保存的帖子数"""
+        now = time_module.time()
+        rows = []
+        for post in posts:
+            data = post.to_dict() if hasattr(post, "to_dict") else dict(post)
+            rows.append((data["id"], json.dumps(data, ensure_ascii=False, default=str), now,
+                         self._expires_at(data.get("created"), now)))
+        if not rows:
+            return 0
+        with self.lock:
+            self.conn.executemany(
+                """
+                INSERT INTO pending (post_id, post, failures, failed_at, expires_at) VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT(post_id) DO UPDATE SET post = excluded.post, failures = failures + 1,
+                    failed_at = excluded.failed_at
+                """,
+                rows,
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def pending_posts(self):
+        """待重发的帖子（dict，按失败时间排序），已过期或已经通知过的不返回"""
+        now = time_module.time()
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT post FROM pending
+                WHERE expires_at > ? AND post_id NOT IN (SELECT post_id FROM notified WHERE expires_at > ?)
+                ORDER BY failed_at
+                """,
+                (now, now),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def clear(self):
+        """删除全部已通知记录（所有进程共享，待重发队列保留），返回删除的条目数"""
+        with self.lock:
+            removed = self.conn.execute("DELETE FROM notified").rowcount
+            self.conn.commit()
+            self._rebuild_bloom()
+        return removed
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM notified WHERE expires_at > ?", (time_module.time(),)
+            ).fetchone()[0]
+
+    def get_stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM notified").fetchone()[0]
+            pending = self.conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+            bloom = self.bloom
+            stats = {
+                "entries": entries,
+                "pending_redelivery": pending,
+                "ttl_seconds": self.ttl,
+                "bloom": {
+                    "capacity": bloom.capacity,
+                    "hashes": bloom.hashes,
+                    "memory_bytes": len(bloom.bits),
+                    "estimated_false_positive_rate": round(bloom.false_positive_rate(), 6),
+                },
+                **self.stats,
+            }
+        if self.path != ":memory:":
+            stats["db_bytes"] = sum(
+                os.path.getsize(path) for path in (self.path, f"{self.path}-wal") if os.path.exists(path)
+            )
+        return stats
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_dedup_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            warning = persistence_warning(DEDUP_STORE_PATH)
+            if warning:
+                print(f"[DEDUP] WARNING: {warning}; notified posts will be forgotten on redeploy and "
+                      f"re-notified. Set DEDUP_STORE_PATH to a file on a mounted volume.")
+            _STORE = DedupStore(DEDUP_STORE_PATH, DEDUP_TTL_SECONDS)
+            print(f"[DEDUP] Using {DEDUP_STORE_PATH}")
+        return _STORE
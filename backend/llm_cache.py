@@ -0,0 +1,307 @@
+"""
+LLM 分析结果本地缓存（默认开启，LLM_CACHE_ENABLED=false 关闭）
+定时扫描每 30 分钟重扫一遍最近一周的帖子，同一个帖子不需要重复付费分析。
+- key: 帖子内容（subreddit + title + text + budget）哈希 + LLM_MODEL + SYSTEM_PROMPT 哈希；
+  score / 评论数 / 新鲜度每轮都会变，不参与 key
+- 成功结果按 LLM_CACHE_TTL 保存；失败结果只保存 LLM_CACHE_FAILURE_TTL，避免反复请求出故障的服务
+- SQLite 持久化（重启后仍然有效），前面加一层内存 LRU，热数据命中不访问磁盘
+- 超过条目上限时按最近访问时间淘汰
+- 同时保存分析时的帖子内容快照，可用于离线训练 / 评估
+- labels 表: 每个成功的 LLM 结论另存一份（帖子快照、worth_taking、样本权重），不随缓存过期 / 淘汰，
+  只按 LLM_LABELS_MAX_ENTRIES 删除最旧的；本地分诊模型（triage_model）用它训练。
+  分诊模型直接判断的帖子只有抽查的一小部分会请求 LLM，样本权重（1 / 抽查比例）补偿这部分的采样偏差
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time as time_module
+from collections import OrderedDict
+
+from storage import data_path, persistence_warning
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+# 默认放在 Railway volume 下（挂载了的话），重新部署不会丢掉付费得到的分析结果和分诊模型的训练数据
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or data_path("llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 86400)))
+LLM_CACHE_FAILURE_TTL = int(os.getenv("LLM_CACHE_FAILURE_TTL", "300"))
+# 内存层条目数
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "500"))
+# 训练样本（labels 表）条目上限
+LLM_LABELS_MAX_ENTRIES = int(os.getenv("LLM_LABELS_MAX_ENTRIES", "50000"))
+
+
+def prompt_hash(system_prompt):
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def post_snapshot(post):
+    """参与 key 的帖子内容，与发给 LLM 的内容一致（正文只取前 800 字符）"""
+    return {
+        "subreddit": post.get("subreddit", ""),
+        "title": post.get("title", ""),
+        "text": (post.get("text") or "")[:800],
+        "budget": post.get("budget"),
+    }
+
+
+def analysis_key(snapshot, model, system_prompt_hash):
+    raw = json.dumps([model, system_prompt_hash, snapshot], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path, max_entries, memory_entries, max_labels=LLM_LABELS_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_labels = max_labels
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "failure_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                post_id TEXT,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                input TEXT NOT NULL,
+                result TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_access ON analyses (last_access)")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                input TEXT NOT NULL,
+                worth_taking INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_labels_created ON labels (created_at)")
+        # 旧版本只有 analyses 表：把还在缓存里的结论导入 labels
+        if self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0] == 0:
+            rows = self.conn.execute(
+                "SELECT key, model, input, result, created_at FROM analyses WHERE result IS NOT NULL"
+            ).fetchall()
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO labels (key, model, input, worth_taking, weight, created_at) "
+                "VALUES (?, ?, ?, ?, 1.0, ?)",
+                [(key, model, raw_input, int(bool(json.loads(raw_result).get("worth_taking", True))), created)
+                 for key, model, raw_input, raw_result, created in rows
+                 if isinstance(json.loads(raw_result), dict)],
+            )
+        self.conn.commit()
+
+    def _remember(self, key, expires_at, result):
+        self.memory[key] = (expires_at, result)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        返回 (是否命中, 结果)；命中失败缓存时结果为 None
+        """
+        now = time_module.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT expires_at, result FROM analyses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]) if row[1] is not None else None)
+                    # 只在从磁盘读出时更新访问时间，内存命中不写盘
+                    self.conn.execute("UPDATE analyses SET last_access = ? WHERE key = ?", (now, key))
+                    self.conn.commit()
+                    self._remember(key, *entry)
+            else:
+                self.memory.move_to_end(key)
+
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            expires_at, result = entry
+            if expires_at <= now:
+                self.memory.pop(key, None)
+                self.conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+                self.conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return False, None
+            self.stats["hits" if result is not None else "failure_hits"] += 1
+            return True, result
+
+    def put(self, key, post_id, model, system_prompt_hash, snapshot, result, ttl, weight=1.0):
+        if ttl <= 0:
+            return
+        now = time_module.time()
+        body = json.dumps(result, ensure_ascii=False) if result is not None else None
+        raw_input = json.dumps(snapshot, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(key, post_id, model, prompt_hash, input, result, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, post_id, model, system_prompt_hash, raw_input, body, now, now + ttl, now),
+            )
+            if isinstance(result, dict):
+                self._put_label(key, model, raw_input, result, weight, now)
+            self.stats["stores"] += 1
+            count = self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                # LRU：淘汰最久没被访问的条目（内存层里的旧条目过期或被挤出后自然失效）
+                evicted = self.conn.execute(
+                    "SELECT key FROM analyses ORDER BY last_access ASC LIMIT ?", (overflow,)
+                ).fetchall()
+                self.conn.executemany("DELETE FROM analyses WHERE key = ?", evicted)
+                for (old_key,) in evicted:
+                    self.memory.pop(old_key, None)
+                self.stats["evictions"] += overflow
+            self.conn.commit()
+            self._remember(key, now + ttl, result)
+
+    def _put_label(self, key, model, raw_input, result, weight, now):
+        """在 self.lock 内调用"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO labels (key, model, input, worth_taking, weight, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, raw_input, int(bool(result.get("worth_taking", True))), weight, now),
+        )
+        overflow = self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0] - self.max_labels
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM labels WHERE key IN (SELECT key FROM labels ORDER BY created_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def iter_labels(self, model=None):
+        """遍历训练样本 (input, worth_taking, weight)"""
+        query = "SELECT input, worth_taking, weight FROM labels"
+        params = ()
+        if model:
+            query += " WHERE model = ?"
+            params = (model,)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for raw_input, worth_taking, weight in rows:
+            yield json.loads(raw_input), bool(worth_taking), weight
+
+    def iter_entries(self, model=None):
+        """遍历成功的分析结果 (input, result)，用于离线训练 / 评估"""
+        query = "SELECT input, result FROM analyses WHERE result IS NOT NULL"
+        params = ()
+        if model:
+            query += " AND model = ?"
+            params = (model,)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for raw_input, raw_result in rows:
+            yield json.loads(raw_input), json.loads(raw_result)
+
+    def clear(self):
+        with self.lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            self.conn.execute("DELETE FROM analyses")
+            self.conn.commit()
+            self.memory.clear()
+            return count
+
+    def get_stats(self):
+        with self.lock:
+            entries, failures = self.conn.execute(
+                "SELECT COUNT(*), SUM(result IS NULL) FROM analyses"
+            ).fetchone()
+            labels = self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["failure_hits"] + stats["misses"]
+        stats["entries"] = entries
+        stats["failure_entries"] = failures or 0
+        stats["training_labels"] = labels
+        stats["memory_entries"] = len(self.memory)
+        stats["hit_rate"] = round((stats["hits"] + stats["failure_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _get_cache():
+    global _CACHE
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            warning = persistence_warning(LLM_CACHE_PATH)
+            if warning:
+                print(f"[LLM] WARNING: {warning}; cached analyses (and the triage training data) will be "
+                      f"lost on redeploy. Set LLM_CACHE_PATH to a file on a mounted volume.")
+            _CACHE = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MEMORY_ENTRIES)
+        return _CACHE
+
+
+def get_cached_analysis(post, model, system_prompt):
+    """
+    返回 (是否命中, 结果)。命中失败缓存时结果为 None，调用方应跳过该帖子而不是重新请求
+    """
+    cache = _get_cache()
+    if cache is None:
+        return False, None
+    return cache.get(analysis_key(post_snapshot(post), model, prompt_hash(system_prompt)))
+
+
+def store_analysis(post, model, system_prompt, result, weight=1.0):
+    """
+    result 为 None 表示分析失败，按 LLM_CACHE_FAILURE_TTL 短暂缓存
+    weight: 成功结果作为训练样本的权重（分诊模型抽查的帖子为 1 / 抽查比例）
+    """
+    cache = _get_cache()
+    if cache is None:
+        return
+    snapshot = post_snapshot(post)
+    digest = prompt_hash(system_prompt)
+    ttl = LLM_CACHE_TTL if result is not None else LLM_CACHE_FAILURE_TTL
+    cache.put(analysis_key(snapshot, model, digest), post.get("id"), model, digest, snapshot, result, ttl, weight)
+
+
+def iter_training_labels(model=None):
+    cache = _get_cache()
+    if cache is None:
+        return iter(())
+    return cache.iter_labels(model)
+
+
+def iter_cached_analyses(model=None):
+    cache = _get_cache()
+    if cache is None:
+        return iter(())
+    return cache.iter_entries(model)
+
+
+def get_llm_cache_stats():
+    cache = _get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+def clear_llm_cache():
+    cache = _get_cache()
+    if cache is None:
+        return 0
+    return cache.clear()
@@ -5,16 +5,40 @@ LLM 二次分类器
 """
 import os
 import json
+import threading
+import time as time_module
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import llm_endpoints
+from llm_cache import get_cached_analysis, store_analysis
+from llm_endpoints import LLM_ENDPOINTS, get_endpoint_pool
+from llm_governor import LLM_TOKENS_PER_POST_ESTIMATE, get_governor
+from rules import get_rules
+from triage_model import get_triage_model
 
 load_dotenv()
 
 # 支持 OpenAI 兼容的 API（OpenAI、DeepSeek、Groq、本地 Ollama 等）
+# 配置多个服务做故障转移 / 对冲请求见 llm_endpoints.py（LLM_ENDPOINTS）；
+# LLM_MODEL 同时是 LLM 缓存的命名空间，不管哪个服务返回的结果都按它缓存
 LLM_API_URL = os.getenv("LLM_API_URL", "https://api.openai.com/v1/chat/completions")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 
+# 并发分析：同时进行的 LLM 请求数、单个请求超时、整批分析的总时限（秒）
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "3"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "45"))
+# 批量分析：一个请求里放几个帖子（SYSTEM_PROMPT 只发一次），1 表示逐个分析
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
 SYSTEM_PROMPT = """You are a freelance project analyst. You help a developer decide whether to take on Reddit freelance tasks.
 
 The developer's skills are:
@@ -49,16 +73,29 @@ Rules:
 """
 
 
-def analyze_task_with_llm(post):
-    """
-    用 LLM 分析单个 TASK 帖子
-    返回分析结果 dict，失败返回 None
-    """
-    if not LLM_API_KEY:
-        print("[LLM] API key not configured, skipping LLM analysis")
-        return None
+def get_llm_session():
+    """所有 LLM 请求共用一个 Session，复用 keep-alive 连接（每个服务一个连接池）"""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            endpoints = len(get_endpoint_pool(_default_endpoint()).endpoints)
+            adapter = HTTPAdapter(pool_connections=max(1, endpoints), pool_maxsize=max(1, LLM_CONCURRENCY))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+        return _SESSION
 
-    user_message = f"""Reddit Post from r/{post.get('subreddit', 'unknown')}:
+
+BATCH_INSTRUCTIONS = """
+You will receive several task posts in one message, each starting with "Post id: <id>".
+Analyze every post independently and respond with a JSON array ONLY, one object per post,
+each object containing "id" (the post id, as given) plus all the fields described above.
+"""
+
+
+def _format_post(post):
+    return f"""Reddit Post from r/{post.get('subreddit', 'unknown')}:
 
 Title: {post['title']}
 
@@ -68,35 +105,127 @@ Post score: {post.get('score', 0)} | Comments: {post.get('num_comments', 0)}
 Budget mentioned: ${post.get('budget', 'Not specified')}
 Freshness: {post.get('freshness_label', 'Unknown')}"""
 
-    headers = {
-        "Authorization": f"Bearer {LLM_API_KEY}",
-        "Content-Type": "application/json",
-    }
+
+def _default_endpoint():
+    """没有设置 LLM_ENDPOINTS 时使用的单个服务"""
+    return {"name": "default", "url": LLM_API_URL, "api_key": LLM_API_KEY, "model": LLM_MODEL, "timeout": LLM_TIMEOUT}
+
+
+def llm_configured():
+    """是否可以请求 LLM：设置了 LLM_ENDPOINTS，或者设置了 LLM_API_KEY"""
+    return bool(LLM_ENDPOINTS or LLM_API_KEY)
+
+
+def override_llm(url=None, api_key="mock"):
+    """
+    测试 / 基准测试用：只请求 url 这一个服务（例如 mock_llm_server），url 为 None 时完全不请求 LLM。
+    同时清空 LLM_ENDPOINTS，否则 .env 里配置的服务会覆盖 LLM_API_URL / LLM_API_KEY，产生真实费用。
+    返回 restore()，调用后恢复原来的配置
+    """
+    global LLM_API_URL, LLM_API_KEY, LLM_ENDPOINTS
+    saved = (LLM_API_URL, LLM_API_KEY, LLM_ENDPOINTS, llm_endpoints.LLM_ENDPOINTS)
+    LLM_ENDPOINTS = llm_endpoints.LLM_ENDPOINTS = ""
+    if url is None:
+        LLM_API_KEY = ""
+    else:
+        LLM_API_URL, LLM_API_KEY = url, api_key
+
+    def restore():
+        global LLM_API_URL, LLM_API_KEY, LLM_ENDPOINTS
+        LLM_API_URL, LLM_API_KEY, LLM_ENDPOINTS, llm_endpoints.LLM_ENDPOINTS = saved
+
+    return restore
+
+
+def get_endpoint_stats():
+    return get_endpoint_pool(_default_endpoint()).get_stats()
+
+
+def _chat_completion(system_prompt, user_message, max_tokens, timeout, posts=1):
+    """
+    发送一次 chat completion（按 LLM_ENDPOINTS 故障转移 / 对冲），返回去掉 markdown 包裹后的文本内容
+    请求失败抛出 requests.RequestException，返回格式不对抛出 KeyError / IndexError
+    timeout: 总时限，每个服务的单次请求还受它自己的 timeout 限制
+    posts: 请求里的帖子数，对冲 / 故障转移的请求按它向 governor 预留额度（第一个请求由调用方预留）
+    """
+    pool = get_endpoint_pool(_default_endpoint())
+    governor = get_governor()
+    return pool.complete(
+        lambda endpoint, attempt_timeout: _post_completion(
+            endpoint, system_prompt, user_message, max_tokens, attempt_timeout
+        ),
+        timeout,
+        reserve=lambda reason: governor.try_acquire(posts, reason=reason),
+        release=governor.release,
+    )
+
+
+def _post_completion(endpoint, system_prompt, user_message, max_tokens, timeout):
+    """向一个服务发送请求"""
+    headers = {"Content-Type": "application/json"}
+    if endpoint.api_key:
+        headers["Authorization"] = f"Bearer {endpoint.api_key}"
 
     payload = {
-        "model": LLM_MODEL,
+        "model": endpoint.model,
         "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message},
         ],
         "temperature": 0.3,
-        "max_tokens": 500,
+        "max_tokens": max_tokens,
     }
 
     try:
-        resp = requests.post(LLM_API_URL, headers=headers, json=payload, timeout=30)
-        resp.raise_for_status()
+        resp = get_llm_session().post(endpoint.url, headers=headers, json=payload, timeout=timeout)
+    except requests.RequestException:
+        # 没拿到响应也算一次请求（计入请求数额度）
+        get_governor().record(0)
+        raise
+    try:
         data = resp.json()
+    except ValueError:
+        data = {}
+    usage = data.get("usage") if isinstance(data, dict) else None
+    # 没有 usage 字段的成功响应按估算值记账，失败响应不计 token
+    if usage:
+        tokens = _usage_tokens(usage)
+    else:
+        tokens = LLM_TOKENS_PER_POST_ESTIMATE if resp.ok else 0
+    get_governor().record(tokens)
+    resp.raise_for_status()
 
-        content = data["choices"][0]["message"]["content"].strip()
+    content = data["choices"][0]["message"]["content"].strip()
 
-        # 清理可能的 markdown 包裹
-        if content.startswith("```"):
-            content = content.split("\n", 1)[1] if "\n" in content else content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
+    # 清理可能的 markdown 包裹
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        content = content.strip()
+    return content
 
+
+def _usage_tokens(usage):
+    """OpenAI 兼容的 usage 字段：优先 total_tokens，否则 prompt + completion"""
+    total = usage.get("total_tokens")
+    if isinstance(total, int):
+        return total
+    return int(usage.get("prompt_tokens") or 0) + int(usage.get("completion_tokens") or 0)
+
+
+def analyze_task_with_llm(post, timeout=None):
+    """
+    用 LLM 分析单个 TASK 帖子
+    返回分析结果 dict，失败返回 None
+    """
+    if not llm_configured():
+        print("[LLM] API key not configured, skipping LLM analysis")
+        return None
+
+    content = ""
+    try:
+        content = _chat_completion(SYSTEM_PROMPT, _format_post(post), 500, timeout)
         result = json.loads(content)
         print(f"[LLM] Analysis complete for: {post['title'][:50]}...")
         return result
@@ -113,15 +242,98 @@ Freshness: {post.get('freshness_label', 'Unknown')}"""
         return None
 
 
-def enrich_tasks_with_llm(posts, max_analyze=5):
+# 批量分析中因为额度不足没有请求 LLM 的帖子（不是分析失败，不写入失败缓存）
+_SKIPPED = object()
+
+
+def _valid_analysis(result):
+    return isinstance(result, dict) and isinstance(result.get("worth_taking"), bool)
+
+
+def analyze_tasks_batch_with_llm(posts, timeout=None):
+    """
+    一个请求分析多个帖子，返回与 posts 顺序一致的结果列表（失败为 None）
+    批量结果中缺失或格式不对的帖子单独走 analyze_task_with_llm
+    """
+    return [None if result is _SKIPPED else result for result in _analyze_batch(posts, timeout)]
+
+
+def _analyze_batch(posts, timeout):
+    """analyze_tasks_batch_with_llm 的实现，额度不足没有补救的帖子返回 _SKIPPED"""
+    if not llm_configured():
+        print("[LLM] API key not configured, skipping LLM analysis")
+        return [None] * len(posts)
+    if len(posts) == 1:
+        return [analyze_task_with_llm(posts[0], timeout)]
+
+    by_id = {}
+    user_message = "\n\n---\n\n".join(f"Post id: {post['id']}\n{_format_post(post)}" for post in posts)
+    content = ""
+    try:
+        content = _chat_completion(SYSTEM_PROMPT + BATCH_INSTRUCTIONS, user_message, 500 * len(posts), timeout,
+                                   posts=len(posts))
+        entries = json.loads(content)
+        # 有的模型会包一层 {"analyses": [...]} 或 {"results": [...]}
+        if isinstance(entries, dict):
+            entries = next((v for v in entries.values() if isinstance(v, list)), [])
+        if not isinstance(entries, list):
+            entries = []
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get("id") is not None:
+                by_id[str(entry["id"])] = entry
+    except json.JSONDecodeError as e:
+        print(f"[LLM] Failed to parse batch JSON response: {e}")
+        print(f"[LLM] Raw response: {content[:200]}")
+    except requests.RequestException as e:
+        print(f"[LLM] Batch request failed: {e}")
+    except (KeyError, IndexError) as e:
+        print(f"[LLM] Unexpected batch response format: {e}")
+
+    results = []
+    fallback = 0
+    for post in posts:
+        entry = by_id.get(str(post["id"]))
+        if _valid_analysis(entry):
+            result = {key: value for key, value in entry.items() if key != "id"}
+        else:
+            # 逐个补救：批量结果里没有这个帖子或结果不完整，同样需要额度
+            ticket = get_governor().try_acquire(1)
+            if ticket is None:
+                result = _SKIPPED
+            else:
+                fallback += 1
+                try:
+                    result = analyze_task_with_llm(post, timeout)
+                finally:
+                    get_governor().release(ticket)
+        results.append(result)
+    print(f"[LLM] Batch of {len(posts)} analyzed, {fallback} fell back to single-post requests")
+    return results
+
+
+def enrich_tasks_with_llm(posts, max_analyze=5, concurrency=None, deadline=None, batch_size=None, on_result=None):
     """
     对帖子列表中的 skill_match 和 maybe_match 帖子进行 LLM 分析
     - max_analyze: 最多分析几个帖子（控制 API 费用）
     - 只分析最新的、最相关的帖子
+    - concurrency: 同时进行的请求数，默认 LLM_CONCURRENCY
+    - deadline: 整批分析的总时限（秒），默认 LLM_DEADLINE_SECONDS；超时还没返回的帖子不做 LLM 分析
+    - 命中 LLM 缓存的帖子直接使用缓存结果，不占用 max_analyze 名额；命中失败缓存的帖子跳过
+    - batch_size: 每个请求分析几个帖子，默认 LLM_BATCH_SIZE
+    - 有本地分诊模型（triage_model）时，缓存未命中的帖子先由模型打分写入 triage，
+      模型有把握的帖子直接采用本地结论，同样不占用 max_analyze 名额，只有拿不准的才请求 LLM
+    - on_result: 每个帖子写入 llm_analysis / 本地结论后立即调用 on_result(post)（后台任务用它逐个推送结果）
     """
-    if not LLM_API_KEY:
+    if not llm_configured():
         print("[LLM] No API key, returning posts without LLM enrichment")
         return posts
+    if concurrency is None:
+        concurrency = LLM_CONCURRENCY
+    if deadline is None:
+        deadline = LLM_DEADLINE_SECONDS
+    if batch_size is None:
+        batch_size = LLM_BATCH_SIZE
+    batch_size = max(1, batch_size)
 
     # 筛选需要分析的帖子
     to_analyze = [
@@ -129,26 +341,135 @@ def enrich_tasks_with_llm(posts, max_analyze=5):
         if p.get("task_category") in ("skill_match", "maybe_match")
     ]
 
-    # 优先分析 skill_match，然后 maybe_match，都按新鲜度排序
-    to_analyze.sort(key=lambda x: (
-        0 if x.get("task_category") == "skill_match" else 1,
-        x.get("freshness_minutes", 9999),
-    ))
+    # 优先队列：skill_match 优先，然后 skill_score、预算、新鲜度（见 llm_governor.analysis_priority）
+    governor = get_governor()
+    candidates = governor.queue(to_analyze)
+    triage = get_triage_model()
+    rules = get_rules() if triage is not None else None
 
+    started = time_module.monotonic()
     analyzed_count = 0
-    for post in to_analyze:
-        if analyzed_count >= max_analyze:
-            break
+    cached_count = 0
+    triaged_count = 0
+    # {future: 这个请求里的帖子列表}
+    pending = {}
+    in_flight = 0
+    exhausted = False
+    over_budget = False
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        while True:
+            # 按优先级补充请求：进行中的 + 已成功的 不超过 max_analyze，失败的由下一个候选补上
+            while not exhausted and len(pending) < concurrency and analyzed_count + in_flight < max_analyze:
+                group = []
+                while len(group) < min(batch_size, max_analyze - analyzed_count - in_flight):
+                    post = candidates.pop()
+                    if post is None:
+                        exhausted = True
+                        break
+                    hit, cached = get_cached_analysis(post, LLM_MODEL, SYSTEM_PROMPT)
+                    if hit:
+                        if cached:
+                            _apply_analysis(post, cached)
+                            cached_count += 1
+                            if on_result:
+                                on_result(post)
+                        continue
+                    if triage is not None:
+                        verdict = triage.triage(post, rules)
+                        post["triage"] = verdict
+                        if verdict["decided"]:
+                            _apply_triage(post, verdict)
+                            triaged_count += 1
+                            if on_result:
+                                on_result(post)
+                            continue
+                    group.append(post)
+                if not group:
+                    break
+                # 额度不够就停止：队列按优先级出队，已经发出的是最好的那些
+                ticket = governor.try_acquire(len(group))
+                if ticket is None:
+                    over_budget = exhausted = True
+                    break
+                remaining = deadline - (time_module.monotonic() - started)
+                timeout = max(1.0, remaining)
+                pending[pool.submit(_analyze_and_cache, group, timeout, ticket)] = group
+                in_flight += len(group)
+            if not pending:
+                break
 
-        result = analyze_task_with_llm(post)
-        if result:
-            post["llm_analysis"] = result
-            analyzed_count += 1
+            remaining = deadline - (time_module.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
 
-            # 如果 LLM 说不值得接，降级分类
-            if not result.get("worth_taking", True):
-                post["task_category"] = "irrelevant"
-                post["llm_rejected"] = True
+            # 结果只在当前线程写回帖子，超时后才返回的请求不会再修改帖子
+            for future in done:
+                group = pending.pop(future)
+                in_flight -= len(group)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"[LLM] Analysis failed: {e}")
+                    results = [None] * len(group)
+                for post, result in zip(group, results):
+                    if result:
+                        _apply_analysis(post, result)
+                        analyzed_count += 1
+                        if on_result:
+                            on_result(post)
+    finally:
+        # 不等待超时的请求，它们在后台自行结束
+        pool.shutdown(wait=False, cancel_futures=True)
+        candidates.close()
 
-    print(f"[LLM] Analyzed {analyzed_count} posts")
+    if over_budget:
+        print("[LLM] Budget exhausted, remaining posts left without LLM analysis")
+    if pending:
+        print(f"[LLM] Deadline of {deadline:.0f}s reached, {in_flight} posts left without LLM analysis")
+    print(f"[LLM] Analyzed {analyzed_count} posts ({cached_count} more from cache, "
+          f"{triaged_count} decided by the local triage model)")
     return posts
+
+
+def _analyze_and_cache(group, timeout, ticket=None):
+    """
+    在工作线程中执行：请求 LLM 并写入缓存（超过总时限才返回的结果也会缓存，下一轮可以直接用）
+    返回与 group 顺序一致的结果列表
+    只有服务返回错误 / 无法解析的帖子写入失败缓存；额度不足没有请求的帖子不缓存，额度恢复后可以马上重新分析
+    """
+    try:
+        if len(group) == 1:
+            results = [analyze_task_with_llm(group[0], timeout)]
+        else:
+            results = _analyze_batch(group, timeout)
+    except Exception:
+        for post in group:
+            store_analysis(post, LLM_MODEL, SYSTEM_PROMPT, None)
+        raise
+    finally:
+        get_governor().release(ticket)
+    for post, result in zip(group, results):
+        if result is not _SKIPPED:
+            # 分诊模型抽查的帖子代表整段被直接判断的帖子，训练时按 1 / 抽查比例加权
+            weight = (post.get("triage") or {}).get("weight", 1.0)
+            store_analysis(post, LLM_MODEL, SYSTEM_PROMPT, result, weight)
+    return [None if result is _SKIPPED else result for result in results]
+
+
+def _apply_triage(post, verdict):
+    """本地模型有把握判为不值得接时，和 LLM 否决一样降级分类（不设置 llm_rejected）"""
+    if not verdict["worth_taking"]:
+        post["task_category"] = "irrelevant"
+
+
+def _apply_analysis(post, result):
+    post["llm_analysis"] = result
+
+    # 如果 LLM 说不值得接，降级分类
+    if not result.get("worth_taking", True):
+        post["task_category"] = "irrelevant"
+        post["llm_rejected"] = True
@@ -0,0 +1,340 @@
+"""
+多个 OpenAI 兼容 LLM 服务的故障转移和对冲请求
+- LLM_ENDPOINTS: JSON 列表，按优先级排列，每项:
+    {"name": "deepseek", "url": ".../chat/completions", "model": "deepseek-chat",
+     "api_key_env": "DEEPSEEK_API_KEY", "timeout": 20}
+  api_key 可以直接写 "api_key"，也可以用 "api_key_env" 指定环境变量名；本地 Ollama 不需要 key。
+  不设置时只使用 LLM_API_URL / LLM_API_KEY / LLM_MODEL / LLM_TIMEOUT 这一个服务（与原来相同）。
+  导入时解析一次，格式错误立即抛出 EndpointConfigError（服务启动失败），不会等到 LLM 请求时才报错
+- 对冲: 首选服务超过它最近成功延迟的 LLM_HEDGE_PERCENTILE 分位还没返回，就向下一个服务再发一次，
+  用先返回的结果（样本不足时等 LLM_HEDGE_DELAY 秒）；请求失败则立即转到下一个服务
+- 熔断: 连续失败 LLM_BREAKER_FAILURES 次后跳过该服务 LLM_BREAKER_COOLDOWN 秒，
+  之后放一个探测请求，成功则恢复
+- 健康分: 成功率的指数移动平均，低于 LLM_MIN_HEALTH 的服务排到最后
+- 额度: 对冲和故障转移的请求同样计费，发出前通过 reserve 向 llm_governor 预留额度，
+  额度不够时不再对冲 / 转移（只等已经发出的请求）
+"""
+import json
+import os
+import threading
+import time as time_module
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from urllib.parse import urlparse
+
+import requests
+
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+LLM_MIN_HEALTH = float(os.getenv("LLM_MIN_HEALTH", "0.5"))
+
+# 对冲分位数至少需要这么多个成功样本
+_MIN_LATENCY_SAMPLES = 10
+_HEALTH_ALPHA = 0.2
+
+
+class EndpointConfigError(ValueError):
+    """LLM_ENDPOINTS 配置错误"""
+
+
+def parse_endpoints(raw):
+    """解析 LLM_ENDPOINTS，格式错误抛出 EndpointConfigError"""
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        raise EndpointConfigError(f"LLM_ENDPOINTS is not valid JSON: {e}") from None
+    if not isinstance(entries, list) or not entries:
+        raise EndpointConfigError("LLM_ENDPOINTS must be a non-empty JSON list")
+    specs = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("url") or not entry.get("model"):
+            raise EndpointConfigError(f"LLM_ENDPOINTS[{index}] needs at least url and model")
+        try:
+            timeout = float(entry.get("timeout", 30))
+        except (TypeError, ValueError):
+            raise EndpointConfigError(f"LLM_ENDPOINTS[{index}].timeout must be a number") from None
+        api_key = entry.get("api_key") or (os.getenv(entry["api_key_env"], "") if entry.get("api_key_env") else "")
+        if entry.get("api_key_env") and not api_key:
+            print(f"[LLM] Warning: {entry['api_key_env']} (LLM_ENDPOINTS[{index}]) is not set")
+        specs.append({
+            "name": entry.get("name") or urlparse(entry["url"]).hostname or f"endpoint{index}",
+            "url": entry["url"],
+            "api_key": api_key,
+            "model": entry["model"],
+            "timeout": timeout,
+        })
+    return specs
+
+
+_SPECS = {"raw": None, "specs": None}
+
+
+def endpoint_specs():
+    """LLM_ENDPOINTS 的解析结果（没有设置时为 None），只在值变化时重新解析"""
+    if _SPECS["raw"] != LLM_ENDPOINTS:
+        _SPECS["specs"] = parse_endpoints(LLM_ENDPOINTS) if LLM_ENDPOINTS else None
+        _SPECS["raw"] = LLM_ENDPOINTS
+    return _SPECS["specs"]
+
+
+# 启动时校验配置
+endpoint_specs()
+
+
+class Endpoint:
+    def __init__(self, name, url, api_key, model, timeout, breaker=True):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=100)
+        self.health = 1.0
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.probing = False
+        self.stats = {"requests": 0, "failures": 0, "wins": 0, "breaker_trips": 0}
+
+    def state(self, now=None):
+        now = time_module.monotonic() if now is None else now
+        if self.open_until is None:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def try_enter(self):
+        """熔断中返回 False；冷却结束后只放行一个探测请求"""
+        with self.lock:
+            state = self.state()
+            if state == "open" or (state == "half_open" and self.probing):
+                return False
+            if state == "half_open":
+                self.probing = True
+            self.stats["requests"] += 1
+            return True
+
+    def record_success(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.health += _HEALTH_ALPHA * (1.0 - self.health)
+            self.consecutive_failures = 0
+            self.open_until = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.stats["failures"] += 1
+            self.health -= _HEALTH_ALPHA * self.health
+            self.consecutive_failures += 1
+            self.probing = False
+            if self.breaker and self.consecutive_failures >= LLM_BREAKER_FAILURES:
+                if self.open_until is None:
+                    self.stats["breaker_trips"] += 1
+                    print(f"[LLM] Endpoint {self.name} failed {self.consecutive_failures} times, "
+                          f"skipping it for {LLM_BREAKER_COOLDOWN:.0f}s")
+                self.open_until = time_module.monotonic() + LLM_BREAKER_COOLDOWN
+
+    def _percentile(self, fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def hedge_delay(self):
+        """多久没返回就向下一个服务发对冲请求"""
+        with self.lock:
+            if len(self.latencies) < _MIN_LATENCY_SAMPLES:
+                return LLM_HEDGE_DELAY
+            return max(0.05, self._percentile(LLM_HEDGE_PERCENTILE))
+
+    def get_stats(self):
+        with self.lock:
+            latency = {
+                name: round(self._percentile(fraction) * 1000, 1) if self.latencies else None
+                for name, fraction in (("p50", 0.5), ("p95", 0.95))
+            }
+            return {
+                "name": self.name,
+                "host": urlparse(self.url).hostname,
+                "model": self.model,
+                "state": self.state(),
+                "health": round(self.health, 3),
+                "latency_ms": latency,
+                **self.stats,
+            }
+
+
+class EndpointPool:
+    def __init__(self, specs):
+        self.endpoints = [Endpoint(**spec) for spec in specs]
+        self.lock = threading.Lock()
+        self.stats = {"hedged": 0, "failovers": 0, "secondary_wins": 0, "budget_denied": 0}
+
+    def candidates(self):
+        """按优先级排列，熔断中的跳过，健康分低的放到最后"""
+        now = time_module.monotonic()
+        available = [e for e in self.endpoints if e.state(now) != "open"]
+        return sorted(available, key=lambda e: e.health < LLM_MIN_HEALTH)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _attempt(self, endpoint, send, timeout):
+        started = time_module.monotonic()
+        try:
+            result = send(endpoint, timeout)
+        except Exception:
+            endpoint.record_failure()
+            raise
+        endpoint.record_success(time_module.monotonic() - started)
+        return result
+
+    def _start(self, endpoint, send, attempt_timeout):
+        """
+        每个请求一个线程，调用方线程只负责等待：卡住的请求会占住线程直到 endpoint.timeout，
+        共用线程池的话之后的对冲请求会排在它们后面，对冲就失去了意义
+        attempt_timeout(endpoint) 在线程开始时才计算，总时限按实际发出的时间算
+        """
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._attempt(endpoint, send, attempt_timeout(endpoint)))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"llm-endpoint-{endpoint.name}", daemon=True).start()
+        return future
+
+    def complete(self, send, timeout=None, reserve=None, release=None):
+        """
+        send(endpoint, timeout) 发送一次请求并返回结果，失败抛异常
+        timeout: 整个调用（包括对冲和故障转移）的总时限，每次请求还受 endpoint.timeout 限制
+        reserve(reason) / release(ticket): 第一个请求的额度由调用方预留；对冲（reason="hedged"）和
+        故障转移（reason="failovers"）的请求发出前调用 reserve，返回 None 表示额度不足，不发这个请求
+        """
+        candidates = self.candidates()
+        started = time_module.monotonic()
+
+        def remaining():
+            return None if timeout is None else timeout - (time_module.monotonic() - started)
+
+        def attempt_timeout(endpoint):
+            left = remaining()
+            return endpoint.timeout if left is None else max(0.1, min(endpoint.timeout, left))
+
+        # 只有一个服务时直接在当前线程请求
+        if len(self.endpoints) == 1:
+            endpoint = self.endpoints[0]
+            if not endpoint.try_enter():
+                raise requests.ConnectionError(f"LLM endpoint {endpoint.name} is unavailable (circuit open)")
+            return self._attempt(endpoint, send, attempt_timeout(endpoint))
+
+        pending = {}
+        # 额度不足后不再发起对冲
+        budget = {"denied": False}
+
+        def launch(reason=None):
+            if not candidates:
+                return None
+            ticket = None
+            if reason is not None and reserve is not None:
+                ticket = reserve(reason)
+                if ticket is None:
+                    budget["denied"] = True
+                    self._count("budget_denied")
+                    return None
+            while candidates:
+                endpoint = candidates.pop(0)
+                if endpoint.try_enter():
+                    future = self._start(endpoint, send, attempt_timeout)
+                    if ticket is not None and release is not None:
+                        future.add_done_callback(lambda _, ticket=ticket: release(ticket))
+                    pending[future] = endpoint
+                    return endpoint
+            if ticket is not None and release is not None:
+                release(ticket)
+            return None
+
+        primary = launch()
+        if primary is None:
+            raise requests.ConnectionError("all LLM endpoints are unavailable (circuit open)")
+        hedge_at = time_module.monotonic() + primary.hedge_delay()
+
+        last_error = None
+        while pending:
+            left = remaining()
+            if left is not None and left <= 0:
+                break
+            wait_for = left
+            hedging = candidates and not budget["denied"]
+            if hedging:
+                until_hedge = max(0.0, hedge_at - time_module.monotonic())
+                wait_for = until_hedge if wait_for is None else min(wait_for, until_hedge)
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 到了对冲时间，向下一个服务再发一次
+                if hedging and time_module.monotonic() >= hedge_at:
+                    hedge = launch("hedged")
+                    if hedge is not None:
+                        self._count("hedged")
+                        hedge_at = time_module.monotonic() + hedge.hedge_delay()
+                continue
+
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    print(f"[LLM] Endpoint {endpoint.name} failed: {e}")
+                    continue
+                with endpoint.lock:
+                    endpoint.stats["wins"] += 1
+                if endpoint is not primary:
+                    self._count("secondary_wins")
+                # 慢的请求在后台自行结束，结果丢弃（延迟仍会计入统计）
+                return result
+            # 全部失败：立即转到下一个服务（额度不足时放弃）
+            if not pending:
+                fallback = launch("failovers")
+                if fallback is not None:
+                    self._count("failovers")
+                    hedge_at = time_module.monotonic() + fallback.hedge_delay()
+
+        if last_error is not None and not pending:
+            raise last_error
+        raise requests.Timeout(f"no LLM endpoint answered within {timeout:.1f}s")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return {**stats, "endpoints": [endpoint.get_stats() for endpoint in self.endpoints]}
+
+
+_POOL = {"key": None, "pool": None}
+_POOL_LOCK = threading.Lock()
+
+
+def get_endpoint_pool(default):
+    """
+    返回当前的 EndpointPool
+    default: 没有设置 LLM_ENDPOINTS 时使用的单个服务 {"name", "url", "api_key", "model", "timeout"}；
+    内容变化时（如测试中修改 LLM_API_URL）重新创建
+    """
+    key = LLM_ENDPOINTS or json.dumps(default, sort_keys=True)
+    with _POOL_LOCK:
+        if _POOL["key"] != key:
+            specs = endpoint_specs() or [default]
+            # 只有一个服务时不熔断（跳过它就没有服务可用了），不管是默认服务还是 LLM_ENDPOINTS 里只配了一个
+            if len(specs) == 1:
+                specs = [{**specs[0], "breaker": False}]
+            _POOL["pool"] = EndpointPool(specs)
+            _POOL["key"] = key
+        return _POOL["pool"]
@@ -0,0 +1,173 @@
+"""
+LLM 花费 / 吞吐控制
+- 按小时、按天限制请求数和 token 数（0 表示不限制），token 数取自响应中的 usage 字段
+- 发请求前先按估算值预留额度，请求结束后释放预留、记录实际用量，并发请求不会一起超额
+- 待分析的帖子进入优先队列：skill_match 优先，然后 skill_score 高、预算高、越新越靠前；
+  额度不够时先花在最好的帖子上
+- 实时统计：窗口内用量、预留中的额度、排队数、因额度不足跳过的次数、
+  对冲 / 故障转移额外发出（和因额度不足没有发出）的请求数
+"""
+import os
+import threading
+import time as time_module
+from collections import deque
+
+from ranking import RankedView
+
+LLM_BUDGET_REQUESTS_PER_HOUR = int(os.getenv("LLM_BUDGET_REQUESTS_PER_HOUR", "0"))
+LLM_BUDGET_REQUESTS_PER_DAY = int(os.getenv("LLM_BUDGET_REQUESTS_PER_DAY", "0"))
+LLM_BUDGET_TOKENS_PER_HOUR = int(os.getenv("LLM_BUDGET_TOKENS_PER_HOUR", "0"))
+LLM_BUDGET_TOKENS_PER_DAY = int(os.getenv("LLM_BUDGET_TOKENS_PER_DAY", "0"))
+# 预留额度时每个帖子的 token 估算值（system prompt + 帖子 + 回复）
+LLM_TOKENS_PER_POST_ESTIMATE = int(os.getenv("LLM_TOKENS_PER_POST_ESTIMATE", "1000"))
+# 可选：每 1000 token 的价格（美元），只用于统计显示
+LLM_COST_PER_1K_TOKENS = float(os.getenv("LLM_COST_PER_1K_TOKENS", "0"))
+
+WINDOWS = {"hour": 3600, "day": 86400}
+
+
+def analysis_priority(post):
+    """优先队列的排序 key（越小越优先）"""
+    return (
+        0 if post.get("task_category") == "skill_match" else 1,
+        -(post.get("skill_score") or 0),
+        -(post.get("budget") or 0),
+        post.get("freshness_minutes", 9999),
+    )
+
+
+class LLMGovernor:
+    def __init__(self, limits):
+        """limits: {("hour" | "day", "requests" | "tokens"): 上限}，0 表示不限制"""
+        self.limits = limits
+        self.lock = threading.Lock()
+        # (时间, 请求数, token 数)，只保留最近一天
+        self.events = deque()
+        self.reserved = {"requests": 0, "tokens": 0}
+        self.totals = {
+            "requests": 0, "tokens": 0, "denied": 0,
+            "hedged": 0, "hedged_denied": 0, "failovers": 0, "failovers_denied": 0,
+        }
+        self.queued = 0
+
+    def _prune(self, now):
+        while self.events and self.events[0][0] <= now - WINDOWS["day"]:
+            self.events.popleft()
+
+    def _usage(self, now):
+        usage = {window: {"requests": 0, "tokens": 0} for window in WINDOWS}
+        for at, requests, tokens in self.events:
+            for window, seconds in WINDOWS.items():
+                if at > now - seconds:
+                    usage[window]["requests"] += requests
+                    usage[window]["tokens"] += tokens
+        return usage
+
+    def try_acquire(self, posts=1, reason=None):
+        """
+        为一个请求（包含 posts 个帖子）预留额度，成功返回 ticket，额度不足返回 None
+        reason: "hedged" / "failovers" 表示同一次分析额外发出的请求（llm_endpoints），单独计数
+        """
+        ticket = {"requests": 1, "tokens": LLM_TOKENS_PER_POST_ESTIMATE * posts}
+        now = time_module.time()
+        with self.lock:
+            self._prune(now)
+            usage = self._usage(now)
+            for (window, kind), limit in self.limits.items():
+                if limit and usage[window][kind] + self.reserved[kind] + ticket[kind] > limit:
+                    self.totals[f"{reason}_denied" if reason else "denied"] += 1
+                    return None
+            if reason:
+                self.totals[reason] += 1
+            self.reserved["requests"] += ticket["requests"]
+            self.reserved["tokens"] += ticket["tokens"]
+        return ticket
+
+    def release(self, ticket):
+        """请求结束（不管成功与否）后释放预留"""
+        if ticket is None:
+            return
+        with self.lock:
+            self.reserved["requests"] -= ticket["requests"]
+            self.reserved["tokens"] -= ticket["tokens"]
+
+    def record(self, tokens):
+        """记录一次已发出的请求和实际 token 用量"""
+        now = time_module.time()
+        with self.lock:
+            self.events.append((now, 1, tokens))
+            self.totals["requests"] += 1
+            self.totals["tokens"] += tokens
+
+    def queue(self, posts):
+        return AnalysisQueue(self, posts)
+
+    def _add_queued(self, count):
+        with self.lock:
+            self.queued += count
+
+    def get_stats(self):
+        now = time_module.time()
+        with self.lock:
+            self._prune(now)
+            usage = self._usage(now)
+            stats = {
+                "usage": usage,
+                "limits": {
+                    window: {kind: self.limits.get((window, kind), 0) or None for kind in ("requests", "tokens")}
+                    for window in WINDOWS
+                },
+                "reserved": dict(self.reserved),
+                "queue_depth": self.queued,
+                "totals": dict(self.totals),
+            }
+        if LLM_COST_PER_1K_TOKENS:
+            stats["estimated_cost_usd"] = {
+                window: round(usage[window]["tokens"] / 1000 * LLM_COST_PER_1K_TOKENS, 4) for window in WINDOWS
+            }
+        return stats
+
+
+class AnalysisQueue:
+    """
+    一次分析任务的优先队列，按 analysis_priority 出队；排队数计入 governor 的 queue_depth
+    """
+
+    def __init__(self, governor, posts):
+        self.governor = governor
+        view = RankedView(posts, key=analysis_priority)
+        self._items = iter(view)
+        self._remaining = len(view)
+        governor._add_queued(self._remaining)
+
+    def pop(self):
+        """返回优先级最高的帖子，队列为空返回 None"""
+        post = next(self._items, None)
+        if post is not None:
+            self._remaining -= 1
+            self.governor._add_queued(-1)
+        return post
+
+    def __len__(self):
+        return self._remaining
+
+    def close(self):
+        """分析结束，剩下的帖子不再排队"""
+        self.governor._add_queued(-self._remaining)
+        self._remaining = 0
+
+
+_GOVERNOR = LLMGovernor({
+    ("hour", "requests"): LLM_BUDGET_REQUESTS_PER_HOUR,
+    ("day", "requests"): LLM_BUDGET_REQUESTS_PER_DAY,
+    ("hour", "tokens"): LLM_BUDGET_TOKENS_PER_HOUR,
+    ("day", "tokens"): LLM_BUDGET_TOKENS_PER_DAY,
+})
+
+
+def get_governor():
+    return _GOVERNOR
+
+
+def get_governor_stats():
+    return _GOVERNOR.get_stats()
@@ -0,0 +1,163 @@
+"""
+后台 LLM 分析任务
+/api/tasks 只做正则分类就立即返回，同时提交一个后台任务做 LLM 分析并返回 job_id；
+前端轮询 GET /api/tasks/jobs/{job_id}?since=N，每个帖子分析完成后就能拿到它的 llm_analysis，
+不需要等整批结束。
+- 任务由固定数量的工作线程执行，超出的任务排队
+- 每个任务记录按完成顺序排列的更新列表，since 是已经拿到的更新数，只返回之后的新结果
+- 结束的任务保留 LLM_JOB_TTL 秒，最多保留 LLM_JOB_MAX 个
+- 背压: 同一批帖子（反复刷新页面）复用还没结束的任务；排队 + 运行中的任务最多 LLM_JOB_MAX_ACTIVE 个，
+  超过时不再提交（返回 None，页面只显示正则结果）
+"""
+import os
+import threading
+import time as time_module
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_classifier
+
+LLM_JOB_WORKERS = int(os.getenv("LLM_JOB_WORKERS", "2"))
+LLM_JOB_TTL = int(os.getenv("LLM_JOB_TTL", "3600"))
+LLM_JOB_MAX = int(os.getenv("LLM_JOB_MAX", "100"))
+LLM_JOB_MAX_ACTIVE = int(os.getenv("LLM_JOB_MAX_ACTIVE", "4"))
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor = None
+_stats = {"reused": 0, "rejected": 0}
+
+
+def _update_for(post):
+    """推送给前端的字段：LLM 结果 / 本地分诊结论，以及被否决后降级的分类"""
+    return {
+        "id": post["id"],
+        "llm_analysis": post.get("llm_analysis"),
+        "llm_rejected": post.get("llm_rejected", False),
+        "task_category": post.get("task_category"),
+        "triage": post.get("triage"),
+    }
+
+
+def _job_key(posts, max_analyze):
+    """需要分析的帖子 id 相同（且 max_analyze 相同）的任务可以共用"""
+    ids = frozenset(p["id"] for p in posts if p.get("task_category") in ("skill_match", "maybe_match"))
+    return max_analyze, ids
+
+
+class EnrichmentJob:
+    def __init__(self, posts, max_analyze):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = _job_key(posts, max_analyze)
+        self.posts = posts
+        self.max_analyze = max_analyze
+        self.status = "queued"
+        self.error = None
+        self.created = time_module.time()
+        self.finished = None
+        self.updates = []
+        self.lock = threading.Lock()
+
+    def add_update(self, post):
+        with self.lock:
+            self.updates.append(_update_for(post))
+
+    def run(self):
+        with self.lock:
+            self.status = "running"
+        try:
+            llm_classifier.enrich_tasks_with_llm(self.posts, max_analyze=self.max_analyze, on_result=self.add_update)
+            status, error = "done", None
+        except Exception as e:
+            print(f"[LLM] Background job {self.id} failed: {e}")
+            status, error = "failed", str(e)
+        with self.lock:
+            self.status = status
+            self.error = error
+            self.finished = time_module.time()
+        # 帖子对象不再需要，释放内存
+        self.posts = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def snapshot(self, since=0):
+        with self.lock:
+            since = max(0, min(since, len(self.updates)))
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "done": self.status in ("done", "failed"),
+                "error": self.error,
+                "updates": self.updates[since:],
+                "next": len(self.updates),
+                "elapsed": round((self.finished or time_module.time()) - self.created, 2),
+            }
+
+
+def _get_executor():
+    global _executor
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, LLM_JOB_WORKERS), thread_name_prefix="llm-job")
+        return _executor
+
+
+def _prune(now):
+    """在 _jobs_lock 内调用：删掉过期的已结束任务，超过上限时从最旧的已结束任务开始删"""
+    finished = [job for job in _jobs.values() if job.finished is not None]
+    for job in finished:
+        if now - job.finished > LLM_JOB_TTL or len(_jobs) > LLM_JOB_MAX:
+            del _jobs[job.id]
+
+
+def submit_enrichment_job(posts, max_analyze=5):
+    """
+    在后台对 posts 做 LLM 分析（原地写入 llm_analysis），返回 job_id
+    没有配置 LLM 服务或没有需要分析的帖子时不提交，返回 None
+    同一批帖子已有还没结束的任务时返回那个任务的 job_id；
+    排队 + 运行中的任务已有 LLM_JOB_MAX_ACTIVE 个时不提交，返回 None
+    """
+    if not llm_classifier.llm_configured():
+        return None
+    if not any(p.get("task_category") in ("skill_match", "maybe_match") for p in posts):
+        return None
+
+    job = EnrichmentJob(list(posts), max_analyze)
+    executor = _get_executor()
+    with _jobs_lock:
+        _prune(time_module.time())
+        active = [existing for existing in _jobs.values() if existing.active]
+        for existing in active:
+            if existing.key == job.key:
+                _stats["reused"] += 1
+                return existing.id
+        if len(active) >= LLM_JOB_MAX_ACTIVE:
+            _stats["rejected"] += 1
+            print(f"[LLM] {len(active)} background jobs already queued or running, skipping LLM analysis")
+            return None
+        _jobs[job.id] = job
+    executor.submit(job.run)
+    print(f"[LLM] Background job {job.id} queued for {len(job.posts)} posts")
+    return job.id
+
+
+def get_job(job_id, since=0):
+    """返回任务状态和 since 之后完成的帖子结果，任务不存在（或已过期）返回 None"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return None
+    return job.snapshot(since)
+
+
+def get_job_stats():
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+        stats = dict(_stats)
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    for job in jobs:
+        counts[job.status] += 1
+    return {"workers": max(1, LLM_JOB_WORKERS), "max_active": LLM_JOB_MAX_ACTIVE, "jobs": counts, **stats}
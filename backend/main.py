@@ -1,10 +1,24 @@
-from fastapi import FastAPI, Query, BackgroundTasks
+from fastapi import FastAPI, Query, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from classifier import classify_posts
-from task_scraper import scrape_task_posts, get_freshness_label, DEFAULT_TASK_SUBREDDITS
-from task_classifier import classify_task_posts
-from notifier import notify_new_tasks
+from task_scraper import (
+    scrape_task_posts, iter_task_posts, get_freshness_label, get_high_water_marks, reset_high_water_marks,
+    DEFAULT_TASK_SUBREDDITS,
+)
+from task_classifier import classify_task_posts, iter_classify_task_posts, sort_task_results
+from notify_dispatcher import NotificationDispatcher, configured_channels
+from dedup_store import get_dedup_store
+from models import TaskPost, to_dicts
+from reddit_client import get_rate_limit_stats
+from response_cache import get_cache_stats, clear_response_cache
+from classification_cache import get_classification_cache_stats, clear_classification_cache
+from rules import get_rules_info, reload_rules
+from llm_cache import get_llm_cache_stats, clear_llm_cache
+from llm_governor import get_governor_stats
+from llm_jobs import submit_enrichment_job, get_job, get_job_stats
+from triage_model import get_triage_stats
+from llm_classifier import get_endpoint_stats
 import time
 import threading
 import os
@@ -12,14 +26,86 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# ========== 已通知帖子缓存（避免重复通知） ==========
-notified_post_ids = set()
-notified_lock = threading.Lock()
+# ========== 已通知帖子记录（避免重复通知，持久化，重新部署后仍然有效） ==========
+notified_posts = get_dedup_store()
+
+
+def mark_notified(posts):
+    """通知发送成功后才标记为已通知"""
+    notified_posts.add(posts)
+
+
+def requeue_undelivered():
+    """
+    所有通知通道都失败的帖子保存在 dedup_store 的 pending 表里（增量扫描不会再抓到它们），
+    每次扫描开始时重新入队，返回入队的帖子数
+    """
+    posts = []
+    for data in notified_posts.pending_posts():
+        post = TaskPost.from_post(data)
+        post.freshness_label, post.freshness_minutes = get_freshness_label(post.created)
+        posts.append(post)
+    if not posts:
+        return 0
+    print(f"[SCHEDULER] Re-queueing {len(posts)} undelivered notifications")
+    return dispatcher.enqueue(posts)
+
+
+# 通知在后台线程发送（合并、重试、限流），扫描不等待通知通道
+dispatcher = NotificationDispatcher(
+    configured_channels(), on_delivered=mark_notified, on_dropped=notified_posts.add_pending,
+)
 
 # ========== 定时扫描器 ==========
 scanner_thread = None
 scanner_running = False
 
+# 发布不到 N 分钟的 skill_match 帖子（GO NOW）抓到后立即单独通知
+URGENT_NOTIFY_MINUTES = int(os.getenv("URGENT_NOTIFY_MINUTES", "10"))
+
+
+def run_task_scan():
+    """
+    流式增量扫描：帖子边抓取边分类
+    - GO NOW 级别的新 skill_match 帖子立即放进通知队列，不等其他 subreddit 和 LLM
+    - 其余新的 skill_match / maybe_match 帖子在扫描结束后排序、做 LLM 分析，再合并成一条汇总通知入队
+    - 已通知或还在通知队列中的帖子跳过；通知发送成功后才记入 notified_posts
+    - 上次所有通道都发送失败的帖子先重新入队
+    返回 (扫描帖子数, 新匹配帖子列表, 入队通知的帖子数)
+    """
+    total = 0
+    urgent_posts = []
+    new_posts = []
+    queued = requeue_undelivered()
+
+    # 增量扫描：只抓取上次扫描之后的新帖子
+    for p in iter_classify_task_posts(iter_task_posts(time_filter="week", incremental=True)):
+        total += 1
+        if p.task_category not in ("skill_match", "maybe_match"):
+            continue
+        if p.id in notified_posts or dispatcher.is_pending(p.id):
+            continue
+
+        if p.task_category == "skill_match" and p.freshness_minutes < URGENT_NOTIFY_MINUTES:
+            print(f"[SCHEDULER] Urgent task found, notifying immediately: {p.id}")
+            queued += dispatcher.enqueue([p], urgent=True)
+            urgent_posts.append(p)
+        else:
+            new_posts.append(p)
+
+    if new_posts:
+        sort_task_results(new_posts)
+        try:
+            from llm_classifier import enrich_tasks_with_llm
+            new_posts = enrich_tasks_with_llm(new_posts, max_analyze=5)
+        except Exception as e:
+            print(f"[LLM] Enrichment failed, continuing without LLM: {e}")
+        print(f"[SCHEDULER] Found {len(new_posts)} new matching tasks, queueing notification...")
+        queued += dispatcher.enqueue(new_posts)
+
+    return total, urgent_posts + new_posts, queued
+
+
 def auto_scan_loop():
     """后台定时扫描循环"""
     global scanner_running
@@ -29,21 +115,8 @@ def auto_scan_loop():
     while scanner_running:
         try:
             print("[SCHEDULER] Running scheduled scan...")
-            posts = scrape_task_posts(time_filter="week")
-            classified = classify_task_posts(posts)
-
-            # 过滤出新的 skill_match / maybe_match 帖子
-            new_posts = []
-            with notified_lock:
-                for p in classified:
-                    if p["task_category"] in ("skill_match", "maybe_match") and p["id"] not in notified_post_ids:
-                        new_posts.append(p)
-                        notified_post_ids.add(p["id"])
-
-            if new_posts:
-                print(f"[SCHEDULER] Found {len(new_posts)} new matching tasks, sending notification...")
-                notify_new_tasks(new_posts)
-            else:
+            _, new_posts, _ = run_task_scan()
+            if not new_posts:
                 print("[SCHEDULER] No new matching tasks found.")
 
         except Exception as e:
@@ -72,6 +145,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     scanner_running = False
     print("[SHUTDOWN] Stopping auto-scanner...")
+    dispatcher.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -103,6 +177,75 @@ def version():
         "railway_service": os.getenv("RAILWAY_SERVICE_NAME") or None,
     }
 
+
+@app.get("/api/reddit/stats")
+def reddit_stats():
+    """Reddit 请求限流状态（令牌桶速率、剩余额度、429 次数）、增量扫描高水位和响应缓存命中率"""
+    return {
+        "rate_limits": get_rate_limit_stats(),
+        "high_water_marks": get_high_water_marks(),
+        "response_cache": get_cache_stats(),
+    }
+
+
+@app.post("/api/reddit/cache/clear")
+def clear_reddit_cache():
+    """清空 Reddit 响应缓存"""
+    return {"status": "cleared", "removed": clear_response_cache()}
+
+
+@app.get("/api/classify/stats")
+def classify_stats():
+    """分类结果缓存命中率（demand / task 分开统计）"""
+    return {"classification_cache": get_classification_cache_stats()}
+
+
+@app.post("/api/classify/cache/clear")
+def clear_classify_cache():
+    """清空分类结果缓存，下次扫描全部重新分类"""
+    return {"status": "cleared", "removed": clear_classification_cache()}
+
+
+@app.get("/api/rules")
+def rules_info():
+    """当前生效的分类规则版本、来源和各规则列表条数"""
+    return get_rules_info()
+
+
+@app.post("/api/rules/reload")
+def reload_rules_now():
+    """立即重新读取 RULES_FILE（正常情况下文件修改后会自动重新加载）"""
+    return reload_rules()
+
+
+@app.get("/api/llm/stats")
+def llm_stats():
+    """LLM 分析缓存命中率（命中的帖子不会再次请求 LLM），小时 / 天额度用量和排队数，后台分析任务数，本地分诊模型的判断次数，
+    各 LLM 服务的健康分 / 熔断状态 / 延迟和对冲次数
+    """
+    return {
+        "llm_cache": get_llm_cache_stats(),
+        "governor": get_governor_stats(),
+        "jobs": get_job_stats(),
+        "triage": get_triage_stats(),
+        "endpoints": get_endpoint_stats(),
+    }
+
+
+@app.get("/api/notify/stats")
+def notify_stats():
+    """
+    通知队列：排队 / 等待发送成功的帖子数、重试队列、发送成功 / 放弃的帖子数、Telegram 限流等待次数；
+    dedup: 已通知记录的条目数、Bloom 过滤器内存占用和误判率
+    """
+    return {**dispatcher.get_stats(), "dedup": notified_posts.get_stats()}
+
+
+@app.post("/api/llm/cache/clear")
+def clear_llm_analysis_cache():
+    """清空 LLM 分析缓存"""
+    return {"status": "cleared", "removed": clear_llm_cache()}
+
 # 模拟数据，用于测试 UI
 MOCK_POSTS = [
     {
@@ -187,7 +330,7 @@ def scan(
     time_filter: str = Query(default="month"),
     use_mock: bool = Query(default=False),  # 默认使用真实数据
     verify_links: bool = Query(default=True),  # 是否验证链接有效性
-    max_verify: int = Query(default=10),  # 验证前 N 个链接
+    max_verify: int = Query(default=100),  # 验证前 N 个链接（/api/info 每 100 个只需一次请求）
 ):
     if use_mock:
         posts = MOCK_POSTS[:min(limit, len(MOCK_POSTS))]
@@ -217,7 +360,7 @@ def scan(
         "unclear": len([p for p in classified if p["category"] == "unclear"]),
     }
     
-    return {"stats": stats, "posts": classified}
+    return {"stats": stats, "posts": to_dicts(classified)}
 
 
 # ========== TASK 扫描接口 ==========
@@ -231,6 +374,7 @@ def scan_tasks(
 ):
     """
     扫描 TASK 帖子，分类并返回结果
+    只做正则分类就返回；LLM 分析在后台进行，用返回的 llm_job_id 轮询 /api/tasks/jobs/{job_id}
     """
     sub_list = [s.strip() for s in subreddits.split(",") if s.strip()] or None
     kw = keyword.strip() or None
@@ -248,13 +392,14 @@ def scan_tasks(
         return {
             "stats": {"total": 0, "skill_match": 0, "maybe_match": 0, "irrelevant": 0, "danger": 0},
             "posts": [],
+            "llm_job_id": None,
             "message": "No TASK posts found.",
             "debug": {
                 "errors": debug_errors,
             },
         }
 
-    classified = classify_task_posts(posts)
+    classified = classify_task_posts(posts, enrich=False)
 
     stats = {
         "total": len(classified),
@@ -264,15 +409,30 @@ def scan_tasks(
         "danger": len([p for p in classified if p["task_category"] == "danger"]),
     }
 
-    return {"stats": stats, "posts": classified}
+    # 先序列化再提交后台任务，返回的是纯正则分类结果
+    result = {"stats": stats, "posts": to_dicts(classified)}
+    result["llm_job_id"] = submit_enrichment_job(classified, max_analyze=5)
+    return result
+
+
+@app.get("/api/tasks/jobs/{job_id}")
+def task_llm_job(job_id: str, since: int = Query(default=0)):
+    """
+    后台 LLM 分析进度：updates 是 since 之后完成的帖子（id、llm_analysis、llm_rejected、task_category），
+    下次轮询把返回的 next 作为 since；done 为 true 时不再有新结果
+    """
+    job = get_job(job_id, since)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found or expired")
+    return job
 
 
 @app.post("/api/tasks/clear-cache")
 def clear_cache():
     """清空已通知缓存，下次扫描会重新通知所有匹配帖子"""
-    with notified_lock:
-        count = len(notified_post_ids)
-        notified_post_ids.clear()
+    count = notified_posts.clear()
+    # 同时清空增量扫描高水位，否则下次扫描只会看到新帖子
+    reset_high_water_marks()
     return {"status": "cleared", "removed": count}
 
 
@@ -282,25 +442,15 @@ def scan_now_and_notify():
     手动触发一次扫描并发送通知
     可用于 n8n / cron 定时调用
     """
-    posts = scrape_task_posts(time_filter="week")
-    classified = classify_task_posts(posts)
-
-    new_posts = []
-    with notified_lock:
-        for p in classified:
-            if p["task_category"] in ("skill_match", "maybe_match") and p["id"] not in notified_post_ids:
-                new_posts.append(p)
-                notified_post_ids.add(p["id"])
-
-    notified = False
-    if new_posts:
-        notified = notify_new_tasks(new_posts)
+    total, new_posts, queued = run_task_scan()
 
     return {
-        "total_scanned": len(classified),
+        "total_scanned": total,
         "new_matches": len(new_posts),
-        "notified": notified,
-        "posts": new_posts,
+        # 通知在后台发送，这里表示是否已放进通知队列
+        "notified": queued > 0,
+        "queued_notifications": queued,
+        "posts": to_dicts(new_posts),
     }
 
 
@@ -0,0 +1,126 @@
+"""
+预编译的多组信号词匹配器
+一次调用对小写后的文本跑完所有信号组，返回每组命中的 pattern（顺序与原列表一致）以及提取类 pattern 的 findall 结果。
+
+每个 pattern 预先编译，并提取出它开头必须出现的字面量（例如 r"scrap(e|ing|er)" -> "scrap"）。
+字面量不在文本里时直接跳过该 pattern，不进入正则引擎；r"chrome extension" 这类纯字面量只做子串判断。
+命中结果与逐个 re.search / re.findall 完全相同。
+"""
+import re
+
+# 可以直接当作字面量的字符；其他字符（( [ . ^ $ | 等）都会结束字面量前缀
+_LITERAL_CHARS = set("abcdefghijklmnopqrstuvwxyz0123456789 '\",/:;!@#%&=<>~`_-")
+_QUANTIFIERS = set("?*{")
+
+
+def literal_prefix(pattern):
+    """
+    提取 pattern 开头必须逐字出现的字面量，提取不到时返回空字符串
+    """
+    return _scan_literal(pattern)[0]
+
+
+def _scan_literal(pattern):
+    """返回 (字面量前缀, 整个 pattern 是否就是这个字面量)"""
+    # 顶层的 | 说明整个 pattern 是多选一，没有共同前缀
+    if not _alternation_is_grouped(pattern):
+        return "", False
+    chars = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            # \d \s \w \b 等是字符类，不是字面量
+            if nxt.isalnum():
+                break
+            chars.append(nxt)
+            i += 2
+        elif ch in _LITERAL_CHARS:
+            chars.append(ch)
+            i += 1
+        else:
+            break
+        # 后面跟着 ? * {m,n} 的字符可能不出现
+        if i < len(pattern) and pattern[i] in _QUANTIFIERS:
+            chars.pop()
+            return "".join(chars), False
+    return "".join(chars), i == len(pattern)
+
+
+def _alternation_is_grouped(pattern):
+    """判断 pattern 中所有 | 是否都在括号内（顶层没有 |）"""
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            if ch == "]":
+                in_class = False
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return False
+        i += 1
+    return True
+
+
+class SignalMatcher:
+    """
+    - families: {组名: pattern 列表}，match() 返回每组命中的 pattern 列表
+    - extractors: {组名: pattern 列表}，match() 返回每组所有 pattern 的 findall 结果（按 pattern 顺序拼接）
+    """
+
+    def __init__(self, families, extractors=None):
+        self.names = list(families)
+        # 按字面量分组：多个 pattern 共享同一个字面量时只做一次子串判断
+        groups = {}
+        for family_index, patterns in enumerate(families.values()):
+            for pattern_index, pattern in enumerate(patterns):
+                literal, complete = _scan_literal(pattern)
+                # 纯字面量的 pattern 只需要做子串判断
+                regex = None if complete else re.compile(pattern)
+                groups.setdefault(literal, []).append((family_index, pattern_index, pattern, regex))
+        self.groups = list(groups.items())
+
+        self.extractors = []
+        for name, patterns in (extractors or {}).items():
+            compiled = [(re.compile(pattern), literal_prefix(pattern)) for pattern in patterns]
+            self.extractors.append((name, compiled))
+
+    def match(self, text):
+        """text 会先转成小写，只转一次"""
+        return self.match_lower(text.lower())
+
+    def hit_indices(self, text_lower):
+        """返回命中的 (组序号, pattern 序号, pattern) 列表，按原列表顺序排列"""
+        hits = []
+        for literal, members in self.groups:
+            if literal in text_lower:
+                for family_index, pattern_index, pattern, regex in members:
+                    if regex is None or regex.search(text_lower):
+                        hits.append((family_index, pattern_index, pattern))
+        # 命中通常只有几个，排序即可恢复原列表顺序
+        hits.sort()
+        return hits
+
+    def match_lower(self, text_lower):
+        result = {name: [] for name in self.names}
+        for family_index, _, pattern in self.hit_indices(text_lower):
+            result[self.names[family_index]].append(pattern)
+
+        for name, compiled in self.extractors:
+            found = []
+            for regex, literal in compiled:
+                if literal in text_lower:
+                    found.extend(regex.findall(text_lower))
+            result[name] = found
+        return result
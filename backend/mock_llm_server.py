@@ -0,0 +1,242 @@
+"""
+本地 OpenAI 兼容 /v1/chat/completions 模拟服务（只用标准库）
+用于在不花钱的情况下测试 / 压测 LLM 分析路径：把 LLM_API_URL 指向 http://127.0.0.1:<port>/v1/chat/completions 即可。
+- 延迟分布: fixed:<ms> / uniform:<min_ms>:<max_ms> / lognormal:<median_ms>:<sigma>
+- 按比例返回 500 错误、429 限流、格式错误的 JSON、markdown 代码块包裹的 JSON
+- 支持批量请求（消息中包含 "Post id: ..."），可以按比例漏掉其中的帖子
+- 响应带 usage 字段（按字符数粗略估算 token）
+- GET /stats 返回收到的请求数和各类响应的次数
+
+用法:
+    python mock_llm_server.py --port 8911 --latency lognormal:800:0.5 --error-rate 0.05 --malformed-rate 0.05
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "latency": "fixed:50",
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "malformed_rate": 0.0,
+    "fenced_rate": 0.0,
+    "missing_rate": 0.0,
+    "seed": None,
+}
+
+_POST_ID = re.compile(r"^Post id: (\S+)", re.MULTILINE)
+_TITLE = re.compile(r"^Title: (.*)$", re.MULTILINE)
+
+
+def parse_latency(spec):
+    """把延迟描述转换成返回秒数的函数"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rnd: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rnd: rnd.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rnd: rnd.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"invalid latency spec: {spec!r}")
+
+
+def _analysis(post_id, title):
+    """根据标题生成一个确定的分析结果"""
+    worth = not any(word in title.lower() for word in ("hack", "nsfw", "essay", "account"))
+    result = {
+        "worth_taking": worth,
+        "confidence": 0.8 if worth else 0.9,
+        "required_skills": ["python"],
+        "estimated_hours": 3,
+        "suggested_bid_usd": 60,
+        "difficulty": "easy",
+        "red_flags": [] if worth else ["policy"],
+        "summary": f"Mock analysis of: {title[:60]}",
+        "reply_draft": "Hi, I can help with this. DM me.",
+    }
+    if post_id is not None:
+        result = {"id": post_id, **result}
+    return result
+
+
+class MockLLMState:
+    def __init__(self, config):
+        self.config = {**DEFAULT_CONFIG, **config}
+        self.latency = parse_latency(self.config["latency"])
+        self.random = random.Random(self.config["seed"])
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "malformed": 0, "fenced": 0,
+                      "missing_posts": 0}
+
+    def roll(self):
+        """在锁内取随机数，保证相同 seed 下结果可复现（并发时顺序仍取决于到达顺序）"""
+        with self.lock:
+            self.stats["requests"] += 1
+            return self.random.random(), self.random.random(), self.latency(self.random), self.random.random()
+
+    def chance(self, probability):
+        with self.lock:
+            return self.random.random() < probability
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+def build_completion(state, message, fenced, malformed):
+    post_ids = _POST_ID.findall(message)
+    titles = _TITLE.findall(message)
+    if post_ids:
+        entries = []
+        for index, post_id in enumerate(post_ids):
+            if state.chance(state.config["missing_rate"]):
+                state.count("missing_posts")
+                continue
+            entries.append(_analysis(post_id, titles[index] if index < len(titles) else ""))
+        content = json.dumps(entries)
+    else:
+        content = json.dumps(_analysis(None, titles[0] if titles else ""))
+
+    if malformed:
+        # 截断成不合法的 JSON
+        content = content[: max(1, len(content) // 2)]
+    if fenced:
+        content = f"```json\n{content}\n```"
+
+    prompt_tokens = len(message) // 4 + 400
+    completion_tokens = len(content) // 4
+    return {
+        "id": "mock-completion",
+        "object": "chat.completion",
+        "model": "mock",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            try:
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端已经超时断开
+                pass
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with state.lock:
+                    self._send(200, dict(state.stats))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                payload = json.loads(raw)
+                message = payload["messages"][-1]["content"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                self._send(400, {"error": {"message": "invalid request"}})
+                return
+
+            outcome, shape, delay, fence = state.roll()
+            time_module.sleep(delay)
+
+            config = state.config
+            if outcome < config["error_rate"]:
+                state.count("errors")
+                self._send(500, {"error": {"message": "mock internal error"}})
+                return
+            if outcome < config["error_rate"] + config["rate_limit_rate"]:
+                state.count("rate_limited")
+                self._send(429, {"error": {"message": "mock rate limit"}}, {"Retry-After": "1"})
+                return
+
+            malformed = shape < config["malformed_rate"]
+            fenced = fence < config["fenced_rate"]
+            if malformed:
+                state.count("malformed")
+            if fenced:
+                state.count("fenced")
+            state.count("ok")
+            self._send(200, build_completion(state, message, fenced, malformed))
+
+    return Handler
+
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """
+    在后台线程启动模拟服务，返回 (server, chat_completions_url)；用完调用 server.shutdown()
+    port=0 时自动选择空闲端口
+    """
+    state = MockLLMState(config or {})
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_address[1]}/v1/chat/completions"
+    return server, url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency", default=DEFAULT_CONFIG["latency"],
+                        help="fixed:<ms> | uniform:<min>:<max> | lognormal:<median_ms>:<sigma>")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of truncated JSON bodies")
+    parser.add_argument("--fenced-rate", type=float, default=0.0, help="fraction wrapped in ```json fences")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="fraction of posts dropped from batch replies")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "malformed_rate": args.malformed_rate,
+        "fenced_rate": args.fenced_rate,
+        "missing_rate": args.missing_rate,
+        "seed": args.seed,
+    }
+    server, url = start_mock_server(config, host=args.host, port=args.port)
+    print(f"[MOCK] Serving {url} (GET /stats for counters), Ctrl+C to stop")
+    try:
+        while True:
+            time_module.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+帖子数据结构
+用带 __slots__ 的轻量记录类型代替 dict，避免分类时 {**post, ...} 反复复制：
+- Post: 爬虫输出的原始帖子（reddit_scraper / task_scraper 共用）
+- DemandPost: classifier 的分类结果
+- TaskPost: task_classifier 的分类结果（含 LLM 分析字段）
+分类字段直接存在同一个对象上。仍然支持 post["title"]、post.get("flair")、
+post["llm_analysis"] = ... 等 dict 风格访问，API 返回时用 to_dict() 得到与原来相同的 JSON。
+"""
+
+_MISSING = object()
+
+
+class Post:
+    # 字段顺序即 to_dict() 的 key 顺序
+    FIELDS = ("id", "title", "text", "score", "num_comments", "url", "created", "subreddit", "author", "flair")
+    _FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS + ("_extra",)
+
+    def __init__(self, **fields):
+        # 未赋值的 slot 视为不存在的 key，to_dict() 时不输出
+        self._extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_post(cls, post):
+        """从 dict 或其他 Post 构造，只复制字段引用，不复制内容"""
+        record = cls.__new__(cls)
+        record._extra = None
+        if isinstance(post, Post):
+            for name in post.FIELDS:
+                value = getattr(post, name, _MISSING)
+                if value is not _MISSING:
+                    record[name] = value
+            if post._extra:
+                for key, value in post._extra.items():
+                    record[key] = value
+        else:
+            for key, value in post.items():
+                record[key] = value
+        return record
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [name for name in self.FIELDS if hasattr(self, name)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def to_dict(self):
+        """转成普通 dict（用于 JSON 序列化）"""
+        data = {}
+        for name in self.FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                data[name] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class DemandPost(Post):
+    FIELDS = Post.FIELDS + (
+        "category",
+        "confidence",
+        "need_score",
+        "personal_score",
+        "need_matches",
+        "personal_matches",
+        "rule_version",
+    )
+    _FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS[len(Post.FIELDS):]
+
+
+class TaskPost(Post):
+    FIELDS = Post.FIELDS + (
+        "task_category",
+        "confidence",
+        "skill_score",
+        "danger_score",
+        "skill_matches",
+        "danger_matches",
+        "budget",
+        "freshness_label",
+        "freshness_minutes",
+        "rule_version",
+        "llm_analysis",
+        "llm_rejected",
+        "triage",
+    )
+    _FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS[len(Post.FIELDS):]
+
+
+def to_dicts(posts):
+    """API 边界：把记录列表转成 dict 列表，普通 dict 原样返回"""
+    return [p.to_dict() if isinstance(p, Post) else p for p in posts]
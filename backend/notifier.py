@@ -6,6 +6,8 @@ import os
 import requests
 from dotenv import load_dotenv
 
+from ranking import task_rank_key, top_k
+
 load_dotenv()
 
 # Telegram 配置
@@ -19,21 +21,37 @@ PUSHPLUS_TOKEN = os.getenv("PUSHPLUS_TOKEN", "")
 def send_telegram_message(text, parse_mode="HTML"):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         return False
+    ok, _ = post_telegram_message(TELEGRAM_CHAT_ID, text, parse_mode)
+    return ok
+
+
+def post_telegram_message(chat_id, text, parse_mode="HTML"):
+    """
+    发送一条 Telegram 消息，返回 (是否成功, retry_after)
+    retry_after: 被限流（429）时 Telegram 要求等待的秒数，其他情况为 None
+    """
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
+        "chat_id": chat_id,
         "text": text,
         "parse_mode": parse_mode,
         "disable_web_page_preview": True,
     }
     try:
         resp = requests.post(url, json=payload, timeout=10)
+        if resp.status_code == 429:
+            try:
+                retry_after = resp.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            print(f"[NOTIFY] Telegram rate limited, retry after {retry_after}s")
+            return False, retry_after
         resp.raise_for_status()
         print("[NOTIFY] Telegram sent")
-        return True
+        return True, None
     except requests.RequestException as e:
         print(f"[NOTIFY] Telegram failed: {e}")
-        return False
+        return False, None
 
 
 def send_pushplus_message(title, content):
@@ -124,11 +142,37 @@ def format_task_telegram(post):
     return msg
 
 
+def build_pushplus_message(relevant):
+    """返回 (标题, HTML 内容)，只展示前 10 个，不依赖调用方已经排好序"""
+    top_posts = top_k(relevant, 10, task_rank_key)
+    html_content = f"<h2>Found {len(relevant)} matching tasks</h2>"
+    for post in top_posts:
+        html_content += format_task_html(post)
+    return f"{len(relevant)} new Reddit tasks", html_content
+
+
+def build_telegram_messages(relevant):
+    """不超过 2 个帖子时每个帖子一条详细消息，否则合并成一条摘要"""
+    top_posts = top_k(relevant, 10, task_rank_key)
+    if len(relevant) <= 2:
+        return [format_task_telegram(post) for post in top_posts]
+    lines = [f"<b>Found {len(relevant)} matching tasks</b>\n"]
+    for i, post in enumerate(top_posts, 1):
+        freshness = post.get("freshness_label", "")
+        lines.append(f"{i}. <b>{post['title'][:80]}</b>\n   {freshness}\n   <a href=\"{post['url']}\">Open</a>\n")
+    return ["\n".join(lines)]
+
+
+def relevant_posts(posts):
+    return [p for p in posts if p.get("task_category") in ("skill_match", "maybe_match")]
+
+
 def notify_new_tasks(posts):
+    """同步发送（不重试），定时扫描使用 notify_dispatcher 的异步队列"""
     if not posts:
         return False
 
-    relevant = [p for p in posts if p.get("task_category") in ("skill_match", "maybe_match")]
+    relevant = relevant_posts(posts)
     if not relevant:
         return False
 
@@ -136,26 +180,14 @@ def notify_new_tasks(posts):
 
     # 尝试 PushPlus（微信通知）
     if PUSHPLUS_TOKEN:
-        html_content = f"<h2>Found {len(relevant)} matching tasks</h2>"
-        for post in relevant[:10]:
-            html_content += format_task_html(post)
-        if send_pushplus_message(f"{len(relevant)} new Reddit tasks", html_content):
+        if send_pushplus_message(*build_pushplus_message(relevant)):
             success = True
 
     # 尝试 Telegram
     if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-        if len(relevant) <= 2:
-            for post in relevant:
-                msg = format_task_telegram(post)
-                send_telegram_message(msg)
-            success = True
-        else:
-            lines = [f"<b>Found {len(relevant)} matching tasks</b>\n"]
-            for i, post in enumerate(relevant[:10], 1):
-                freshness = post.get("freshness_label", "")
-                lines.append(f"{i}. <b>{post['title'][:80]}</b>\n   {freshness}\n   <a href=\"{post['url']}\">Open</a>\n")
-            send_telegram_message("\n".join(lines))
-            success = True
+        for msg in build_telegram_messages(relevant):
+            send_telegram_message(msg)
+        success = True
 
     if not success:
         print("[NOTIFY] No notification channel configured")
@@ -0,0 +1,324 @@
+"""
+异步通知分发
+扫描线程只把帖子放进队列就返回，由单独的工作线程发送 PushPlus / Telegram 通知，
+通知通道慢或出错都不影响扫描耗时。
+- 合并: 普通帖子在队列里等 NOTIFY_COALESCE_SECONDS 秒，期间到达的帖子合并成一条摘要；urgent 帖子立即发送
+- 重试: 每个通道独立重试，指数退避（从 NOTIFY_RETRY_BASE_SECONDS 开始，最多 NOTIFY_RETRY_MAX_SECONDS，
+  共 NOTIFY_MAX_ATTEMPTS 次）；Telegram 返回 429 时按 retry_after 等待
+- 限流: Telegram 每个 chat 每秒 TELEGRAM_CHAT_RATE 条、全局每秒 TELEGRAM_GLOBAL_RATE 条（令牌桶）
+- 至少一个通道发送成功后才回调 on_delivered(posts)（调用方据此标记为已通知）；
+  发送中的帖子算作排队中，不会重复入队
+- 所有通道都放弃（或停止时还没发出）的帖子回调 on_dropped(posts)：增量扫描不会再抓到这些帖子，
+  调用方需要把它们持久化（dedup_store 的 pending 表），下次扫描重新入队，否则通知就丢了
+"""
+import heapq
+import itertools
+import os
+import threading
+import time as time_module
+
+import notifier
+
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "5"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6"))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "2"))
+NOTIFY_RETRY_MAX_SECONDS = float(os.getenv("NOTIFY_RETRY_MAX_SECONDS", "300"))
+# Telegram 官方限制: 同一个 chat 约每秒 1 条，全局约每秒 30 条
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time_module.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """取一个令牌，返回需要等待的秒数（令牌不够时预支，等待后即可发送）"""
+        with self.lock:
+            now = time_module.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+# 所有 Telegram chat 共用的全局限流
+_TELEGRAM_GLOBAL_BUCKET = TokenBucket(TELEGRAM_GLOBAL_RATE, burst=TELEGRAM_GLOBAL_RATE)
+
+
+class PushPlusChannel:
+    name = "pushplus"
+
+    def build(self, posts):
+        return [notifier.build_pushplus_message(posts)]
+
+    def send(self, message):
+        return notifier.send_pushplus_message(*message), None
+
+
+class TelegramChannel:
+    name = "telegram"
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.bucket = TokenBucket(TELEGRAM_CHAT_RATE)
+        self.blocked_until = 0.0
+        self.rate_limit_waits = 0
+
+    def build(self, posts):
+        return notifier.build_telegram_messages(posts)
+
+    def send(self, message):
+        """返回 (是否成功, 建议等待秒数)"""
+        blocked = self.blocked_until - time_module.monotonic()
+        if blocked > 0:
+            return False, blocked
+        wait = max(self.bucket.reserve(), _TELEGRAM_GLOBAL_BUCKET.reserve())
+        if wait > 0:
+            self.rate_limit_waits += 1
+            time_module.sleep(wait)
+        ok, retry_after = notifier.post_telegram_message(self.chat_id, message)
+        if retry_after:
+            self.blocked_until = time_module.monotonic() + retry_after
+        return ok, retry_after
+
+
+def configured_channels():
+    channels = []
+    if notifier.PUSHPLUS_TOKEN:
+        channels.append(PushPlusChannel())
+    if notifier.TELEGRAM_BOT_TOKEN and notifier.TELEGRAM_CHAT_ID:
+        channels.append(TelegramChannel(notifier.TELEGRAM_CHAT_ID))
+    return channels
+
+
+class _Batch:
+    """一次合并发送的帖子"""
+
+    def __init__(self, posts, channels):
+        self.posts = posts
+        self.remaining = channels
+        self.delivered = False
+
+
+class _Delivery:
+    """一个批次在一个通道上的发送进度（多条消息时已发送的不会重发）"""
+
+    def __init__(self, batch, channel):
+        self.batch = batch
+        self.channel = channel
+        self.messages = channel.build(batch.posts)
+        self.attempts = 0
+
+
+class NotificationDispatcher:
+    def __init__(self, channels, on_delivered=None, on_dropped=None, coalesce_seconds=None, max_attempts=None,
+                 retry_base=None, retry_max=None):
+        self.channels = channels
+        self.on_delivered = on_delivered
+        self.on_dropped = on_dropped
+        self.coalesce_seconds = NOTIFY_COALESCE_SECONDS if coalesce_seconds is None else coalesce_seconds
+        self.max_attempts = NOTIFY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.retry_base = NOTIFY_RETRY_BASE_SECONDS if retry_base is None else retry_base
+        self.retry_max = NOTIFY_RETRY_MAX_SECONDS if retry_max is None else retry_max
+
+        self.cond = threading.Condition()
+        self.incoming = []
+        self.incoming_since = None
+        self.urgent = False
+        # 已入队但还没有任何通道发送成功的帖子 id
+        self.pending_ids = set()
+        # (下次重试时间, 序号, _Delivery)
+        self.retries = []
+        self.sending = 0
+        self.sequence = itertools.count()
+        self.thread = None
+        self.stopping = False
+        self.stats = {
+            "enqueued": 0, "batches": 0, "messages_sent": 0, "send_failures": 0, "retries": 0,
+            "delivered_posts": 0, "dropped_posts": 0,
+        }
+
+    # ========== 扫描线程调用 ==========
+
+    def enqueue(self, posts, urgent=False):
+        """把帖子放进发送队列，立即返回实际入队的帖子数（已在排队中的帖子不会重复入队）"""
+        relevant = notifier.relevant_posts(posts)
+        if not relevant:
+            return 0
+        if not self.channels:
+            print("[NOTIFY] No notification channel configured")
+            return 0
+        with self.cond:
+            new = [p for p in relevant if p["id"] not in self.pending_ids]
+            if not new:
+                return 0
+            self.pending_ids.update(p["id"] for p in new)
+            self.incoming.extend(new)
+            if self.incoming_since is None:
+                self.incoming_since = time_module.monotonic()
+            self.urgent = self.urgent or urgent
+            self.stats["enqueued"] += len(new)
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, name="notify-dispatcher", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+        return len(new)
+
+    def is_pending(self, post_id):
+        with self.cond:
+            return post_id in self.pending_ids
+
+    def wait_idle(self, timeout=None):
+        """等待队列、重试和发送中的请求全部结束，返回是否已空闲"""
+        deadline = None if timeout is None else time_module.monotonic() + timeout
+        with self.cond:
+            while self.incoming or self.retries or self.sending:
+                left = None if deadline is None else deadline - time_module.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self.cond.wait(0.1 if left is None else min(left, 0.1))
+            return True
+
+    def stop(self):
+        """
+        立即发送队列中的帖子后停止工作线程；等待重试的发送被放弃，
+        没有任何通道发送成功的帖子交给 on_dropped 保存（重新部署时不会丢通知）
+        """
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+            if self.thread.is_alive():
+                print("[NOTIFY] Dispatcher did not stop within 30s")
+                return
+        with self.cond:
+            abandoned = [entry[2] for entry in self.retries]
+            self.retries = []
+        for delivery in abandoned:
+            print(f"[NOTIFY] {delivery.channel.name} retry abandoned on shutdown")
+            self._finish(delivery, False)
+
+    def get_stats(self):
+        with self.cond:
+            stats = {
+                "queued_posts": len(self.incoming),
+                "pending_posts": len(self.pending_ids),
+                "retry_queue": len(self.retries),
+                "channels": [channel.name for channel in self.channels],
+                **self.stats,
+            }
+        waits = sum(getattr(channel, "rate_limit_waits", 0) for channel in self.channels)
+        stats["telegram_rate_limit_waits"] = waits
+        return stats
+
+    # ========== 工作线程 ==========
+
+    def _run(self):
+        while True:
+            batch = None
+            due = []
+            with self.cond:
+                while True:
+                    now = time_module.monotonic()
+                    flush_at = None
+                    if self.incoming:
+                        flush_at = now if (self.urgent or self.stopping) else self.incoming_since + self.coalesce_seconds
+                    if self.stopping and flush_at is None:
+                        return
+                    wake = min([t for t in (flush_at, self.retries[0][0] if self.retries else None) if t is not None],
+                               default=None)
+                    if wake is not None and wake <= now:
+                        break
+                    self.cond.wait(None if wake is None else wake - now)
+
+                if flush_at is not None and flush_at <= now:
+                    batch = _Batch(self.incoming, len(self.channels))
+                    self.incoming = []
+                    self.incoming_since = None
+                    self.urgent = False
+                    self.stats["batches"] += 1
+                while self.retries and self.retries[0][0] <= now:
+                    due.append(heapq.heappop(self.retries)[2])
+                self.sending += 1
+
+            try:
+                if batch is not None:
+                    print(f"[NOTIFY] Sending {len(batch.posts)} posts to {len(self.channels)} channels")
+                    for channel in self.channels:
+                        self._attempt(_Delivery(batch, channel))
+                for delivery in due:
+                    self._attempt(delivery)
+            finally:
+                with self.cond:
+                    self.sending -= 1
+                    self.cond.notify_all()
+
+    def _attempt(self, delivery):
+        channel = delivery.channel
+        while delivery.messages:
+            try:
+                ok, retry_after = channel.send(delivery.messages[0])
+            except Exception as e:
+                print(f"[NOTIFY] {channel.name} send error: {e}")
+                ok, retry_after = False, None
+            if not ok:
+                break
+            delivery.messages.pop(0)
+            with self.cond:
+                self.stats["messages_sent"] += 1
+
+        if not delivery.messages:
+            self._finish(delivery, True)
+            return
+
+        delivery.attempts += 1
+        with self.cond:
+            self.stats["send_failures"] += 1
+        if delivery.attempts >= self.max_attempts or self.stopping:
+            print(f"[NOTIFY] {channel.name} giving up after {delivery.attempts} attempts")
+            self._finish(delivery, False)
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (delivery.attempts - 1))
+        if retry_after:
+            delay = max(delay, retry_after)
+        print(f"[NOTIFY] {channel.name} failed, retrying in {delay:.1f}s (attempt {delivery.attempts})")
+        with self.cond:
+            heapq.heappush(self.retries, (time_module.monotonic() + delay, next(self.sequence), delivery))
+            self.stats["retries"] += 1
+
+    def _finish(self, delivery, ok):
+        batch = delivery.batch
+        with self.cond:
+            batch.remaining -= 1
+            first_success = ok and not batch.delivered
+            if ok:
+                batch.delivered = True
+            dropped = batch.remaining == 0 and not batch.delivered
+
+        if first_success and self.on_delivered is not None:
+            # 先标记为已通知再移出排队，中间的扫描不会重复通知
+            try:
+                self.on_delivered(batch.posts)
+            except Exception as e:
+                print(f"[NOTIFY] on_delivered callback failed: {e}")
+        if dropped and self.on_dropped is not None:
+            # 先保存再移出排队，下次扫描从保存的队列重新入队
+            try:
+                self.on_dropped(batch.posts)
+            except Exception as e:
+                print(f"[NOTIFY] on_dropped callback failed, {len(batch.posts)} posts lost: {e}")
+        if first_success or dropped:
+            with self.cond:
+                self.pending_ids.difference_update(p["id"] for p in batch.posts)
+                key = "delivered_posts" if first_success else "dropped_posts"
+                self.stats[key] += len(batch.posts)
+            if dropped:
+                saved = "saved for the next scan" if self.on_dropped is not None else "lost"
+                print(f"[NOTIFY] All channels failed for {len(batch.posts)} posts, {saved}")
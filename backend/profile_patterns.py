@@ -0,0 +1,162 @@
+"""
+信号词正则逐条性能分析
+对规则集中每个列表的每条 pattern 在语料上单独计时，报告：
+- 总耗时 / 平均耗时、命中率、最慢的输入
+- 线性时间审计：静态检查（嵌套量词、中间的 .* 等）+ 构造重复输入测量耗时随长度的增长倍数
+- 在整个语料上从未命中的 pattern
+语料默认用 bench_classifier 的合成帖子，也可以传入真实帖子 JSON（如保存下来的 /api/tasks 返回值）。
+
+用法:
+    python profile_patterns.py
+    python profile_patterns.py --corpus posts.json --output pattern_report.json
+    python profile_patterns.py --rules rules.json --only non_tech_signals offer_signals
+"""
+import argparse
+import json
+import re
+import sys
+import time as time_module
+
+from bench_classifier import make_corpus
+from matcher import literal_prefix
+from rules import RULE_LISTS, get_rules, load_rules_file
+
+# 输入长度翻 4 倍时耗时增长超过这个倍数视为非线性（线性约 4 倍，平方约 16 倍）
+SUPERLINEAR_GROWTH = 8.0
+STRESS_LENGTHS = (2000, 8000)
+
+# 量词后面又跟量词的分组，如 (a+)+ (\w*)*
+_NESTED_QUANTIFIER = re.compile(r"\((?:[^()\\]|\\.)*[+*](?:[^()\\]|\\.)*\)[+*{]")
+# 不在结尾的 .* / .+：每个起点都可能扫到文本末尾再回溯
+_INNER_WILDCARD = re.compile(r"\.[*+](?!\??$)")
+
+
+def load_corpus(path):
+    """读取帖子 JSON：帖子列表，或带 posts 字段的对象（API 返回格式）"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("posts", [])
+    return [p for p in data if isinstance(p, dict) and "title" in p]
+
+
+def static_warnings(pattern):
+    warnings = []
+    if _NESTED_QUANTIFIER.search(pattern):
+        warnings.append("nested quantifier")
+    wildcards = len(_INNER_WILDCARD.findall(pattern))
+    if wildcards:
+        warnings.append("unbounded wildcard before more pattern")
+    if len(re.findall(r"\.[*+]", pattern)) >= 2:
+        warnings.append("multiple unbounded wildcards")
+    return warnings
+
+
+def _best_time(regex, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time_module.perf_counter()
+        regex.search(text)
+        elapsed = time_module.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def stress_growth(regex, pattern):
+    """
+    用 pattern 的字面量前缀反复拼接成不会完整命中的长文本，返回长度变为 4 倍时的耗时增长倍数
+    """
+    prefix = literal_prefix(pattern) or "a"
+    unit = prefix + " x "
+    times = []
+    for length in STRESS_LENGTHS:
+        text = (unit * (length // len(unit) + 1))[:length]
+        times.append(_best_time(regex, text))
+    if times[0] <= 0:
+        return 1.0
+    return times[1] / times[0]
+
+
+def profile_patterns(posts, rules, lists=None):
+    texts = [(p.get("id", str(i)), f"{p.get('title', '')} {p.get('text', '')}".lower()) for i, p in enumerate(posts)]
+    report = []
+    for list_name in lists or RULE_LISTS:
+        for pattern in getattr(rules, list_name):
+            regex = re.compile(pattern)
+            total = 0.0
+            matches = 0
+            worst = (0.0, None, 0)
+            for post_id, text in texts:
+                start = time_module.perf_counter()
+                found = regex.search(text)
+                elapsed = time_module.perf_counter() - start
+                total += elapsed
+                if found:
+                    matches += 1
+                if elapsed > worst[0]:
+                    worst = (elapsed, post_id, len(text))
+
+            growth = stress_growth(regex, pattern)
+            flags = static_warnings(pattern)
+            if growth > SUPERLINEAR_GROWTH:
+                flags.append(f"superlinear ({growth:.0f}x time for 4x input)")
+            if matches == 0:
+                flags.append("never matched")
+
+            report.append({
+                "list": list_name,
+                "pattern": pattern,
+                "total_ms": round(total * 1000, 3),
+                "mean_us": round(total / len(texts) * 1e6, 3) if texts else 0.0,
+                "matches": matches,
+                "match_rate": round(matches / len(texts), 4) if texts else 0.0,
+                "worst_us": round(worst[0] * 1e6, 3),
+                "worst_post": worst[1],
+                "worst_length": worst[2],
+                "stress_growth": round(growth, 2),
+                "flags": flags,
+            })
+    report.sort(key=lambda r: r["total_ms"], reverse=True)
+    return report
+
+
+def print_report(report, top):
+    print(f"{'list':<18} {'total ms':>9} {'mean us':>8} {'match%':>7} {'worst us':>9}  pattern")
+    for row in report[:top]:
+        print(f"{row['list']:<18} {row['total_ms']:>9.2f} {row['mean_us']:>8.2f} {row['match_rate'] * 100:>6.1f}% "
+              f"{row['worst_us']:>9.1f}  {row['pattern']}")
+
+    flagged = [row for row in report if row["flags"]]
+    if flagged:
+        print(f"\n{len(flagged)} flagged pattern(s):")
+        for row in flagged:
+            print(f"  [{row['list']}] {row['pattern']}: {', '.join(row['flags'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-pattern cost profile and linear-time audit for signal regexes")
+    parser.add_argument("--corpus", help="posts JSON (list, or object with a 'posts' field); default: synthetic corpus")
+    parser.add_argument("--size", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--seed", type=int, default=42, help="synthetic corpus seed")
+    parser.add_argument("--rules", help="rules JSON to profile instead of the active rule set")
+    parser.add_argument("--only", nargs="+", choices=list(RULE_LISTS), help="profile only these lists")
+    parser.add_argument("--top", type=int, default=20, help="rows to print (sorted by total time)")
+    parser.add_argument("--output", help="save the full report as JSON")
+    args = parser.parse_args(argv)
+
+    posts = load_corpus(args.corpus) if args.corpus else make_corpus(args.size, seed=args.seed)
+    rules = load_rules_file(args.rules) if args.rules else get_rules()
+    print(f"[PROFILE] {len(posts)} posts, rules {rules.version}")
+
+    report = profile_patterns(posts, rules, lists=args.only)
+    print_report(report, args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"rules": rules.summary(), "posts": len(posts), "patterns": report}, f, indent=2)
+        print(f"[PROFILE] Report saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+分类结果的部分排序
+下游通常只看前几名（LLM 只分析 5 个、通知只展示 10 个），不需要对全部结果做完整排序：
+- top_k: 用堆选出前 k 个，O(n log k)
+- RankedView: 堆化后按需弹出，只有真正被读取的前缀才付出排序代价
+两者的结果都与 sorted(items, key=key) 的对应前缀完全一致（相同 key 保持原顺序）。
+"""
+import heapq
+
+# 与 task_classifier.sort_task_results 相同：skill_match 优先，然后越新越靠前
+TASK_CATEGORY_ORDER = {"skill_match": 0, "maybe_match": 1, "irrelevant": 2, "danger": 3}
+
+
+def task_rank_key(post):
+    return (TASK_CATEGORY_ORDER.get(post.get("task_category"), 9), post.get("freshness_minutes", 9999))
+
+
+def demand_rank_key(post):
+    """
+    classify_posts 按 (是否 product_need, 是否 worth_looking, need_score) 降序排列，
+    这里取反成升序 key，供堆使用
+    """
+    category = post["category"]
+    return (category != "product_need", category != "worth_looking", -post["need_score"])
+
+
+def top_k(items, k, key):
+    """返回按 key 升序的前 k 个元素，等同于 sorted(items, key=key)[:k]"""
+    if k <= 0:
+        return []
+    return heapq.nsmallest(k, items, key=key)
+
+
+class RankedView:
+    """
+    惰性排序视图：
+    - top(k) 返回前 k 个
+    - 迭代时按顺序逐个弹出，提前 break 就不会对剩余部分排序
+    - remainder(k) 惰性迭代第 k 名之后的元素
+    """
+
+    def __init__(self, items, key):
+        # 带上原始序号：key 相同时保持原顺序，也避免比较元素本身
+        self._heap = [(key(item), index, item) for index, item in enumerate(items)]
+        heapq.heapify(self._heap)
+        self._sorted = []
+        self._total = len(self._heap)
+
+    def _fill(self, n):
+        while len(self._sorted) < n and self._heap:
+            self._sorted.append(heapq.heappop(self._heap)[2])
+
+    def top(self, k):
+        self._fill(k)
+        return self._sorted[:k]
+
+    def remainder(self, k):
+        index = k
+        while True:
+            self._fill(index + 1)
+            if index >= len(self._sorted):
+                return
+            yield self._sorted[index]
+            index += 1
+
+    def __iter__(self):
+        return self.remainder(0)
+
+    def __len__(self):
+        return self._total
@@ -0,0 +1,290 @@
+"""
+Reddit HTTP 传输层
+- 按 host 复用连接池（requests.Session + keep-alive），避免每次请求重新握手
+- 令牌桶限流，根据 Reddit 返回的 X-Ratelimit-Remaining / X-Ratelimit-Reset 动态调整速率
+- 遇到 429 时按 Retry-After 退避重试
+- 同时支持 OAuth (oauth.reddit.com) 和匿名 (www.reddit.com) 两种访问方式
+"""
+import os
+import threading
+import time as time_module
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from response_cache import get_cached_response, store_response
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# 连接池 / 限流配置
+POOL_SIZE = int(os.getenv("REDDIT_POOL_SIZE", "8"))
+MAX_RETRIES = int(os.getenv("REDDIT_MAX_RETRIES", "3"))
+# 收到限流响应头之前使用的初始速率（次/秒）
+REQUESTS_PER_SECOND = float(os.getenv("REDDIT_REQUESTS_PER_SECOND", "1.0"))
+# 允许的突发请求数
+RATE_BURST = float(os.getenv("REDDIT_RATE_BURST", "5"))
+
+# Reddit listing 单页最多 100 条
+PAGE_SIZE = 100
+
+TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+
+_TOKEN_CACHE = {
+    "access_token": None,
+    "expires_at": 0,
+}
+_TOKEN_LOCK = threading.Lock()
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class RateLimitBucket:
+    """
+    令牌桶：每个请求消耗 1 个令牌，令牌按 refill_rate 持续补充。
+    Reddit 响应头会告诉我们当前窗口剩余多少次、多少秒后重置，
+    据此把剩余额度均匀分摊到窗口内，而不是用固定的 sleep。
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time_module.monotonic()
+        self.paused_until = 0.0
+        self.remaining = None
+        self.reset_seconds = None
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """预定一个令牌，必要时阻塞到令牌可用"""
+        with self.lock:
+            now = time_module.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate if self.rate > 0 else 1.0
+            wait = max(wait, self.paused_until - now)
+        if wait > 0:
+            time_module.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """根据 X-Ratelimit-* 响应头调整速率"""
+        remaining = _parse_float(headers.get("X-Ratelimit-Remaining"))
+        reset = _parse_float(headers.get("X-Ratelimit-Reset"))
+        if remaining is None or reset is None:
+            return
+        with self.lock:
+            now = time_module.monotonic()
+            self._refill(now)
+            self.remaining = remaining
+            self.reset_seconds = reset
+            reset = max(reset, 1.0)
+            if remaining < 1:
+                # 本窗口额度已用完，暂停到窗口重置
+                self.paused_until = max(self.paused_until, now + reset)
+                self.tokens = min(self.tokens, 0)
+                self.rate = 1.0 / reset
+            else:
+                self.rate = remaining / reset
+                # 桶里的令牌不能超过服务器告诉我们的剩余额度
+                self.tokens = min(self.tokens, remaining)
+
+    def pause(self, seconds):
+        """收到 429 后暂停发送"""
+        with self.lock:
+            now = time_module.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = min(self.tokens, 0)
+            self.throttled += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rate_per_second": round(self.rate, 3),
+                "tokens": round(self.tokens, 2),
+                "remaining": self.remaining,
+                "reset_seconds": self.reset_seconds,
+                "paused_for": round(max(0.0, self.paused_until - time_module.monotonic()), 2),
+                "throttled": self.throttled,
+            }
+
+
+# OAuth 和匿名访问的配额是分开计算的
+_BUCKETS = {
+    "oauth": RateLimitBucket("oauth", REQUESTS_PER_SECOND, RATE_BURST),
+    "anonymous": RateLimitBucket("anonymous", REQUESTS_PER_SECOND, RATE_BURST),
+}
+
+
+def _parse_float(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_headers():
+    ua = os.getenv("REDDIT_USER_AGENT", DEFAULT_USER_AGENT)
+    return {"User-Agent": ua}
+
+
+def get_session(host):
+    """每个 host 一个 Session，复用 keep-alive 连接"""
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSIONS[host] = session
+        return session
+
+
+def _auth_mode(url):
+    return "oauth" if urlsplit(url).hostname == "oauth.reddit.com" else "anonymous"
+
+
+def _retry_delay(response, attempt):
+    retry_after = _parse_float(response.headers.get("Retry-After"))
+    if retry_after is not None:
+        return retry_after
+    reset = _parse_float(response.headers.get("X-Ratelimit-Reset"))
+    if reset is not None:
+        return reset
+    return min(2 ** attempt, 60)
+
+
+def reddit_get(url, params=None, headers=None, timeout=15, use_cache=True):
+    """
+    通过共享连接池发送 GET 请求，受令牌桶限流。
+    429 会按 Retry-After 退避后重试，最终仍返回 response，由调用方 raise_for_status。
+    开启本地缓存时，命中缓存的请求不会访问 Reddit，也不消耗限流额度。
+    """
+    auth_mode = _auth_mode(url)
+    if use_cache:
+        cached = get_cached_response(url, params, auth_mode)
+        if cached is not None:
+            return cached
+
+    bucket = _BUCKETS[auth_mode]
+    session = get_session(urlsplit(url).hostname)
+    if headers is None:
+        headers = get_headers()
+
+    attempt = 0
+    while True:
+        bucket.acquire()
+        response = session.get(url, headers=headers, params=params, timeout=timeout)
+        bucket.update_from_headers(response.headers)
+        if response.status_code != 429 or attempt >= MAX_RETRIES:
+            if use_cache:
+                store_response(url, params, auth_mode, response)
+            return response
+        delay = _retry_delay(response, attempt)
+        print(f"[REDDIT] 429 from {urlsplit(url).hostname}, backing off {delay:.1f}s")
+        bucket.pause(delay)
+        attempt += 1
+
+
+def get_oauth_token(debug_errors=None):
+    client_id = os.getenv("REDDIT_CLIENT_ID")
+    client_secret = os.getenv("REDDIT_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        return None
+
+    # 加锁，避免并发扫描时多个线程同时去换 token
+    with _TOKEN_LOCK:
+        now = time_module.time()
+        if _TOKEN_CACHE["access_token"] and now < (_TOKEN_CACHE["expires_at"] - 30):
+            return _TOKEN_CACHE["access_token"]
+
+        try:
+            resp = get_session(urlsplit(TOKEN_URL).hostname).post(
+                TOKEN_URL,
+                auth=(client_id, client_secret),
+                data={"grant_type": "client_credentials"},
+                headers=get_headers(),
+                timeout=15,
+            )
+            resp.raise_for_status()
+            payload = resp.json()
+            access_token = payload.get("access_token")
+            expires_in = int(payload.get("expires_in", 0) or 0)
+            if not access_token or expires_in <= 0:
+                raise requests.RequestException(f"Missing access_token in response: {payload}")
+
+            _TOKEN_CACHE["access_token"] = access_token
+            _TOKEN_CACHE["expires_at"] = now + expires_in
+            return access_token
+        except requests.RequestException as e:
+            if debug_errors is not None:
+                debug_errors.append({
+                    "subreddit": None,
+                    "url": TOKEN_URL,
+                    "status": getattr(getattr(e, "response", None), "status_code", None),
+                    "error": f"oauth_token_error: {str(e)}",
+                })
+            print(f"[REDDIT] OAuth token fetch failed: {e}")
+            return None
+
+
+def resolve_api_url(path, debug_errors=None):
+    """
+    根据是否配置了 OAuth 凭证，返回 (url, headers)
+    - OAuth: https://oauth.reddit.com{path}
+    - 匿名:  https://www.reddit.com{path}.json
+    """
+    token = get_oauth_token(debug_errors=debug_errors)
+    headers = get_headers()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+        return f"https://oauth.reddit.com{path}", headers
+    return f"https://www.reddit.com{path}.json", headers
+
+
+def iter_listing(url, params=None, limit=100, headers=None, timeout=15, page_size=PAGE_SIZE):
+    """
+    按 after 游标翻页读取 Reddit listing，每页 yield 一次原始 children 列表，
+    直到拿够 limit 条或 listing 没有下一页。内存中只保留当前这一页。
+    page_size 可以调小，适合只关心最新几条的增量扫描。
+    请求失败时抛出 requests 异常，之前已经 yield 的页不受影响。
+    """
+    params = dict(params or {})
+    fetched = 0
+    after = None
+    while fetched < limit:
+        page_params = {**params, "limit": min(limit - fetched, page_size, PAGE_SIZE)}
+        if after:
+            page_params["after"] = after
+            page_params["count"] = fetched
+        response = reddit_get(url, headers=headers, params=page_params, timeout=timeout)
+        response.raise_for_status()
+        listing = response.json().get("data", {})
+
+        children = listing.get("children", [])
+        fetched += len(children)
+        yield children
+
+        after = listing.get("after")
+        if not after or not children:
+            break
+
+
+def get_rate_limit_stats():
+    return {name: bucket.stats() for name, bucket in _BUCKETS.items()}
@@ -1,117 +1,156 @@
 import requests
-import time as time_module
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-}
+from reddit_client import iter_listing, reddit_get, resolve_api_url
+from models import Post
 
-def validate_post_url(post_id, timeout=5):
+# /api/info 单次最多查询 100 个 fullname
+INFO_BATCH_SIZE = 100
+
+
+def _post_status(post_data):
+    """根据 /api/info 返回的帖子数据判断状态: ok / removed / deleted"""
+    removed_by = post_data.get("removed_by_category")
+    selftext = post_data.get("selftext", "")
+    if removed_by == "deleted" or (post_data.get("author") == "[deleted]" and selftext == "[deleted]"):
+        return "deleted"
+    if removed_by or post_data.get("removed") or selftext == "[removed]":
+        return "removed"
+    return "ok"
+
+
+def fetch_post_status(post_ids, timeout=10):
     """
-    验证帖子是否有效（使用 Reddit JSON API）
+    通过 /api/info 批量查询帖子状态，每 100 个帖子只需要一次请求
+    返回 {post_id: "ok" / "removed" / "deleted" / "missing"}
+    请求失败的批次不会出现在结果中
     """
-    try:
-        # 使用 Reddit JSON API 检查帖子是否存在
-        url = f"https://www.reddit.com/comments/{post_id}.json"
-        response = requests.get(url, headers=HEADERS, timeout=timeout)
-        if response.status_code == 200:
+    statuses = {}
+    post_ids = list(dict.fromkeys(post_ids))
+    for i in range(0, len(post_ids), INFO_BATCH_SIZE):
+        batch = post_ids[i:i + INFO_BATCH_SIZE]
+        url, headers = resolve_api_url("/api/info")
+        params = {"id": ",".join(f"t3_{post_id}" for post_id in batch)}
+        try:
+            response = reddit_get(url, headers=headers, params=params, timeout=timeout)
+            response.raise_for_status()
             data = response.json()
-            # 检查是否是有效的帖子数据
-            if data and len(data) > 0:
-                return True
-        return False
-    except requests.RequestException:
-        return False
+        except (requests.RequestException, ValueError) as e:
+            print(f"[DEBUG] /api/info lookup failed for {len(batch)} posts: {e}")
+            continue
+
+        for item in data.get("data", {}).get("children", []):
+            post_data = item.get("data", {})
+            if item.get("kind") == "t3" and post_data.get("id"):
+                statuses[post_data["id"]] = _post_status(post_data)
+        for post_id in batch:
+            statuses.setdefault(post_id, "missing")
+    return statuses
+
+
+def validate_post_url(post_id, timeout=5):
+    """
+    验证帖子是否有效（未删除、未被移除）
+    """
+    return fetch_post_status([post_id], timeout=timeout).get(post_id) == "ok"
 
 def scrape_subreddit(subreddit_name, keyword, limit, time_filter):
     """
-    使用 Reddit 公开 JSON API 抓取帖子，无需 API 凭证
+    使用 Reddit JSON API 抓取帖子，配置了 OAuth 凭证时走 oauth.reddit.com，否则使用公开 JSON API
+    limit 超过 100 时自动按 after 游标翻页
     """
-    # 使用 www.reddit.com 的 JSON API
-    url = f"https://www.reddit.com/r/{subreddit_name}/search.json"
+    posts = []
+    for page in iter_subreddit_posts(subreddit_name, keyword, limit, time_filter):
+        posts.extend(page)
+
+    print(f"[DEBUG] Returning {len(posts)} valid posts")
+    return posts
+
+def iter_subreddit_posts(subreddit_name, keyword, limit, time_filter):
+    """
+    按页抓取帖子的生成器，每拿到一页（最多 100 条）就 yield 一次，
+    调用方可以在后续页面下载时先处理第一页
+    """
+    url, headers = resolve_api_url(f"/r/{subreddit_name}/search")
     params = {
         "q": keyword,
         "restrict_sr": "on",  # 限制在该 subreddit 内搜索
         "sort": "relevance",
         "t": time_filter,     # hour, day, week, month, year, all
-        "limit": min(limit, 100),  # Reddit 单次最多返回 100 条
         "type": "link",       # 只搜索帖子，不包括评论
     }
     
     try:
-        response = requests.get(url, headers=HEADERS, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
+        for children in iter_listing(url, params=params, limit=limit, headers=headers, timeout=15):
+            print(f"[DEBUG] Found {len(children)} posts from Reddit API")
+            posts = []
+            for item in children:
+                post = _normalize_post(item, subreddit_name)
+                if post is not None:
+                    posts.append(post)
+            yield posts
     except requests.RequestException as e:
         print(f"Reddit API request failed: {e}")
-        return []
+
+def _normalize_post(item, subreddit_name):
+    """把 listing 中的一条记录转换成帖子 dict，无效帖子返回 None"""
+    # 确保是帖子类型 (t3 = link/post)
+    if item.get("kind") != "t3":
+        return None
+        
+    post_data = item.get("data", {})
     
-    posts = []
-    children = data.get("data", {}).get("children", [])
+    # 跳过已删除或已移除的帖子
+    if post_data.get("removed_by_category") or post_data.get("removed"):
+        print(f"[DEBUG] Skipping removed post: {post_data.get('id')}")
+        return None
     
-    print(f"[DEBUG] Found {len(children)} posts from Reddit API")
+    # 获取必要字段，确保数据完整性
+    post_id = post_data.get("id", "")
+    title = post_data.get("title", "")
+    permalink = post_data.get("permalink", "")
     
-    for item in children:
-        # 确保是帖子类型 (t3 = link/post)
-        if item.get("kind") != "t3":
-            continue
-            
-        post_data = item.get("data", {})
-        
-        # 跳过已删除或已移除的帖子
-        if post_data.get("removed_by_category") or post_data.get("removed"):
-            print(f"[DEBUG] Skipping removed post: {post_data.get('id')}")
-            continue
-        
-        # 获取必要字段，确保数据完整性
-        post_id = post_data.get("id", "")
-        title = post_data.get("title", "")
-        permalink = post_data.get("permalink", "")
-        
-        if not post_id or not title or not permalink:
-            print(f"[DEBUG] Skipping incomplete post: id={post_id}")
-            continue
-        
-        # 构建正确的 URL
-        post_url = f"https://www.reddit.com{permalink}"
-        
-        # 构建帖子对象，确保所有字段来自同一个 post_data
-        post = {
-            "id": post_id,
-            "title": title,
-            "text": post_data.get("selftext", "")[:500],
-            "score": post_data.get("score", 0),
-            "num_comments": post_data.get("num_comments", 0),
-            "url": post_url,
-            "created": post_data.get("created_utc", 0),
-            "subreddit": post_data.get("subreddit", subreddit_name),
-            "author": post_data.get("author", "[deleted]"),
-        }
-        
-        posts.append(post)
-        
-        # 安全打印，避免 Windows 控制台 Unicode 错误
-        try:
-            print(f"[DEBUG] Added post: {post_id} - {title[:50]}...")
-        except UnicodeEncodeError:
-            print(f"[DEBUG] Added post: {post_id} - (title contains special chars)")
+    if not post_id or not title or not permalink:
+        print(f"[DEBUG] Skipping incomplete post: id={post_id}")
+        return None
     
-    print(f"[DEBUG] Returning {len(posts)} valid posts")
-    return posts
+    # 构建正确的 URL
+    post_url = f"https://www.reddit.com{permalink}"
+    
+    # 构建帖子对象，确保所有字段来自同一个 post_data
+    post = Post(
+        id=post_id,
+        title=title,
+        text=post_data.get("selftext", "")[:500],
+        score=post_data.get("score", 0),
+        num_comments=post_data.get("num_comments", 0),
+        url=post_url,
+        created=post_data.get("created_utc", 0),
+        subreddit=post_data.get("subreddit", subreddit_name),
+        author=post_data.get("author", "[deleted]"),
+    )
+    
+    # 安全打印，避免 Windows 控制台 Unicode 错误
+    try:
+        print(f"[DEBUG] Added post: {post_id} - {title[:50]}...")
+    except UnicodeEncodeError:
+        print(f"[DEBUG] Added post: {post_id} - (title contains special chars)")
+    
+    return post
 
-def verify_posts(posts, max_verify=10):
+def verify_posts(posts, max_verify=None):
     """
-    验证帖子链接是否有效（可选，对前 N 个帖子进行验证）
+    验证帖子链接是否有效（批量查询 /api/info，默认验证全部帖子）
+    - max_verify: 只验证前 N 个帖子，None 表示全部验证
+    查询失败的帖子按有效处理，不会被丢弃
     """
+    to_verify = posts if max_verify is None else posts[:max_verify]
+    statuses = fetch_post_status([post["id"] for post in to_verify])
+
     verified = []
-    for i, post in enumerate(posts):
-        if i < max_verify:
-            if validate_post_url(post["id"]):
-                verified.append(post)
-            else:
-                print(f"[DEBUG] Invalid post: {post['id']}")
-            # 避免请求过快
-            time_module.sleep(0.3)
-        else:
-            # 超过验证数量的帖子直接添加
+    for post in posts:
+        status = statuses.get(post["id"], "ok")
+        if status == "ok":
             verified.append(post)
+        else:
+            print(f"[DEBUG] Invalid post ({status}): {post['id']}")
     return verified
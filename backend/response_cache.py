@@ -0,0 +1,198 @@
+"""
+Reddit 响应本地缓存（可选，REDDIT_CACHE_ENABLED=true 开启）
+- 以 URL + 参数 + 访问方式（OAuth / 匿名）为 key，存到本地 SQLite
+- 按接口类型设置不同 TTL：搜索结果较短，/api/info 验证结果较长
+- 超过条目上限时按最近访问时间做 LRU 淘汰
+- 记录命中 / 未命中次数
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time as time_module
+from urllib.parse import urlsplit
+
+CACHE_ENABLED = os.getenv("REDDIT_CACHE_ENABLED", "false").lower() == "true"
+CACHE_PATH = os.getenv(
+    "REDDIT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reddit_cache.sqlite3"),
+)
+CACHE_MAX_ENTRIES = int(os.getenv("REDDIT_CACHE_MAX_ENTRIES", "2000"))
+
+# 各类接口的缓存时间（秒）
+CACHE_TTL = {
+    "search": int(os.getenv("REDDIT_CACHE_TTL_SEARCH", "60")),
+    "info": int(os.getenv("REDDIT_CACHE_TTL_INFO", "600")),
+    "comments": int(os.getenv("REDDIT_CACHE_TTL_COMMENTS", "300")),
+    "listing": int(os.getenv("REDDIT_CACHE_TTL_LISTING", "60")),
+}
+
+
+class CachedResponse:
+    """从缓存读出的响应，提供与 requests.Response 相同的常用接口"""
+
+    status_code = 200
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        return None
+
+
+class ResponseCache:
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                url TEXT NOT NULL,
+                body TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time_module.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, body, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            url, body, expires_at = row
+            if expires_at <= now:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+            return CachedResponse(url, body)
+
+    def put(self, key, endpoint, url, body):
+        ttl = self.ttl.get(endpoint, 0)
+        if ttl <= 0:
+            return
+        now = time_module.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, url, body, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, url, body, now + ttl, now),
+            )
+            self.stats["stores"] += 1
+            count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                # LRU：淘汰最久没被访问的条目
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.stats["evictions"] += overflow
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            return count
+
+    def get_stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = entries
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _get_cache():
+    global _CACHE
+    if not CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(CACHE_PATH, CACHE_MAX_ENTRIES, CACHE_TTL)
+        return _CACHE
+
+
+def endpoint_type(url):
+    """根据 URL 路径判断接口类型，用于选择 TTL"""
+    path = urlsplit(url).path
+    if path.startswith("/api/info"):
+        return "info"
+    if path.startswith("/comments/"):
+        return "comments"
+    if "/search" in path:
+        return "search"
+    return "listing"
+
+
+def cache_key(url, params, auth_mode):
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    raw = json.dumps([auth_mode, url, items], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached_response(url, params, auth_mode):
+    """命中则返回 CachedResponse，否则返回 None"""
+    cache = _get_cache()
+    if cache is None:
+        return None
+    return cache.get(cache_key(url, params, auth_mode))
+
+
+def store_response(url, params, auth_mode, response):
+    """只缓存 200 且是合法 JSON 的响应"""
+    cache = _get_cache()
+    if cache is None or response.status_code != 200:
+        return
+    body = response.text
+    try:
+        json.loads(body)
+    except ValueError:
+        return
+    cache.put(cache_key(url, params, auth_mode), endpoint_type(url), url, body)
+
+
+def get_cache_stats():
+    cache = _get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+def clear_response_cache():
+    cache = _get_cache()
+    if cache is None:
+        return 0
+    return cache.clear()
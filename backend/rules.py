@@ -0,0 +1,242 @@
+"""
+分类规则集（信号词 / 预算正则）的加载与热更新
+- 默认使用 classifier.py / task_classifier.py 中内置的规则列表
+- 设置 RULES_FILE 后从 JSON 文件加载，文件修改后自动重新加载（按 mtime 检查，不需要重新部署）
+- 每个版本编译成一个不可变的 RuleSet，加载成功后整体替换；加载失败则继续使用当前版本
+- 分类函数在开始时取一次 RuleSet，整个扫描都用这个版本，中途替换不影响正在进行的扫描
+
+规则文件格式（缺少的列表使用内置规则）:
+    {
+        "version": "2026-10-17.1",
+        "need_signals": ["i wish there was", ...],
+        "personal_signals": [...],
+        "skill_signals": [...],
+        "danger_signals": [...],
+        "offer_signals": [...],
+        "non_tech_signals": [...],
+        "budget_patterns": [...]
+    }
+
+导出内置规则作为起点: python rules.py export rules.json
+检查规则文件: python rules.py check rules.json
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time as time_module
+
+from classification_cache import rules_hash
+from matcher import SignalMatcher
+
+RULES_FILE = os.getenv("RULES_FILE", "")
+# 最多每隔几秒检查一次规则文件的 mtime
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "5"))
+
+# 规则文件中的 key -> (内置规则所在模块, 变量名)
+RULE_LISTS = {
+    "need_signals": ("classifier", "NEED_SIGNALS"),
+    "personal_signals": ("classifier", "PERSONAL_SIGNALS"),
+    "skill_signals": ("task_classifier", "SKILL_MATCH_SIGNALS"),
+    "danger_signals": ("task_classifier", "DANGER_SIGNALS"),
+    "offer_signals": ("task_classifier", "OFFER_SIGNALS"),
+    "non_tech_signals": ("task_classifier", "NON_TECH_SIGNALS"),
+    "budget_patterns": ("task_classifier", "BUDGET_PATTERNS"),
+}
+
+
+class RuleSet:
+    """
+    一个版本的全部规则，创建后不可修改
+    - 各规则列表为 tuple
+    - demand_matcher / task_matcher: 预编译的 SignalMatcher
+    - hash: 规则内容哈希（分类结果缓存用）
+    """
+
+    __slots__ = tuple(RULE_LISTS) + ("version", "source", "hash", "loaded_at", "demand_matcher", "task_matcher")
+
+    def __init__(self, lists, version=None, source="builtin"):
+        values = {}
+        for key in RULE_LISTS:
+            values[key] = tuple(lists[key])
+        values["hash"] = rules_hash(*(values[key] for key in RULE_LISTS))
+        values["version"] = version or f"{source}-{values['hash'][:8]}"
+        values["source"] = source
+        values["loaded_at"] = time_module.time()
+        values["demand_matcher"] = SignalMatcher({
+            "need": values["need_signals"],
+            "personal": values["personal_signals"],
+        })
+        values["task_matcher"] = SignalMatcher(
+            {
+                "skill": values["skill_signals"],
+                "danger": values["danger_signals"],
+                "offer": values["offer_signals"],
+                "non_tech": values["non_tech_signals"],
+            },
+            extractors={"budget": values["budget_patterns"]},
+        )
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSet is immutable")
+
+    def to_dict(self):
+        return {"version": self.version, **{key: list(getattr(self, key)) for key in RULE_LISTS}}
+
+    def summary(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "hash": self.hash,
+            "loaded_at": int(self.loaded_at),
+            "counts": {key: len(getattr(self, key)) for key in RULE_LISTS},
+        }
+
+
+def builtin_lists():
+    """内置规则列表（延迟导入，避免与分类器模块循环导入）"""
+    import importlib
+
+    return {
+        key: getattr(importlib.import_module(module), name)
+        for key, (module, name) in RULE_LISTS.items()
+    }
+
+
+def load_rules_file(path):
+    """
+    读取并校验规则文件，返回 RuleSet
+    格式错误或正则无法编译时抛出 ValueError
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError("rules file must contain a JSON object")
+
+    unknown = set(data) - set(RULE_LISTS) - {"version"}
+    if unknown:
+        raise ValueError(f"unknown keys: {sorted(unknown)}")
+
+    lists = builtin_lists()
+    for key in RULE_LISTS:
+        if key not in data:
+            continue
+        patterns = data[key]
+        if not isinstance(patterns, list) or not all(isinstance(p, str) and p for p in patterns):
+            raise ValueError(f"{key} must be a list of non-empty strings")
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"{key}: invalid pattern {pattern!r}: {e}") from None
+        lists[key] = patterns
+
+    version = data.get("version")
+    if version is not None and not isinstance(version, (str, int, float)):
+        raise ValueError("version must be a string")
+    return RuleSet(lists, version=str(version) if version is not None else None, source="file")
+
+
+_ACTIVE = None
+_LOCK = threading.Lock()
+_STATE = {"file_mtime": None, "last_check": 0.0, "last_error": None, "reloads": 0}
+
+
+def get_rules():
+    """
+    返回当前生效的 RuleSet。调用方在一次扫描开始时取一次，之后一直用这个对象。
+    """
+    rules = _ACTIVE
+    if rules is not None and (
+        not RULES_FILE or time_module.monotonic() - _STATE["last_check"] < RULES_CHECK_INTERVAL
+    ):
+        return rules
+    with _LOCK:
+        _refresh(force=False)
+        return _ACTIVE
+
+
+def reload_rules():
+    """立即重新读取规则文件（不管 mtime 是否变化），返回当前生效版本的信息"""
+    with _LOCK:
+        _refresh(force=True)
+    return get_rules_info()
+
+
+def _refresh(force):
+    global _ACTIVE
+    _STATE["last_check"] = time_module.monotonic()
+    if _ACTIVE is None:
+        _ACTIVE = RuleSet(builtin_lists())
+    if not RULES_FILE:
+        return
+
+    try:
+        stat = os.stat(RULES_FILE)
+    except OSError as e:
+        _STATE["last_error"] = f"cannot read {RULES_FILE}: {e}"
+        return
+    mtime = (stat.st_mtime_ns, stat.st_size)
+    if mtime == _STATE["file_mtime"] and not force:
+        return
+    # 不管成功与否都记下 mtime，损坏的文件不会被反复解析
+    _STATE["file_mtime"] = mtime
+
+    try:
+        rules = load_rules_file(RULES_FILE)
+    except (OSError, ValueError) as e:
+        _STATE["last_error"] = str(e)
+        print(f"[RULES] Failed to load {RULES_FILE}, keeping version {_ACTIVE.version}: {e}")
+        return
+
+    # 整体替换引用：已经拿到旧 RuleSet 的扫描不受影响
+    previous = _ACTIVE
+    _ACTIVE = rules
+    _STATE["last_error"] = None
+    _STATE["reloads"] += 1
+    print(f"[RULES] Loaded rules {rules.version} from {RULES_FILE} (was {previous.version})")
+
+
+def get_rules_info():
+    rules = get_rules()
+    return {
+        **rules.summary(),
+        "rules_file": RULES_FILE or None,
+        "reloads": _STATE["reloads"],
+        "last_error": _STATE["last_error"],
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 1 and argv[0] == "export":
+        data = RuleSet(builtin_lists()).to_dict()
+        data["version"] = time_module.strftime("%Y-%m-%d") + ".1"
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        if len(argv) >= 2:
+            with open(argv[1], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            print(f"[RULES] Built-in rules written to {argv[1]}")
+        else:
+            print(text)
+        return 0
+    if len(argv) == 2 and argv[0] == "check":
+        try:
+            rules = load_rules_file(argv[1])
+        except (OSError, ValueError) as e:
+            print(f"[RULES] Invalid rules file: {e}")
+            return 1
+        print(json.dumps(rules.summary(), indent=2))
+        return 0
+    print("usage: python rules.py export [path] | check <path>")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""
+本地数据文件（SQLite 等）的默认位置
+Railway 挂载 volume 后会设置 RAILWAY_VOLUME_MOUNT_PATH；应用目录在每次重新部署时都会被替换，
+存在那里的数据（已通知记录、付费得到的 LLM 分析结果）都会丢失。
+- data_path(filename): 挂载了 volume 时放在 volume 下，否则放在 backend/ 目录下
+- persistence_warning(path): path 不在持久化存储上时返回警告文字
+"""
+import os
+
+RAILWAY_VOLUME_MOUNT_PATH = os.getenv("RAILWAY_VOLUME_MOUNT_PATH", "")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def data_path(filename):
+    return os.path.join(RAILWAY_VOLUME_MOUNT_PATH or APP_DIR, filename)
+
+
+def persistence_warning(path):
+    """path 不在持久化存储上时返回警告文字，否则返回 None"""
+    if path == ":memory:":
+        return "the database is in memory"
+    path = os.path.abspath(path)
+    if RAILWAY_VOLUME_MOUNT_PATH:
+        volume = os.path.abspath(RAILWAY_VOLUME_MOUNT_PATH)
+        if os.path.commonpath([path, volume]) != volume:
+            return f"{path} is outside the Railway volume {volume}"
+        return None
+    if os.path.commonpath([path, APP_DIR]) == APP_DIR:
+        return f"{path} is inside the app directory, which is replaced on every redeploy"
+    return None
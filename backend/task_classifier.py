@@ -4,6 +4,13 @@ TASK 帖子技能匹配分类器
 """
 import re
 
+from classification_cache import get_cached, store_cached
+from models import TaskPost
+from ranking import TASK_CATEGORY_ORDER, task_rank_key, top_k as select_top_k
+from rules import get_rules
+
+# 内置规则（未设置 RULES_FILE 时使用，见 rules.py）
+
 # ========== 技能匹配信号词 ==========
 SKILL_MATCH_SIGNALS = [
     r"scrap(e|ing|er)",
@@ -134,6 +141,10 @@ BUDGET_PATTERNS = [
 ]
 
 
+# 缓存的字段（只依赖 title / text / flair），freshness 每次重新计算
+_SCORED_FIELDS = ("task_category", "confidence", "skill_score", "danger_score", "skill_matches", "danger_matches", "budget")
+
+
 def score_text(text, patterns):
     text_lower = text.lower()
     score = 0
@@ -145,21 +156,129 @@ def score_text(text, patterns):
     return score, matched
 
 
-def extract_budget(text):
+def extract_budget(text, rules=None):
     """从帖子文本中提取预算金额"""
-    text_lower = text.lower()
+    if rules is None:
+        rules = get_rules()
+    return _max_budget(rules.task_matcher.match(text)["budget"])
+
+
+def _max_budget(candidates):
     budgets = []
-    for pattern in BUDGET_PATTERNS:
-        matches = re.findall(pattern, text_lower)
-        for m in matches:
-            try:
-                budgets.append(float(m))
-            except ValueError:
-                pass
+    for m in candidates:
+        try:
+            budgets.append(float(m))
+        except ValueError:
+            pass
     return max(budgets) if budgets else None
 
 
-def classify_task_posts(posts):
+def classify_task_post(post, rules=None):
+    """
+    对单个 TASK 帖子进行技能匹配分类，返回 TaskPost，增加的字段见 classify_task_posts
+    文本和规则都没变的帖子直接复用缓存的打分结果，只重新计算 freshness
+    """
+    from task_scraper import get_freshness_label
+
+    if rules is None:
+        rules = get_rules()
+    # 分类字段直接写在记录上，不复制帖子内容
+    result = TaskPost.from_post(post)
+
+    scored, digest = get_cached("task", result, rules.hash)
+    if scored is None:
+        scored = _score_task_post(result, rules)
+        store_cached("task", result, digest, rules.hash, scored)
+
+    for name, value in zip(_SCORED_FIELDS, scored):
+        setattr(result, name, value)
+    result.freshness_label, result.freshness_minutes = get_freshness_label(result.created)
+    result.rule_version = rules.version
+    return result
+
+
+def _score_task_post(post, rules):
+    """正则打分部分，返回与 _SCORED_FIELDS 顺序一致的元组"""
+    full_text = f"{post.title} {post.text}"
+
+    # 过滤掉 [For Hire] / [OFFER] 帖子（其他 freelancer 的广告，不是客户需求）
+    title_lower = post.title.lower()
+    flair = post.get("flair", "").lower()
+
+    is_offer_post = (
+        "[for hire]" in title_lower
+        or "[offer]" in title_lower
+        or "for hire" in flair
+        or "offer" in flair
+    )
+
+    if is_offer_post:
+        return ("irrelevant", 0.1, 0, 0, [], [], None)
+
+    # 一次匹配拿到所有信号组的命中和预算候选
+    hits = rules.task_matcher.match(full_text)
+    skill_matches = hits["skill"]
+    danger_matches = hits["danger"]
+    skill_score = len(skill_matches)
+    danger_score = len(danger_matches)
+
+    budget = _max_budget(hits["budget"])
+
+    # 判断 flair 是否是 [TASK] 类型（加分）
+    is_task_flair = "task" in flair or "hiring" in flair or "job" in flair
+
+    if is_task_flair:
+        skill_score += 1
+
+    # 检查是否是其他 freelancer 的推销帖 / 非技术类任务
+    offer_score = len(hits["offer"])
+    non_tech_score = len(hits["non_tech"])
+
+    # 分类逻辑
+    if danger_score > 0:
+        task_category = "danger"
+        confidence = min(danger_score / 3, 1.0)
+    elif offer_score >= 1:
+        task_category = "irrelevant"
+        confidence = 0.8
+    elif non_tech_score >= 1 and skill_score <= 1:
+        task_category = "irrelevant"
+        confidence = 0.6
+    elif skill_score >= 2:
+        task_category = "skill_match"
+        confidence = min(skill_score / 5, 1.0)
+    elif skill_score == 1:
+        task_category = "maybe_match"
+        confidence = 0.4
+    else:
+        task_category = "irrelevant"
+        confidence = 0.2
+
+    return (task_category, round(confidence, 2), skill_score, danger_score, skill_matches, danger_matches, budget)
+
+
+def iter_classify_task_posts(posts, rules=None):
+    """
+    流式分类：逐个消费帖子（可以是正在抓取中的生成器），每分类完一个立即 yield，
+    不排序、不做 LLM 分析。需要排序时对收集到的结果调用 sort_task_results。
+    开始时取一次 RuleSet，扫描过程中规则文件更新也不会混用两个版本。
+    """
+    if rules is None:
+        rules = get_rules()
+    for post in posts:
+        yield classify_task_post(post, rules)
+
+
+def sort_task_results(results):
+    """原地排序并返回: skill_match 优先, 然后按新鲜度排序（越新越靠前）"""
+    results.sort(key=lambda x: (
+        TASK_CATEGORY_ORDER.get(x.task_category, 9),
+        x.freshness_minutes,  # 越小越新
+    ))
+    return results
+
+
+def classify_task_posts(posts, top_k=None, rules=None, enrich=True):
     """
     对 TASK 帖子进行技能匹配分类
     返回分类后的帖子列表，每个帖子增加:
@@ -171,102 +290,24 @@ def classify_task_posts(posts):
     - budget: 提取到的预算金额 (可选)
     - freshness_label: 新鲜度标签
     - freshness_minutes: 距离发布的分钟数
+    - rule_version: 产生该结果的规则集版本
+    top_k: 只需要前 k 名时传入，用堆选择代替完整排序（LLM 仍然从全部结果中挑选候选）
+    rules: 使用的 RuleSet，默认取当前生效版本
+    enrich: False 时只做正则分类，LLM 分析由调用方另行安排（见 llm_jobs）
     """
-    from task_scraper import get_freshness_label
+    results = list(iter_classify_task_posts(posts, rules))
+    if top_k is not None:
+        ranked = select_top_k(results, top_k, task_rank_key)
+    else:
+        ranked = sort_task_results(results)
+    if not enrich:
+        return ranked
 
-    results = []
-    for post in posts:
-        full_text = f"{post['title']} {post['text']}"
-
-        # 过滤掉 [For Hire] / [OFFER] 帖子（其他 freelancer 的广告，不是客户需求）
-        title_lower = post["title"].lower()
-        flair_check = post.get("flair", "").lower()
-
-        is_offer_post = (
-            "[for hire]" in title_lower
-            or "[offer]" in title_lower
-            or "for hire" in flair_check
-            or "offer" in flair_check
-        )
-
-        if is_offer_post:
-            freshness_label, freshness_minutes = get_freshness_label(post["created"])
-            results.append({
-                **post,
-                "task_category": "irrelevant",
-                "confidence": 0.1,
-                "skill_score": 0,
-                "danger_score": 0,
-                "skill_matches": [],
-                "danger_matches": [],
-                "budget": None,
-                "freshness_label": freshness_label,
-                "freshness_minutes": freshness_minutes,
-            })
-            continue
-
-        skill_score, skill_matches = score_text(full_text, SKILL_MATCH_SIGNALS)
-        danger_score, danger_matches = score_text(full_text, DANGER_SIGNALS)
-
-        budget = extract_budget(full_text)
-        freshness_label, freshness_minutes = get_freshness_label(post["created"])
-
-        # 判断 flair 是否是 [TASK] 类型（加分）
-        flair = post.get("flair", "").lower()
-        is_task_flair = "task" in flair or "hiring" in flair or "job" in flair
-
-        if is_task_flair:
-            skill_score += 1
-
-        # 检查是否是其他 freelancer 的推销帖 / 非技术类任务
-        offer_score, offer_matches = score_text(full_text, OFFER_SIGNALS)
-        non_tech_score, non_tech_matches = score_text(full_text, NON_TECH_SIGNALS)
-
-        # 分类逻辑
-        if danger_score > 0:
-            task_category = "danger"
-            confidence = min(danger_score / 3, 1.0)
-        elif offer_score >= 1:
-            task_category = "irrelevant"
-            confidence = 0.8
-        elif non_tech_score >= 1 and skill_score <= 1:
-            task_category = "irrelevant"
-            confidence = 0.6
-        elif skill_score >= 2:
-            task_category = "skill_match"
-            confidence = min(skill_score / 5, 1.0)
-        elif skill_score == 1:
-            task_category = "maybe_match"
-            confidence = 0.4
-        else:
-            task_category = "irrelevant"
-            confidence = 0.2
-
-        results.append({
-            **post,
-            "task_category": task_category,
-            "confidence": round(confidence, 2),
-            "skill_score": skill_score,
-            "danger_score": danger_score,
-            "skill_matches": skill_matches,
-            "danger_matches": danger_matches,
-            "budget": budget,
-            "freshness_label": freshness_label,
-            "freshness_minutes": freshness_minutes,
-        })
-
-    # 排序: skill_match 优先, 然后按新鲜度排序（越新越靠前）
-    category_order = {"skill_match": 0, "maybe_match": 1, "irrelevant": 2, "danger": 3}
-    results.sort(key=lambda x: (
-        category_order.get(x["task_category"], 9),
-        x["freshness_minutes"],  # 越小越新
-    ))
-
-    # ===== LLM 二次分析 =====
+    # ===== LLM 二次分析 =====（原地写入 llm_analysis，ranked 中是同一批对象）
     try:
         from llm_classifier import enrich_tasks_with_llm
-        results = enrich_tasks_with_llm(results, max_analyze=5)
+        enrich_tasks_with_llm(results, max_analyze=5)
     except Exception as e:
         print(f"[LLM] Enrichment failed, continuing without LLM: {e}")
 
-    return results
+    return ranked
@@ -4,62 +4,22 @@ TASK 帖子扫描器 - 专门扫描 r/slavelabour, r/forhire 等板块的 [TASK]
 import requests
 import time as time_module
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-_TOKEN_CACHE = {
-    "access_token": None,
-    "expires_at": 0,
-}
+from models import Post
+from reddit_client import PAGE_SIZE, iter_listing, resolve_api_url
 
-def _get_headers():
-    ua = os.getenv(
-        "REDDIT_USER_AGENT",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    )
-    return {"User-Agent": ua}
-
-
-def _get_oauth_token(debug_errors=None):
-    client_id = os.getenv("REDDIT_CLIENT_ID")
-    client_secret = os.getenv("REDDIT_CLIENT_SECRET")
-    if not client_id or not client_secret:
-        return None
-
-    now = time_module.time()
-    if _TOKEN_CACHE["access_token"] and now < (_TOKEN_CACHE["expires_at"] - 30):
-        return _TOKEN_CACHE["access_token"]
-
-    token_url = "https://www.reddit.com/api/v1/access_token"
-    data = {"grant_type": "client_credentials"}
-    headers = _get_headers()
+# 并发抓取配置：多个 subreddit 并行请求，整体请求速率由 reddit_client 的令牌桶控制
+SCAN_CONCURRENCY = int(os.getenv("REDDIT_SCAN_CONCURRENCY", "4"))
 
-    try:
-        resp = requests.post(
-            token_url,
-            auth=(client_id, client_secret),
-            data=data,
-            headers=headers,
-            timeout=15,
-        )
-        resp.raise_for_status()
-        payload = resp.json()
-        access_token = payload.get("access_token")
-        expires_in = int(payload.get("expires_in", 0) or 0)
-        if not access_token or expires_in <= 0:
-            raise requests.RequestException(f"Missing access_token in response: {payload}")
-
-        _TOKEN_CACHE["access_token"] = access_token
-        _TOKEN_CACHE["expires_at"] = now + expires_in
-        return access_token
-    except requests.RequestException as e:
-        if debug_errors is not None:
-            debug_errors.append({
-                "subreddit": None,
-                "url": token_url,
-                "status": getattr(getattr(e, "response", None), "status_code", None),
-                "error": f"oauth_token_error: {str(e)}",
-            })
-        print(f"[TASK] OAuth token fetch failed: {e}")
-        return None
+# 增量扫描高水位：每个 subreddit + 搜索关键词已见过的最新帖子（不同关键词的搜索结果不同，各自记录）
+# {(subreddit, keyword): {"id": ..., "fullname": "t3_...", "created": ..., "ids": [created 同一秒内已见过的帖子 id]}}
+_HIGH_WATER = {}
+_HIGH_WATER_LOCK = threading.Lock()
+# 有高水位时每页只取少量帖子，通常一页就能碰到已见过的帖子
+INCREMENTAL_PAGE_SIZE = int(os.getenv("REDDIT_INCREMENTAL_PAGE_SIZE", "25"))
 
 # 默认扫描的 subreddit 列表
 DEFAULT_TASK_SUBREDDITS = [
@@ -77,26 +37,41 @@ SKILL_KEYWORDS = (
 )
 
 
-def scrape_task_posts(subreddits=None, keyword=None, limit=50, time_filter="day", debug_errors=None):
+def scrape_task_posts(subreddits=None, keyword=None, limit=50, time_filter="day", debug_errors=None, concurrency=None,
+                      incremental=False):
     """
     扫描多个 subreddit 的 TASK 帖子
     - subreddits: 要扫描的 subreddit 列表，默认使用 DEFAULT_TASK_SUBREDDITS
     - keyword: 搜索关键词，默认使用 SKILL_KEYWORDS
     - limit: 每个 subreddit 的帖子数量限制
     - time_filter: 时间范围 (hour, day, week, month)
+    - concurrency: 并发抓取的线程数，默认 SCAN_CONCURRENCY；1 表示逐个抓取
+    - incremental: 增量模式，只返回比上次扫描更新的帖子（首次扫描按 time_filter 全量抓取）
     """
     if subreddits is None:
         subreddits = DEFAULT_TASK_SUBREDDITS
     if keyword is None:
         keyword = SKILL_KEYWORDS
+    if concurrency is None:
+        concurrency = SCAN_CONCURRENCY
 
-    all_posts = []
+    fetch_one = _fetch_new_subreddit_tasks if incremental else _fetch_subreddit_tasks
 
-    for sub in subreddits:
-        posts = _fetch_subreddit_tasks(sub, keyword, limit, time_filter, debug_errors=debug_errors)
+    def fetch(sub):
+        return fetch_one(sub, keyword, limit, time_filter, debug_errors=debug_errors)
+
+    # 请求速率由 reddit_client 统一控制，总耗时取决于限流速率而不是 subreddit 数量
+    workers = max(1, min(concurrency, len(subreddits)))
+    if workers == 1:
+        results = [fetch(sub) for sub in subreddits]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # map 按 subreddit 顺序返回结果，保证合并后的顺序与逐个抓取一致
+            results = list(pool.map(fetch, subreddits))
+
+    all_posts = []
+    for posts in results:
         all_posts.extend(posts)
-        # 避免请求过快被 Reddit 限流
-        time_module.sleep(1.0)
 
     # 按创建时间降序（最新的在前面）
     all_posts.sort(key=lambda x: x["created"], reverse=True)
@@ -112,31 +87,182 @@ def scrape_task_posts(subreddits=None, keyword=None, limit=50, time_filter="day"
     return unique_posts
 
 
+def iter_task_posts(subreddits=None, keyword=None, limit=50, time_filter="day", debug_errors=None, concurrency=None,
+                    incremental=False):
+    """
+    流式版 scrape_task_posts：多个 subreddit 并发抓取，每抓到一页就立即 yield 其中的帖子（已按 id 去重），
+    不等所有 subreddit 完成。帖子按到达顺序返回，不排序。参数同 scrape_task_posts。
+    """
+    if subreddits is None:
+        subreddits = DEFAULT_TASK_SUBREDDITS
+    if keyword is None:
+        keyword = SKILL_KEYWORDS
+    if concurrency is None:
+        concurrency = SCAN_CONCURRENCY
+    if not subreddits:
+        return
+
+    iter_one = _iter_new_subreddit_tasks if incremental else iter_subreddit_tasks
+    pages = queue.Queue()
+    done = object()
+
+    def produce(sub):
+        try:
+            for page in iter_one(sub, keyword, limit, time_filter, debug_errors=debug_errors):
+                pages.put(page)
+        except Exception as e:
+            print(f"[TASK] Failed to stream r/{sub}: {e}")
+        finally:
+            pages.put(done)
+
+    seen_ids = set()
+    workers = max(1, min(concurrency, len(subreddits)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for sub in subreddits:
+            pool.submit(produce, sub)
+        remaining = len(subreddits)
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+                continue
+            for post in page:
+                if post["id"] not in seen_ids:
+                    seen_ids.add(post["id"])
+                    yield post
+
+
 def _fetch_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=None):
     """
     从单个 subreddit 抓取 TASK 帖子
     """
-    token = _get_oauth_token(debug_errors=debug_errors)
-    if token:
-        url = f"https://oauth.reddit.com/r/{subreddit_name}/search"
-    else:
-        url = f"https://www.reddit.com/r/{subreddit_name}/search.json"
+    posts = []
+    for page in iter_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=debug_errors):
+        posts.extend(page)
+    return posts
+
+
+def _fetch_new_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=None):
+    """
+    增量抓取单个 subreddit，只返回比高水位更新的帖子
+    """
+    posts = []
+    for page in _iter_new_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=debug_errors):
+        posts.extend(page)
+    return posts
+
+
+def _iter_new_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=None):
+    """
+    增量抓取单个 subreddit：按 sort=new 翻页，遇到比高水位更早的帖子立即停止，
+    每页只 yield 更新的帖子。全部抓取成功后推进高水位。
+    created 只精确到秒：与高水位同一秒发布的帖子按 id 区分，已见过的跳过，没见过的照常返回
+    拿满 limit（或超出 time_filter 范围）还没碰到高水位时，中间的帖子没有抓到：照常推进高水位，但打印警告
+    """
+    key = (subreddit_name, keyword)
+    with _HIGH_WATER_LOCK:
+        mark = _HIGH_WATER.get(key)
+        seen_at_mark = set(mark["ids"]) if mark else set()
+
+    errors = []
+    newest = None
+    # newest["created"] 同一秒内的新帖子 id
+    newest_ids = set()
+    count = 0
+    reached_mark = False
+    page_size = INCREMENTAL_PAGE_SIZE if mark else PAGE_SIZE
+    pages = iter_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=errors, page_size=page_size)
+    for page in pages:
+        new_posts = []
+        for post in page:
+            # 按 created 判断而不是只比较 id：高水位帖子可能已被删除
+            if mark:
+                if post["created"] < mark["created"]:
+                    reached_mark = True
+                    break
+                if post["created"] == mark["created"] and post["id"] in seen_at_mark:
+                    continue
+            new_posts.append(post)
+            if newest is None or post["created"] > newest["created"]:
+                newest = post
+                newest_ids = {post["id"]}
+            elif post["created"] == newest["created"]:
+                newest_ids.add(post["id"])
+        count += len(new_posts)
+        if new_posts:
+            yield new_posts
+        if reached_mark:
+            pages.close()
+            break
+
+    if debug_errors is not None:
+        debug_errors.extend(errors)
+
+    # 只在会推进高水位时提示：没有新帖子时高水位不变，下次扫描再判断
+    if mark and count and not reached_mark and not errors:
+        gap_minutes = (time_module.time() - mark["created"]) / 60
+        print(f"[TASK] WARNING: r/{subreddit_name} q={keyword!r}: stopped before reaching the previous "
+              f"high-water mark ({gap_minutes:.0f} min old) after {count} new posts (limit={limit}, "
+              f"t={time_filter}); older posts since the last scan were not fetched")
+
+    # 中途请求失败时不推进高水位，避免漏掉没抓到的帖子
+    if newest is not None and not errors:
+        with _HIGH_WATER_LOCK:
+            current = _HIGH_WATER.get(key)
+            if current is not None and newest["created"] == current["created"]:
+                newest_ids.update(current["ids"])
+            if current is None or newest["created"] >= current["created"]:
+                _HIGH_WATER[key] = {
+                    "id": newest["id"],
+                    "fullname": f"t3_{newest['id']}",
+                    "created": newest["created"],
+                    "ids": sorted(newest_ids),
+                }
+
+    print(f"[TASK] r/{subreddit_name}: {count} new posts since last scan")
+
+
+def get_high_water_marks():
+    """返回当前的增量扫描高水位 {subreddit: {keyword: mark}}"""
+    marks = {}
+    with _HIGH_WATER_LOCK:
+        for (sub, keyword), mark in _HIGH_WATER.items():
+            marks.setdefault(sub, {})[keyword] = {**mark, "ids": list(mark["ids"])}
+    return marks
+
+
+def reset_high_water_marks():
+    """清空高水位，下一次增量扫描会按 time_filter 重新全量抓取"""
+    with _HIGH_WATER_LOCK:
+        count = len(_HIGH_WATER)
+        _HIGH_WATER.clear()
+    return count
+
+
+def iter_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_errors=None, page_size=PAGE_SIZE):
+    """
+    按 after 游标翻页抓取单个 subreddit 的 TASK 帖子，每拿到一页就 yield 一次
+    - limit 可以超过 100，会自动翻页直到拿够或没有更多帖子
+    - 调用方可以边抓取边处理，内存中只保留一页
+    """
+    url, headers = resolve_api_url(f"/r/{subreddit_name}/search", debug_errors=debug_errors)
     params = {
         "q": keyword,
         "restrict_sr": "on",
         "sort": "new",  # 按最新排序，速度很重要
         "t": time_filter,
-        "limit": min(limit, 100),
         "type": "link",
     }
 
     try:
-        headers = _get_headers()
-        if token:
-            headers = {**headers, "Authorization": f"Bearer {token}"}
-        response = requests.get(url, headers=headers, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
+        for children in iter_listing(url, params=params, limit=limit, headers=headers, timeout=15, page_size=page_size):
+            print(f"[TASK] r/{subreddit_name}: found {len(children)} raw posts")
+            posts = []
+            for item in children:
+                post = _normalize_task_post(item, subreddit_name)
+                if post is not None:
+                    posts.append(post)
+            yield posts
     except requests.HTTPError as e:
         status = getattr(getattr(e, "response", None), "status_code", None)
         if debug_errors is not None:
@@ -147,7 +273,6 @@ def _fetch_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_er
                 "error": str(e),
             })
         print(f"[TASK] Failed to fetch r/{subreddit_name} (status={status}): {e}")
-        return []
     except requests.RequestException as e:
         if debug_errors is not None:
             debug_errors.append({
@@ -157,53 +282,48 @@ def _fetch_subreddit_tasks(subreddit_name, keyword, limit, time_filter, debug_er
                 "error": str(e),
             })
         print(f"[TASK] Failed to fetch r/{subreddit_name}: {e}")
-        return []
-
-    posts = []
-    children = data.get("data", {}).get("children", [])
-    print(f"[TASK] r/{subreddit_name}: found {len(children)} raw posts")
-
-    for item in children:
-        if item.get("kind") != "t3":
-            continue
 
-        post_data = item.get("data", {})
 
-        # 跳过已删除或已移除的帖子
-        if post_data.get("removed_by_category") or post_data.get("removed"):
-            continue
+def _normalize_task_post(item, subreddit_name):
+    """把 Reddit listing 中的一条记录转换成帖子 dict，无效/已删除的帖子返回 None"""
+    if item.get("kind") != "t3":
+        return None
 
-        post_id = post_data.get("id", "")
-        title = post_data.get("title", "")
-        permalink = post_data.get("permalink", "")
+    post_data = item.get("data", {})
 
-        if not post_id or not title or not permalink:
-            continue
+    # 跳过已删除或已移除的帖子
+    if post_data.get("removed_by_category") or post_data.get("removed"):
+        return None
 
-        post_url = f"https://www.reddit.com{permalink}"
-        link_flair = post_data.get("link_flair_text", "") or ""
+    post_id = post_data.get("id", "")
+    title = post_data.get("title", "")
+    permalink = post_data.get("permalink", "")
 
-        post = {
-            "id": post_id,
-            "title": title,
-            "text": post_data.get("selftext", "")[:500],
-            "score": post_data.get("score", 0),
-            "num_comments": post_data.get("num_comments", 0),
-            "url": post_url,
-            "created": post_data.get("created_utc", 0),
-            "subreddit": post_data.get("subreddit", subreddit_name),
-            "author": post_data.get("author", "[deleted]"),
-            "flair": link_flair,
-        }
+    if not post_id or not title or not permalink:
+        return None
 
-        posts.append(post)
+    post_url = f"https://www.reddit.com{permalink}"
+    link_flair = post_data.get("link_flair_text", "") or ""
+
+    post = Post(
+        id=post_id,
+        title=title,
+        text=post_data.get("selftext", "")[:500],
+        score=post_data.get("score", 0),
+        num_comments=post_data.get("num_comments", 0),
+        url=post_url,
+        created=post_data.get("created_utc", 0),
+        subreddit=post_data.get("subreddit", subreddit_name),
+        author=post_data.get("author", "[deleted]"),
+        flair=link_flair,
+    )
 
-        try:
-            print(f"[TASK] Added: [{link_flair}] {title[:60]}...")
-        except UnicodeEncodeError:
-            print(f"[TASK] Added: {post_id} (title contains special chars)")
+    try:
+        print(f"[TASK] Added: [{link_flair}] {title[:60]}...")
+    except UnicodeEncodeError:
+        print(f"[TASK] Added: {post_id} (title contains special chars)")
 
-    return posts
+    return post
 
 
 def get_freshness_label(created_utc):
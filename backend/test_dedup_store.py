@@ -0,0 +1,96 @@
+"""Test script for the persistent notified-post dedup store (offline, temporary SQLite files)"""
+import os
+import tempfile
+import time as time_module
+
+import storage
+from dedup_store import BloomFilter, DedupStore
+from test_helpers import run_tests
+
+DAY = 86400
+
+
+def make_store(directory, **kwargs):
+    return DedupStore(os.path.join(directory, "dedup.sqlite3"), ttl=8 * DAY, **kwargs)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"post{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0 < bloom.false_positive_rate() < 0.03
+
+
+def test_add_and_filter_new():
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(directory)
+        now = time_module.time()
+        store.add([{"id": "a", "created": now}, {"id": "b", "created": now}])
+        assert "a" in store and "c" not in store
+        assert store.filter_new(["a", "b", "c", "d"]) == {"c", "d"}
+        assert len(store) == 2
+
+
+def test_expiry_follows_post_age():
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(directory)
+        now = time_module.time()
+        # 发布已超过 ttl 的帖子至少保留一小时，之后过期
+        store.add([{"id": "old", "created": now - 30 * DAY}, {"id": "new", "created": now}])
+        assert "old" in store
+        store.conn.execute("UPDATE notified SET expires_at = ? WHERE post_id = 'old'", (now - 1,))
+        store.conn.commit()
+        assert store.filter_new(["old", "new"]) == {"old"}
+        store.last_purge = 0.0
+        store.add(["another"])
+        assert store.get_stats()["expired"] == 1
+        assert len(store) == 2
+
+
+def test_persists_and_syncs_across_instances():
+    with tempfile.TemporaryDirectory() as directory:
+        first = make_store(directory, sync_interval=0)
+        first.add(["a"])
+        second = make_store(directory, sync_interval=0)
+        assert "a" in second
+        # 另一个实例（进程）写入的 id 同步到本实例的 Bloom 过滤器
+        second.add(["b"])
+        assert "b" in first
+        assert "b" in first.bloom
+        assert first.clear() == 2
+        assert "a" not in second and "b" not in second
+
+
+def test_bloom_grows_past_capacity():
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(directory, bloom_capacity=100)
+        store.add([f"post{i}" for i in range(250)])
+        stats = store.get_stats()
+        assert stats["entries"] == 250
+        assert stats["bloom"]["capacity"] >= 250
+        assert stats["bloom"]["memory_bytes"] == len(store.bloom.bits)
+        assert stats["db_bytes"] > 0
+        assert store.filter_new([f"post{i}" for i in range(300)]) == {f"post{i}" for i in range(250, 300)}
+
+
+def test_persistence_warning():
+    default = storage.data_path("dedup_store.sqlite3")
+    saved = storage.RAILWAY_VOLUME_MOUNT_PATH
+    try:
+        storage.RAILWAY_VOLUME_MOUNT_PATH = ""
+        assert storage.persistence_warning(default)
+        assert storage.persistence_warning("/data/dedup_store.sqlite3") is None
+        storage.RAILWAY_VOLUME_MOUNT_PATH = "/data"
+        assert storage.data_path("llm_cache.sqlite3") == os.path.join("/data", "llm_cache.sqlite3")
+        assert storage.persistence_warning("/data/dedup_store.sqlite3") is None
+        assert storage.persistence_warning("/tmp/dedup_store.sqlite3")
+    finally:
+        storage.RAILWAY_VOLUME_MOUNT_PATH = saved
+
+
+if __name__ == "__main__":
+    run_tests(globals())
@@ -0,0 +1,31 @@
+"""Shared helpers for the offline test scripts (each also runs as `python test_xxx.py`)"""
+from models import TaskPost
+
+
+def make_task_post(index, **fields):
+    """A skill-matched TaskPost with id t{index}; keyword arguments override any field"""
+    values = dict(
+        id=f"t{index}",
+        title="Need a python scraper for a small site",
+        text="Looking for someone to scrape product prices into a CSV.",
+        url=f"https://reddit.com/r/slavelabour/t{index}",
+        subreddit="slavelabour",
+        score=1,
+        num_comments=0,
+        task_category="skill_match",
+        skill_score=2,
+        budget=50.0,
+        freshness_label="5 min ago - GO NOW!",
+        freshness_minutes=index,
+    )
+    values.update(fields)
+    return TaskPost(**values)
+
+
+def run_tests(namespace):
+    """Run every test_* function in namespace (a module's globals()) and print PASS lines"""
+    tests = [value for name, value in sorted(namespace.items()) if name.startswith("test_") and callable(value)]
+    for test in tests:
+        test()
+        print(f"PASS {test.__name__}")
+    print(f"\n{len(tests)} tests passed")
@@ -0,0 +1,316 @@
+"""Test script for the LLM analysis path, run against the local mock server (no API key or network needed)"""
+import json
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_cache
+import llm_classifier
+import llm_endpoints
+import llm_governor
+import llm_jobs
+import triage_model
+from mock_llm_server import start_mock_server
+from test_helpers import make_task_post, run_tests
+
+# 测试时不读写 LLM 缓存，也不使用本地分诊模型
+llm_cache.LLM_CACHE_ENABLED = False
+triage_model.TRIAGE_ENABLED = False
+
+
+def wait_for_attempts(timeout=10):
+    """
+    等当前服务池里还没结束的请求（被对冲 / 超过总时限的慢请求）结束：
+    它们结束时会记到那时的 governor 上，影响之后替换了 governor 的测试
+    """
+    pool = llm_endpoints._POOL["pool"]
+    deadline = time_module.monotonic() + timeout
+    while pool and any(len(e.latencies) + e.stats["failures"] < e.stats["requests"] for e in pool.endpoints):
+        assert time_module.monotonic() < deadline, "LLM requests still running"
+        time_module.sleep(0.05)
+
+
+def with_mock(config, fn):
+    server, url = start_mock_server({"latency": "fixed:5", "seed": 1, **config})
+    restore = llm_classifier.override_llm(url)
+    try:
+        return fn(server.state)
+    finally:
+        wait_for_attempts()
+        restore()
+        server.shutdown()
+
+
+def test_plain_json():
+    result = with_mock({}, lambda state: llm_classifier.analyze_task_with_llm(make_task_post(0)))
+    assert result["worth_taking"] is True
+    assert result["summary"].startswith("Mock analysis")
+
+
+def test_fenced_json():
+    result = with_mock({"fenced_rate": 1.0}, lambda state: llm_classifier.analyze_task_with_llm(make_task_post(0)))
+    assert result is not None and result["worth_taking"] is True
+
+
+def test_malformed_json_returns_none():
+    result = with_mock({"malformed_rate": 1.0}, lambda state: llm_classifier.analyze_task_with_llm(make_task_post(0)))
+    assert result is None
+
+
+def test_server_error_returns_none():
+    result = with_mock({"error_rate": 1.0}, lambda state: llm_classifier.analyze_task_with_llm(make_task_post(0)))
+    assert result is None
+
+
+def test_rejected_post_is_downgraded():
+    post = make_task_post(0, title="Hack into my ex's account")
+    with_mock({}, lambda state: llm_classifier.enrich_tasks_with_llm([post], max_analyze=1))
+    assert post["llm_rejected"] is True
+    assert post["task_category"] == "irrelevant"
+
+
+def test_batch_missing_posts_fall_back():
+    posts = [make_task_post(i) for i in range(4)]
+
+    def run(state):
+        results = llm_classifier.analyze_tasks_batch_with_llm(posts)
+        return results, dict(state.stats)
+
+    results, stats = with_mock({"missing_rate": 0.5}, run)
+    assert all(result and result["worth_taking"] for result in results)
+    # 1 个批量请求 + 每个漏掉的帖子 1 个单独请求
+    assert stats["requests"] == 1 + stats["missing_posts"]
+
+
+def test_budget_skipped_posts_are_not_negative_cached():
+    posts = [make_task_post(i) for i in range(3)]
+    stored = []
+    saved = llm_classifier.store_analysis, llm_governor._GOVERNOR
+    llm_classifier.store_analysis = lambda post, model, prompt, result: stored.append((post["id"], result))
+    # 额度只够批量请求本身，漏掉的帖子不能单独补救
+    governor = llm_governor._GOVERNOR = llm_governor.LLMGovernor({("hour", "requests"): 1})
+
+    def run(state):
+        return llm_classifier._analyze_and_cache(posts, 5, governor.try_acquire(len(posts)))
+
+    try:
+        results = with_mock({"missing_rate": 1.0}, run)
+    finally:
+        llm_classifier.store_analysis, llm_governor._GOVERNOR = saved
+    assert results == [None, None, None]
+    assert stored == []
+
+
+def test_enrich_respects_max_analyze_and_concurrency():
+    posts = [make_task_post(i) for i in range(10)]
+
+    def run(state):
+        llm_classifier.enrich_tasks_with_llm(posts, max_analyze=6, concurrency=3)
+        return dict(state.stats)
+
+    stats = with_mock({"latency": "fixed:50"}, run)
+    enriched = [post for post in posts if post.get("llm_analysis")]
+    assert len(enriched) == 6
+    # 按优先级（越新越靠前）分析
+    assert [post["id"] for post in enriched] == [f"t{i}" for i in range(6)]
+    assert stats["requests"] == 6
+
+
+def test_enrich_deadline_leaves_slow_posts_unenriched():
+    posts = [make_task_post(i) for i in range(3)]
+    with_mock(
+        {"latency": "fixed:1500"},
+        lambda state: llm_classifier.enrich_tasks_with_llm(posts, max_analyze=3, concurrency=3, deadline=0.3),
+    )
+    assert not any(post.get("llm_analysis") for post in posts)
+
+
+def test_background_job_reports_each_post():
+    posts = [make_task_post(i) for i in range(3)] + [make_task_post(3, title="Hack into my ex's account")]
+
+    def run(state):
+        job_id = llm_jobs.submit_enrichment_job(posts, max_analyze=4)
+        first = llm_jobs.get_job(job_id)
+        job = first
+        while not job["done"]:
+            time_module.sleep(0.02)
+            job = llm_jobs.get_job(job_id)
+        return first, job, llm_jobs.get_job(job_id, since=job["next"])
+
+    first, job, rest = with_mock({"latency": "fixed:100"}, run)
+    # 提交后立即返回，结果逐个出现
+    assert not first["done"] and first["updates"] == []
+    assert job["status"] == "done" and job["next"] == 4
+    assert {update["id"] for update in job["updates"]} == {post["id"] for post in posts}
+    rejected = next(update for update in job["updates"] if update["id"] == "t3")
+    assert rejected["llm_rejected"] is True and rejected["task_category"] == "irrelevant"
+    assert rest["updates"] == []
+    assert llm_jobs.get_job("missing") is None
+
+
+def test_background_jobs_are_capped_and_reused():
+    saved = llm_jobs.LLM_JOB_MAX_ACTIVE
+    llm_jobs.LLM_JOB_MAX_ACTIVE = 2
+
+    def run(state):
+        first = llm_jobs.submit_enrichment_job([make_task_post(0)], max_analyze=1)
+        second = llm_jobs.submit_enrichment_job([make_task_post(1)], max_analyze=1)
+        # 刷新页面：同一批帖子复用还没结束的任务
+        again = llm_jobs.submit_enrichment_job([make_task_post(0)], max_analyze=1)
+        over_cap = llm_jobs.submit_enrichment_job([make_task_post(2)], max_analyze=1)
+        wait_done(first, second)
+        after = llm_jobs.submit_enrichment_job([make_task_post(2)], max_analyze=1)
+        wait_done(after)
+        return first, second, again, over_cap, after
+
+    def wait_done(*job_ids):
+        for job_id in job_ids:
+            while not llm_jobs.get_job(job_id)["done"]:
+                time_module.sleep(0.02)
+
+    try:
+        first, second, again, over_cap, after = with_mock({"latency": "fixed:200"}, run)
+    finally:
+        llm_jobs.LLM_JOB_MAX_ACTIVE = saved
+    assert first and second and first != second
+    assert again == first
+    assert over_cap is None
+    assert after is not None
+    stats = llm_jobs.get_job_stats()
+    assert stats["reused"] >= 1 and stats["rejected"] >= 1
+
+
+def with_endpoints(configs, fn):
+    """启动多个模拟服务，按顺序配置成 LLM_ENDPOINTS"""
+    started = [start_mock_server({"latency": "fixed:5", "seed": 1, **config}) for config in configs]
+    endpoints = json.dumps([{"name": f"e{i}", "url": url, "model": "mock"} for i, (_, url) in enumerate(started)])
+    saved = llm_endpoints.LLM_ENDPOINTS
+    llm_endpoints.LLM_ENDPOINTS = llm_classifier.LLM_ENDPOINTS = endpoints
+    try:
+        return fn([server.state for server, _ in started])
+    finally:
+        wait_for_attempts()
+        llm_endpoints.LLM_ENDPOINTS = llm_classifier.LLM_ENDPOINTS = saved
+        for server, _ in started:
+            server.shutdown()
+
+
+def test_hedged_request_beats_stalled_primary():
+    saved = llm_endpoints.LLM_HEDGE_DELAY
+    llm_endpoints.LLM_HEDGE_DELAY = 0.1
+
+    def run(states):
+        start = time_module.perf_counter()
+        result = llm_classifier.analyze_task_with_llm(make_task_post(0))
+        return result, time_module.perf_counter() - start
+
+    try:
+        result, elapsed = with_endpoints([{"latency": "fixed:3000"}, {"latency": "fixed:20"}], run)
+    finally:
+        llm_endpoints.LLM_HEDGE_DELAY = saved
+    assert result["worth_taking"] is True
+    assert elapsed < 1.0
+
+
+def test_concurrent_hedges_do_not_queue_behind_stalled_primaries():
+    saved = llm_endpoints.LLM_HEDGE_DELAY
+    llm_endpoints.LLM_HEDGE_DELAY = 0.1
+
+    def timed(index):
+        start = time_module.perf_counter()
+        result = llm_classifier.analyze_task_with_llm(make_task_post(index))
+        return result, time_module.perf_counter() - start
+
+    def run(states):
+        # 默认配置下最多 LLM_CONCURRENCY x (定时扫描 + LLM_JOB_WORKERS) 个调用方同时请求
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            return list(pool.map(timed, range(12)))
+
+    try:
+        outcomes = with_endpoints([{"latency": "fixed:3000"}, {"latency": "fixed:20"}], run)
+    finally:
+        llm_endpoints.LLM_HEDGE_DELAY = saved
+    assert all(result["worth_taking"] is True for result, _ in outcomes)
+    assert max(elapsed for _, elapsed in outcomes) < 1.0
+
+
+def test_hedge_is_skipped_without_budget_headroom():
+    saved = llm_endpoints.LLM_HEDGE_DELAY, llm_governor._GOVERNOR
+    llm_endpoints.LLM_HEDGE_DELAY = 0.05
+    # 只允许一个请求：第一个请求由调用方预留，对冲请求没有额度
+    governor = llm_governor._GOVERNOR = llm_governor.LLMGovernor({("hour", "requests"): 1})
+
+    def run(states):
+        ticket = governor.try_acquire(1)
+        try:
+            result = llm_classifier.analyze_task_with_llm(make_task_post(0))
+        finally:
+            governor.release(ticket)
+        return result, states[1].stats["requests"]
+
+    try:
+        result, secondary_requests = with_endpoints([{"latency": "fixed:300"}, {}], run)
+    finally:
+        llm_endpoints.LLM_HEDGE_DELAY, llm_governor._GOVERNOR = saved
+    assert result["worth_taking"] is True
+    assert secondary_requests == 0
+    totals = governor.get_stats()["totals"]
+    assert totals["requests"] == 1 and totals["hedged"] == 0 and totals["hedged_denied"] >= 1
+
+
+def test_failing_endpoint_is_skipped_by_circuit_breaker():
+    def run(states):
+        results = [llm_classifier.analyze_task_with_llm(make_task_post(i)) for i in range(6)]
+        return results, states[0].stats["requests"], llm_classifier.get_endpoint_stats()
+
+    results, primary_requests, stats = with_endpoints([{"error_rate": 1.0}, {}], run)
+    assert all(result and result["worth_taking"] for result in results)
+    # 连续失败 LLM_BREAKER_FAILURES 次后不再请求
+    assert primary_requests == llm_endpoints.LLM_BREAKER_FAILURES
+    assert stats["endpoints"][0]["state"] == "open"
+    assert stats["failovers"] == llm_endpoints.LLM_BREAKER_FAILURES
+
+
+def test_single_configured_endpoint_is_never_tripped():
+    def run(states):
+        failures = [llm_classifier.analyze_task_with_llm(make_task_post(i)) for i in range(4)]
+        return failures, states[0].stats["requests"], llm_classifier.get_endpoint_stats()
+
+    failures, requests_sent, stats = with_endpoints([{"error_rate": 1.0}], run)
+    assert failures == [None] * 4
+    # 每次都真的发出请求，没有被熔断跳过
+    assert requests_sent == 4
+    assert stats["endpoints"][0]["state"] == "closed"
+
+
+def test_override_ignores_configured_endpoints():
+    # 模拟 .env 里配置了真实（收费）的服务
+    paid = json.dumps([{"name": "paid", "url": "http://127.0.0.1:9/v1/chat/completions", "model": "x"}])
+    saved = llm_endpoints.LLM_ENDPOINTS, llm_classifier.LLM_ENDPOINTS
+    llm_endpoints.LLM_ENDPOINTS = llm_classifier.LLM_ENDPOINTS = paid
+    try:
+        result, mock_requests = with_mock(
+            {}, lambda state: (llm_classifier.analyze_task_with_llm(make_task_post(0)), state.stats["requests"])
+        )
+        restore = llm_classifier.override_llm(None)
+        configured = llm_classifier.llm_configured()
+        restore()
+        assert llm_classifier.LLM_ENDPOINTS == paid
+    finally:
+        llm_endpoints.LLM_ENDPOINTS, llm_classifier.LLM_ENDPOINTS = saved
+    assert result["worth_taking"] is True and mock_requests == 1
+    assert configured is False
+
+
+def test_invalid_endpoints_config_is_a_config_error():
+    for raw, message in (("[{", "not valid JSON"), ('[{"url": "http://x"}]', "needs at least url and model"),
+                         ('[{"url": "http://x", "model": "m", "timeout": "slow"}]', "timeout")):
+        try:
+            llm_endpoints.parse_endpoints(raw)
+        except llm_endpoints.EndpointConfigError as e:
+            assert message in str(e)
+        else:
+            raise AssertionError(f"{raw} should be rejected")
+
+
+if __name__ == "__main__":
+    run_tests(globals())
@@ -0,0 +1,142 @@
+"""Test script for the asynchronous notification dispatcher (fake channels, no network)"""
+import os
+import tempfile
+import time as time_module
+
+import notifier
+from dedup_store import DedupStore
+from models import TaskPost
+from notify_dispatcher import NotificationDispatcher, TelegramChannel
+from test_helpers import make_task_post, run_tests
+
+
+class FakeChannel:
+    """按 outcomes 顺序返回发送结果，用完后一直成功"""
+
+    def __init__(self, name="fake", outcomes=(), delay=0.0):
+        self.name = name
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.sent = []
+
+    def build(self, posts):
+        return [[post["id"] for post in posts]]
+
+    def send(self, message):
+        time_module.sleep(self.delay)
+        ok = self.outcomes.pop(0) if self.outcomes else True
+        if ok:
+            self.sent.append(message)
+        return ok, None
+
+
+def make_dispatcher(channels, delivered, **kwargs):
+    options = {"coalesce_seconds": 0.2, "retry_base": 0.05, "retry_max": 0.2, "max_attempts": 3, **kwargs}
+    return NotificationDispatcher(channels, on_delivered=delivered.extend, **options)
+
+
+def test_burst_is_coalesced_into_one_digest():
+    channel = FakeChannel()
+    delivered = []
+    dispatcher = make_dispatcher([channel], delivered)
+    for i in range(3):
+        assert dispatcher.enqueue([make_task_post(i)]) == 1
+    # 还在排队的帖子不会重复入队
+    assert dispatcher.enqueue([make_task_post(0)]) == 0
+    assert dispatcher.wait_idle(5)
+    assert channel.sent == [["t0", "t1", "t2"]]
+    assert [post["id"] for post in delivered] == ["t0", "t1", "t2"]
+    assert not dispatcher.is_pending("t0")
+
+
+def test_enqueue_does_not_wait_for_slow_channel():
+    channel = FakeChannel(delay=0.5)
+    dispatcher = make_dispatcher([channel], [])
+    start = time_module.perf_counter()
+    dispatcher.enqueue([make_task_post(0)], urgent=True)
+    assert time_module.perf_counter() - start < 0.05
+    assert dispatcher.wait_idle(5)
+
+
+def test_marked_notified_only_after_retry_succeeds():
+    channel = FakeChannel(outcomes=[False, False, True])
+    delivered = []
+    dispatcher = make_dispatcher([channel], delivered)
+    dispatcher.enqueue([make_task_post(0)], urgent=True)
+    time_module.sleep(0.02)
+    assert dispatcher.is_pending("t0") and not delivered
+    assert dispatcher.wait_idle(5)
+    assert [post["id"] for post in delivered] == ["t0"]
+    assert dispatcher.get_stats()["retries"] == 2
+
+
+def test_dropped_post_is_delivered_on_next_dispatch():
+    channel = FakeChannel(outcomes=[False] * 3)
+    delivered = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = DedupStore(os.path.join(directory, "dedup.sqlite3"), ttl=86400)
+        dispatcher = make_dispatcher([channel], delivered, on_dropped=store.add_pending)
+        dispatcher.on_delivered = lambda posts: (delivered.extend(posts), store.add(posts))
+        dispatcher.enqueue([make_task_post(0)], urgent=True)
+        assert dispatcher.wait_idle(5)
+        # 所有尝试都失败：不标记为已通知，保存到待重发队列
+        assert delivered == [] and "t0" not in store
+        assert dispatcher.get_stats()["dropped_posts"] == 1
+        pending = store.pending_posts()
+        assert [post["id"] for post in pending] == ["t0"]
+
+        # 下一次扫描重新入队，通道已恢复
+        assert dispatcher.enqueue([TaskPost.from_post(post) for post in pending], urgent=True) == 1
+        assert dispatcher.wait_idle(5)
+        assert [post["id"] for post in delivered] == ["t0"]
+        assert channel.sent == [["t0"]]
+        assert "t0" in store and store.pending_posts() == []
+
+
+def test_stop_saves_posts_waiting_for_retry():
+    channel = FakeChannel(outcomes=[False] * 10)
+    delivered, dropped = [], []
+    dispatcher = make_dispatcher([channel], delivered, retry_base=10, retry_max=10, on_dropped=dropped.extend)
+    dispatcher.enqueue([make_task_post(0)], urgent=True)
+    while not dispatcher.get_stats()["retry_queue"]:
+        time_module.sleep(0.01)
+    dispatcher.stop()
+    assert delivered == []
+    assert [post["id"] for post in dropped] == ["t0"]
+    assert not dispatcher.is_pending("t0")
+    assert dispatcher.get_stats()["dropped_posts"] == 1
+
+
+def test_one_working_channel_is_enough():
+    broken, working = FakeChannel("broken", outcomes=[False] * 10), FakeChannel("working")
+    delivered = []
+    dispatcher = make_dispatcher([broken, working], delivered)
+    dispatcher.enqueue([make_task_post(0)], urgent=True)
+    assert dispatcher.wait_idle(5)
+    assert [post["id"] for post in delivered] == ["t0"]
+    assert dispatcher.get_stats()["dropped_posts"] == 0
+
+
+def test_telegram_retry_after_is_respected():
+    calls = []
+
+    def fake_post(chat_id, text, parse_mode="HTML"):
+        calls.append(time_module.monotonic())
+        return (False, 0.3) if len(calls) == 1 else (True, None)
+
+    saved = notifier.post_telegram_message
+    notifier.post_telegram_message = fake_post
+    try:
+        channel = TelegramChannel("chat")
+        delivered = []
+        dispatcher = make_dispatcher([channel], delivered)
+        dispatcher.enqueue([make_task_post(0)], urgent=True)
+        assert dispatcher.wait_idle(5)
+    finally:
+        notifier.post_telegram_message = saved
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.3
+    assert [post["id"] for post in delivered] == ["t0"]
+
+
+if __name__ == "__main__":
+    run_tests(globals())
@@ -0,0 +1,122 @@
+"""Test script for the local triage model (offline, synthetic LLM verdicts)"""
+import os
+import random
+import tempfile
+
+import triage_model
+from llm_cache import LLMCache, analysis_key, post_snapshot
+from rules import get_rules
+from test_helpers import make_task_post, run_tests
+
+GOOD = ["scrape product prices into a csv", "build a chrome extension for my shop", "python bot for discord",
+        "automate excel report with python", "fix my selenium script"]
+BAD = ["write my college essay", "hack into an instagram account", "nsfw chat bot", "buy aged reddit account"]
+
+
+def make_samples(n, seed=1):
+    rnd = random.Random(seed)
+    samples = []
+    for i in range(n):
+        worth = rnd.random() < 0.6
+        title = rnd.choice(GOOD if worth else BAD)
+        snapshot = {"subreddit": "slavelabour", "title": f"[TASK] {title} #{i}",
+                    "text": f"Need this done today, details in DM. Ref {i}.", "budget": rnd.choice([None, 30, 80])}
+        samples.append((snapshot, worth))
+    return samples
+
+
+def test_choose_thresholds_respects_limits():
+    probabilities = [0.05, 0.1, 0.2, 0.3, 0.4, 0.6, 0.7, 0.8, 0.9, 0.95]
+    labels = [0, 0, 1, 0, 0, 1, 0, 1, 1, 1]
+    reject_below, accept_above = triage_model.choose_thresholds(probabilities, labels, max_missed=0.0,
+                                                                min_precision=1.0)
+    # 不允许漏掉任何正样本: 只能否决第一个正样本之前的
+    assert reject_below == 0.2
+    # 准确率必须 100%: 只能认可 0.7 之后的
+    assert accept_above == 0.8
+
+
+def test_train_and_triage():
+    rules = get_rules()
+    data = triage_model.train(make_samples(300), rules)
+    assert data["holdout"]["recall_kept"] >= 0.98
+    assert data["reject_below"] <= 0.5 <= data["accept_above"]
+
+    model = triage_model.TriageModel(data)
+    model.audit_rate = 0.0
+    good = make_task_post(0, title="[TASK] scrape product prices into a csv", text="Need this done today.", budget=30)
+    bad = make_task_post(1, title="[TASK] write my college essay", text="Need this done today.", budget=30)
+    assert model.probability(post_snapshot(good), rules) > model.probability(post_snapshot(bad), rules)
+    verdict = model.triage(bad, rules)
+    assert verdict["decided"] and verdict["worth_taking"] is False
+
+
+def test_train_needs_both_verdicts():
+    samples = [(snapshot, True) for snapshot, _ in make_samples(60)]
+    try:
+        triage_model.train(samples, get_rules())
+    except ValueError:
+        return
+    raise AssertionError("training on a single verdict should fail")
+
+
+def test_weighted_thresholds():
+    probabilities = [0.1, 0.2, 0.3, 0.4, 0.9]
+    labels = [0, 1, 0, 1, 1]
+    # 不加权时否决到 0.4 之前只漏掉 1 / 3 的正样本；0.2 处的样本代表 9 个帖子时已漏掉 9 / 11
+    assert triage_model.choose_thresholds(probabilities, labels, 0.4, 1.0)[0] == 0.4
+    assert triage_model.choose_thresholds(probabilities, labels, 0.4, 1.0, [1, 9, 1, 1, 1])[0] == 0.2
+    report = triage_model.agreement_report(probabilities, labels, 0.25, 0.8, [1, 9, 1, 1, 1])
+    assert report["samples"] == 5 and report["missed_worth_taking"] == 9
+
+
+def test_audit_sends_a_fraction_of_decided_posts_to_llm():
+    rules = get_rules()
+    model = triage_model.TriageModel(triage_model.train(make_samples(300), rules))
+    model.audit_rate = 0.2
+    random.seed(7)
+    posts = [make_task_post(i, title=f"[TASK] write my college essay #{i}", text="Need this done today.", budget=30)
+             for i in range(500)]
+    verdicts = [model.triage(post, rules) for post in posts]
+    audited = [verdict for verdict in verdicts if verdict.get("audit")]
+    assert 60 < len(audited) < 140
+    assert all(not verdict["decided"] and verdict["weight"] == 5.0 for verdict in audited)
+    assert model.stats["audited"] == len(audited)
+
+
+def test_labels_outlive_the_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMCache(os.path.join(directory, "cache.sqlite3"), max_entries=1, memory_entries=0)
+        for i, weight in enumerate([1.0, 20.0]):
+            snapshot = {"subreddit": "slavelabour", "title": f"task {i}", "text": "", "budget": None}
+            cache.put(analysis_key(snapshot, "m", "p"), f"p{i}", "m", "p", snapshot,
+                      {"worth_taking": bool(i)}, ttl=60, weight=weight)
+        cache.clear()
+        labels = sorted(cache.iter_labels("m"), key=lambda label: label[2])
+        assert [(worth, weight) for _, worth, weight in labels] == [(False, 1.0), (True, 20.0)]
+
+
+def test_model_disabled_when_rules_change():
+    rules = get_rules()
+    data = triage_model.train(make_samples(100), rules)
+    saved = triage_model.TRIAGE_ENABLED, triage_model.TRIAGE_MODEL_PATH, dict(triage_model._STATE)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            triage_model.TRIAGE_ENABLED = True
+            triage_model.TRIAGE_MODEL_PATH = os.path.join(directory, "model.json")
+            triage_model._STATE.update(model=None, mtime=None, last_error=None, stale_warned=None)
+            triage_model.save_model(dict(data, rules_version="older-rules"), triage_model.TRIAGE_MODEL_PATH)
+            assert triage_model.get_triage_model() is None
+            assert "retrain" in triage_model.get_triage_stats()["last_error"]
+
+            triage_model.save_model(data, triage_model.TRIAGE_MODEL_PATH)
+            os.utime(triage_model.TRIAGE_MODEL_PATH, (1, 1))
+            assert triage_model.get_triage_model().version == data["version"]
+            assert triage_model.get_triage_stats()["enabled"]
+        finally:
+            triage_model.TRIAGE_ENABLED, triage_model.TRIAGE_MODEL_PATH = saved[:2]
+            triage_model._STATE.update(saved[2])
+
+
+if __name__ == "__main__":
+    run_tests(globals())
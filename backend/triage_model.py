@@ -0,0 +1,412 @@
+"""
+本地分诊模型：用缓存里的 LLM 结论（worth_taking）训练的逻辑回归，替 LLM 判断容易的帖子
+- 特征: 标题 / 正文的词和相邻词对、subreddit、正则信号命中数和命中的技能词、预算区间，
+  哈希到固定数量的桶里（不需要词表），全部是 0/1 特征
+- 训练数据来自 llm_cache 的 labels 表（不随缓存过期），按快照哈希固定划出 20% 做校准和评估
+- 模型直接判断的帖子不会请求 LLM，训练集会只剩模型拿不准的那一段。因此按 TRIAGE_AUDIT_RATE
+  随机抽查一部分直接判断的帖子照常交给 LLM，样本权重为 1 / 抽查比例，训练和选阈值时按权重计算
+- 模型记录训练时的规则版本（rules_version），与当前规则不一致时停用，需要重新训练
+- 两个阈值在校准集上选出:
+  reject_below: 低于它直接判为不值得接，本地否决漏掉的 LLM 认可帖子不超过 --max-missed
+  accept_above: 高于它直接判为值得接，本地认可的准确率不低于 --min-precision
+  两者之间的帖子仍然交给远程 LLM
+- 模型保存为 JSON（只保存非零权重），文件修改后自动重新加载；文件不存在时不做分诊
+
+用法:
+    python triage_model.py train                     # 用 LLM 缓存训练，保存到 TRIAGE_MODEL_PATH
+    python triage_model.py train --max-missed 0.01 --min-precision 0.98
+    python triage_model.py evaluate                  # 当前模型与缓存中全部 LLM 结论的一致率
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time as time_module
+import zlib
+
+import numpy as np
+
+from llm_cache import iter_training_labels, post_snapshot
+from rules import get_rules
+
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() == "true"
+TRIAGE_MODEL_PATH = os.getenv(
+    "TRIAGE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "triage_model.json"),
+)
+# 模型直接判断的帖子中仍交给 LLM 的比例，用来给后续训练提供无偏样本
+TRIAGE_AUDIT_RATE = float(os.getenv("TRIAGE_AUDIT_RATE", "0.05"))
+TRIAGE_BUCKETS = 2 ** 18
+# 训练数据太少时阈值不可靠，不生成模型
+TRIAGE_MIN_SAMPLES = 40
+
+_TOKEN = re.compile(r"[a-z0-9$][a-z0-9$+#.'-]*")
+_BUDGET_BUCKETS = (20, 50, 100, 300)
+
+
+def _ngrams(prefix, text, features):
+    tokens = _TOKEN.findall(text)
+    features.update(f"{prefix}:{token}" for token in tokens)
+    features.update(f"{prefix}:{a} {b}" for a, b in zip(tokens, tokens[1:]))
+
+
+def extract_features(snapshot, rules, n_buckets=TRIAGE_BUCKETS):
+    """snapshot: llm_cache.post_snapshot 的结果。返回排好序的特征桶下标列表"""
+    title = snapshot.get("title") or ""
+    text = snapshot.get("text") or ""
+    features = {f"sub:{(snapshot.get('subreddit') or '').lower()}"}
+    _ngrams("t", title.lower(), features)
+    _ngrams("w", text.lower(), features)
+
+    hits = rules.task_matcher.match(f"{title} {text}")
+    for group in ("skill", "danger", "offer", "non_tech"):
+        features.add(f"re:{group}={min(len(hits[group]), 3)}")
+    features.update(f"skill:{pattern}" for pattern in hits["skill"])
+
+    budget = snapshot.get("budget")
+    if budget is None:
+        features.add("budget:none")
+    else:
+        bucket = next((limit for limit in _BUDGET_BUCKETS if budget < limit), "more")
+        features.add(f"budget:<{bucket}")
+
+    return sorted({zlib.crc32(feature.encode("utf-8")) % n_buckets for feature in features})
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+
+class TriageModel:
+    def __init__(self, data):
+        self.version = data["version"]
+        self.n_buckets = data["n_buckets"]
+        self.bias = data["bias"]
+        self.weights = {int(index): weight for index, weight in data["weights"].items()}
+        self.reject_below = data["reject_below"]
+        self.accept_above = data["accept_above"]
+        self.data = data
+        self.audit_rate = TRIAGE_AUDIT_RATE
+        self.lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "uncertain": 0, "audited": 0}
+
+    def probability(self, snapshot, rules):
+        weights = self.weights
+        z = self.bias + sum(weights.get(index, 0.0) for index in extract_features(snapshot, rules, self.n_buckets))
+        return _sigmoid(z)
+
+    def triage(self, post, rules):
+        """
+        返回 {"worth_taking", "probability", "decided", "model"}
+        decided 为 True 时不需要再请求 LLM。被抽查的帖子 decided 为 False，
+        另带 "audit": True 和 "weight"（LLM 结论作为训练样本的权重）
+        """
+        probability = self.probability(post_snapshot(post), rules)
+        if probability >= self.accept_above:
+            outcome, worth, decided = "accepted", True, True
+        elif probability < self.reject_below:
+            outcome, worth, decided = "rejected", False, True
+        else:
+            outcome, worth, decided = "uncertain", probability >= 0.5, False
+        audit = decided and self.audit_rate > 0 and random.random() < self.audit_rate
+        if audit:
+            outcome, decided = "audited", False
+        with self.lock:
+            self.stats[outcome] += 1
+        verdict = {"worth_taking": worth, "probability": round(probability, 3), "decided": decided,
+                   "model": self.version}
+        if audit:
+            verdict["audit"] = True
+            verdict["weight"] = round(1.0 / self.audit_rate, 3)
+        return verdict
+
+    def to_dict(self):
+        return self.data
+
+
+# ========== 训练 / 评估 ==========
+
+def load_samples(llm_model=None):
+    """从 LLM 缓存的训练样本表读取 (快照, 是否值得接, 权重)"""
+    return list(iter_training_labels(llm_model))
+
+
+def _unpack(samples):
+    """samples: [(快照, 是否值得接)] 或 [(快照, 是否值得接, 权重)]；返回 (快照列表, 标签列表, 权重列表)"""
+    snapshots = [sample[0] for sample in samples]
+    labels = [int(sample[1]) for sample in samples]
+    weights = [sample[2] if len(sample) > 2 else 1 for sample in samples]
+    return snapshots, labels, weights
+
+
+def _is_holdout(snapshot):
+    raw = json.dumps(snapshot, ensure_ascii=False, sort_keys=True)
+    return zlib.crc32(raw.encode("utf-8")) % 5 == 0
+
+
+def fit(features, labels, n_buckets=TRIAGE_BUCKETS, epochs=300, learning_rate=0.5, l2=1e-4, sample_weights=None):
+    """
+    全批量 AdaGrad 训练逻辑回归；正负样本按数量反比加权，少数类不会被忽略
+    features: 每个样本的特征下标列表；sample_weights: 样本权重（默认都为 1）；返回 (bias, 权重数组)
+    """
+    n = len(labels)
+    y = np.asarray(labels, dtype=np.float64)
+    rows = np.concatenate([np.full(len(indices), i) for i, indices in enumerate(features)]).astype(np.int64)
+    cols = np.concatenate([np.asarray(indices, dtype=np.int64) for indices in features])
+    w = np.ones(n)
+    if sample_weights is not None:
+        w = np.asarray(sample_weights, dtype=np.float64) * n / sum(sample_weights)
+    positives = (w * y).sum()
+    sample_weight = w * np.where(y > 0, n / (2 * max(positives, 1)), n / (2 * max(n - positives, 1)))
+
+    weights = np.zeros(n_buckets)
+    squared = np.full(n_buckets, 1e-8)
+    bias, bias_squared = 0.0, 1e-8
+    for _ in range(epochs):
+        z = np.bincount(rows, weights=weights[cols], minlength=n) + bias
+        error = (1.0 / (1.0 + np.exp(-np.clip(z, -30, 30))) - y) * sample_weight
+        grad = np.bincount(cols, weights=error[rows], minlength=n_buckets) / n + l2 * weights
+        grad_bias = error.mean()
+        squared += grad * grad
+        bias_squared += grad_bias * grad_bias
+        weights -= learning_rate * grad / np.sqrt(squared)
+        bias -= learning_rate * grad_bias / math.sqrt(bias_squared)
+    return bias, weights
+
+
+def choose_thresholds(probabilities, labels, max_missed, min_precision, weights=None):
+    """
+    返回 (reject_below, accept_above)；weights 为样本权重（默认都为 1）
+    某一侧达不到要求时该侧不做本地判断（reject_below=0 / accept_above=1.01）
+    """
+    weights = weights or [1] * len(labels)
+    triples = sorted(zip(probabilities, labels, weights))
+    positives = sum(label * weight for label, weight in zip(labels, weights))
+
+    # 从低往高扩大本地否决的范围，直到漏掉的正样本超过比例
+    reject_below = 0.0
+    missed = 0
+    for probability, label, weight in triples:
+        if positives == 0 or (missed + label * weight) / positives > max_missed:
+            reject_below = probability
+            break
+        missed += label * weight
+    else:
+        reject_below = 0.5
+
+    # 从高往低扩大本地认可的范围，直到准确率低于要求
+    accept_above = 1.01
+    correct = total = 0
+    for probability, label, weight in reversed(triples):
+        correct += label * weight
+        total += weight
+        if correct / total < min_precision:
+            break
+        accept_above = probability
+
+    return min(reject_below, 0.5), max(accept_above, 0.5)
+
+
+def agreement_report(probabilities, labels, reject_below, accept_above, weights=None):
+    """本地判断与 LLM 结论的一致情况；有样本权重时计数为加权值（抽查样本代表它所在的整段）"""
+    weights = weights or [1] * len(labels)
+    triples = list(zip(probabilities, labels, weights))
+    n = sum(weights)
+    positives = sum(label * weight for _, label, weight in triples)
+    rejected = [(label, weight) for p, label, weight in triples if p < reject_below]
+    accepted = [(label, weight) for p, label, weight in triples if p >= accept_above]
+    missed = sum(label * weight for label, weight in rejected)
+    false_accepts = sum((1 - label) * weight for label, weight in accepted)
+    decided = sum(weight for _, weight in rejected) + sum(weight for _, weight in accepted)
+    agree = decided - missed - false_accepts
+    correct = sum(weight for p, label, weight in triples if (p >= 0.5) == bool(label))
+
+    def count(value):
+        return round(value, 1) if isinstance(value, float) else value
+
+    return {
+        "samples": len(labels),
+        "llm_worth_taking": count(positives),
+        "accuracy_at_0.5": round(correct / n, 4) if n else None,
+        "decided_locally": count(decided),
+        "llm_calls_saved": round(decided / n, 4) if n else None,
+        "agreement_on_decided": round(agree / decided, 4) if decided else None,
+        "missed_worth_taking": count(missed),
+        "recall_kept": round(1 - missed / positives, 4) if positives else None,
+        "false_accepts": count(false_accepts),
+    }
+
+
+def train(samples, rules, max_missed=0.02, min_precision=0.97):
+    """samples: [(快照, 是否值得接)] 或 [(快照, 是否值得接, 权重)]；返回可保存的模型 dict"""
+    if len(samples) < TRIAGE_MIN_SAMPLES:
+        raise ValueError(f"need at least {TRIAGE_MIN_SAMPLES} cached LLM analyses, got {len(samples)}")
+    snapshots, labels, sample_weights = _unpack(samples)
+    if len(set(labels)) < 2:
+        raise ValueError("cached LLM analyses contain only one verdict, cannot train")
+
+    features = [extract_features(snapshot, rules) for snapshot in snapshots]
+    holdout = [_is_holdout(snapshot) for snapshot in snapshots]
+    train_index = [i for i, flag in enumerate(holdout) if not flag]
+    holdout_index = [i for i, flag in enumerate(holdout) if flag]
+
+    bias, weights = fit([features[i] for i in train_index], [labels[i] for i in train_index],
+                        sample_weights=[sample_weights[i] for i in train_index])
+
+    def predict(i):
+        return _sigmoid(bias + float(weights[features[i]].sum()))
+
+    holdout_probabilities = [predict(i) for i in holdout_index]
+    holdout_labels = [labels[i] for i in holdout_index]
+    holdout_weights = [sample_weights[i] for i in holdout_index]
+    if holdout_index and 0 < sum(holdout_labels) < len(holdout_labels):
+        reject_below, accept_above = choose_thresholds(holdout_probabilities, holdout_labels,
+                                                       max_missed, min_precision, holdout_weights)
+    else:
+        # 校准集里只有一种结论时无法校准，全部交给 LLM
+        reject_below, accept_above = 0.0, 1.01
+
+    nonzero = np.flatnonzero(np.abs(weights) > 1e-6)
+    return {
+        "version": time_module.strftime("%Y-%m-%d.%H%M%S"),
+        "n_buckets": TRIAGE_BUCKETS,
+        "bias": round(bias, 6),
+        "weights": {str(int(index)): round(float(weights[index]), 6) for index in nonzero},
+        "reject_below": round(reject_below, 6),
+        "accept_above": round(accept_above, 6),
+        "rules_version": rules.version,
+        "trained_on": len(train_index),
+        "holdout": agreement_report(holdout_probabilities, holdout_labels, reject_below, accept_above,
+                                    holdout_weights),
+        "settings": {"max_missed": max_missed, "min_precision": min_precision},
+    }
+
+
+def save_model(data, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+# ========== 运行时加载 ==========
+
+_STATE = {"model": None, "mtime": None, "last_error": None, "stale_warned": None}
+_LOCK = threading.Lock()
+
+
+def get_triage_model():
+    """
+    返回当前模型；未开启、文件不存在、加载失败或训练时的规则版本与当前规则不一致时返回 None
+    文件修改后自动重新加载
+    """
+    if not TRIAGE_ENABLED:
+        return None
+    try:
+        mtime = os.stat(TRIAGE_MODEL_PATH).st_mtime
+    except OSError:
+        return None
+    with _LOCK:
+        if _STATE["mtime"] != mtime:
+            _STATE["mtime"] = mtime
+            try:
+                with open(TRIAGE_MODEL_PATH, encoding="utf-8") as f:
+                    _STATE["model"] = TriageModel(json.load(f))
+                _STATE["last_error"] = None
+                print(f"[TRIAGE] Loaded model {_STATE['model'].version}")
+            except (OSError, ValueError, KeyError) as e:
+                # 文件损坏时不做分诊，全部交给 LLM
+                _STATE["model"] = None
+                _STATE["last_error"] = str(e)
+                print(f"[TRIAGE] Failed to load {TRIAGE_MODEL_PATH}: {e}")
+        model = _STATE["model"]
+        if model is None:
+            return None
+        # 规则改变后正则特征的含义和 LLM 的判断标准都变了，旧阈值不再可信
+        rules_version = get_rules().version
+        trained_on = model.data.get("rules_version")
+        if trained_on != rules_version:
+            _STATE["last_error"] = (f"model {model.version} was trained on rules {trained_on}, "
+                                    f"current rules are {rules_version}; retrain it")
+            if _STATE["stale_warned"] != (model.version, rules_version):
+                _STATE["stale_warned"] = (model.version, rules_version)
+                print(f"[TRIAGE] WARNING: {_STATE['last_error']}, triage disabled")
+            return None
+        if _STATE["stale_warned"] is not None:
+            _STATE["stale_warned"] = None
+            _STATE["last_error"] = None
+        return model
+
+
+def get_triage_stats():
+    model = get_triage_model()
+    if model is None:
+        return {"enabled": False, "last_error": _STATE["last_error"]}
+    with model.lock:
+        counts = dict(model.stats)
+    return {
+        "enabled": True,
+        "version": model.version,
+        "reject_below": model.reject_below,
+        "accept_above": model.accept_above,
+        "holdout": model.data.get("holdout"),
+        "audit_rate": model.audit_rate,
+        **counts,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train / evaluate the local triage model from cached LLM verdicts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train", help="train on the LLM cache and save the model")
+    train_parser.add_argument("--output", default=TRIAGE_MODEL_PATH)
+    train_parser.add_argument("--llm-model", help="only use analyses from this LLM model (default: all)")
+    train_parser.add_argument("--max-missed", type=float, default=0.02,
+                              help="max fraction of LLM-approved posts the model may reject locally")
+    train_parser.add_argument("--min-precision", type=float, default=0.97,
+                              help="min precision of posts the model approves locally")
+    eval_parser = sub.add_parser("evaluate", help="report agreement of a saved model with all cached LLM verdicts")
+    eval_parser.add_argument("--model-file", default=TRIAGE_MODEL_PATH)
+    eval_parser.add_argument("--llm-model")
+    args = parser.parse_args(argv)
+
+    rules = get_rules()
+    samples = load_samples(args.llm_model)
+    _, labels, weights = _unpack(samples)
+    print(f"[TRIAGE] {len(samples)} LLM training labels, {sum(labels)} worth taking, "
+          f"{sum(weight != 1 for weight in weights)} from audited triage decisions")
+
+    if args.command == "train":
+        start = time_module.perf_counter()
+        try:
+            data = train(samples, rules, args.max_missed, args.min_precision)
+        except ValueError as e:
+            print(f"[TRIAGE] {e}")
+            return 1
+        save_model(data, args.output)
+        print(f"[TRIAGE] Trained in {time_module.perf_counter() - start:.2f}s, "
+              f"{len(data['weights'])} non-zero weights, saved to {args.output} "
+              f"({os.path.getsize(args.output) / 1024:.0f} KB)")
+        print(f"[TRIAGE] Thresholds: reject < {data['reject_below']:.3f}, accept >= {data['accept_above']:.3f}")
+        print(json.dumps(data["holdout"], indent=2))
+        return 0
+
+    try:
+        with open(args.model_file, encoding="utf-8") as f:
+            model = TriageModel(json.load(f))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[TRIAGE] Cannot load {args.model_file}: {e}")
+        return 1
+    probabilities = [model.probability(sample[0], rules) for sample in samples]
+    report = agreement_report(probabilities, labels, model.reject_below, model.accept_above, weights)
+    print(f"[TRIAGE] Model {model.version} (includes its own training data)")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
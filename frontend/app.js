@@ -1,6 +1,8 @@
 const API_BASE = "http://localhost:8000";
 let allPosts = [];
 let allTasks = [];
+let currentTaskFilter = "all";
+let taskJobId = null; // background LLM job of the latest task scan
 let currentMode = "demand"; // "demand" or "task"
 
 // ========== Mode Switching ==========
@@ -127,6 +129,7 @@ async function scanTasks() {
 
     btn.disabled = true;
     btn.textContent = "Hunting...";
+    taskJobId = null;
     document.getElementById("loading").style.display = "block";
     document.getElementById("results").innerHTML = "";
     document.getElementById("taskStats").style.display = "none";
@@ -138,7 +141,9 @@ async function scanTasks() {
 
         allTasks = data.posts;
         renderTaskStats(data.stats);
-        renderTasks(allTasks);
+        renderFilteredTasks();
+        taskJobId = data.llm_job_id || null;
+        if (taskJobId) pollLlmJob(taskJobId);
     } catch (err) {
         document.getElementById("results").innerHTML =
             `<div style="color:#d63031;text-align:center;padding:20px;">Request failed: ${err.message}<br>Please make sure backend is running</div>`;
@@ -178,6 +183,9 @@ function renderTasks(tasks) {
         const textPreview = task.text ? task.text.substring(0, 200) + (task.text.length > 200 ? "..." : "") : "";
         const budgetStr = task.budget ? `$${task.budget}` : "";
         const freshness = task.freshness_label || "";
+        const analysis = task.llm_analysis;
+        const triage = task.triage && task.triage.decided ? task.triage : null;
+        const analyzing = !analysis && !triage && taskJobId && ["skill_match", "maybe_match"].includes(task.task_category);
 
         // Freshness urgency class
         let freshnessClass = "stale";
@@ -200,6 +208,11 @@ function renderTasks(tasks) {
                     ${task.author ? `<span class="author-badge">u/${escapeHtml(task.author)}</span>` : ""}
                 </div>
                 ${textPreview ? `<div class="post-text">${escapeHtml(textPreview)}</div>` : ""}
+                ${analysis ? renderLlmAnalysis(analysis) : ""}
+                ${!analysis && triage ? `<div class="llm-analysis ${triage.worth_taking ? "worth" : "skip"}">
+                    <strong>Local triage: ${triage.worth_taking ? "Worth taking" : "Skip"}</strong> · ${Math.round(triage.probability * 100)}%
+                </div>` : ""}
+                ${analyzing ? `<div class="llm-analysis pending">AI analyzing...</div>` : ""}
                 <div class="post-meta">
                     <span>↑ ${task.score}</span>
                     <span>💬 ${task.num_comments}</span>
@@ -217,14 +230,81 @@ function renderTasks(tasks) {
     }).join("");
 }
 
+function renderLlmAnalysis(analysis) {
+    const verdict = analysis.worth_taking ? "Worth taking" : "Skip";
+    const details = [
+        analysis.suggested_bid_usd ? `Bid: $${analysis.suggested_bid_usd}` : "",
+        analysis.estimated_hours ? `~${analysis.estimated_hours}h` : "",
+        analysis.difficulty || "",
+    ].filter(Boolean).join(" | ");
+    const flags = (analysis.red_flags || []).join(", ");
+
+    return `
+        <div class="llm-analysis ${analysis.worth_taking ? "worth" : "skip"}">
+            <strong>AI: ${verdict}</strong>${details ? ` · ${escapeHtml(details)}` : ""}
+            ${analysis.summary ? `<div>${escapeHtml(analysis.summary)}</div>` : ""}
+            ${flags ? `<div class="llm-flags">Red flags: ${escapeHtml(flags)}</div>` : ""}
+        </div>
+    `;
+}
+
+function renderFilteredTasks() {
+    if (currentTaskFilter === "all") {
+        renderTasks(allTasks);
+    } else {
+        renderTasks(allTasks.filter(t => t.task_category === currentTaskFilter));
+    }
+}
+
 function filterTasks(category, tabEl) {
     document.querySelectorAll("#taskFilters .tab").forEach(t => t.classList.remove("active"));
     tabEl.classList.add("active");
 
-    if (category === "all") {
-        renderTasks(allTasks);
-    } else {
-        renderTasks(allTasks.filter(t => t.task_category === category));
+    currentTaskFilter = category;
+    renderFilteredTasks();
+}
+
+function countTaskStats(tasks) {
+    const count = category => tasks.filter(t => t.task_category === category).length;
+    return {
+        total: tasks.length,
+        skill_match: count("skill_match"),
+        maybe_match: count("maybe_match"),
+        irrelevant: count("irrelevant"),
+        danger: count("danger"),
+    };
+}
+
+// Results arrive one post at a time while the background LLM job runs
+async function pollLlmJob(jobId) {
+    let since = 0;
+    while (taskJobId === jobId) {
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        if (taskJobId !== jobId) return;
+
+        let job;
+        try {
+            const res = await fetch(`${API_BASE}/api/tasks/jobs/${jobId}?since=${since}`);
+            if (!res.ok) break;
+            job = await res.json();
+        } catch (err) {
+            break;
+        }
+        if (taskJobId !== jobId) return;
+
+        since = job.next;
+        if (job.updates.length > 0) {
+            const byId = new Map(job.updates.map(u => [u.id, u]));
+            allTasks = allTasks.map(t => byId.has(t.id) ? { ...t, ...byId.get(t.id) } : t);
+            renderTaskStats(countTaskStats(allTasks));
+        }
+        if (job.done) break;
+        if (job.updates.length > 0) renderFilteredTasks();
+    }
+    // Job finished (or is gone): drop the "AI analyzing" placeholders
+    if (taskJobId === jobId) {
+        taskJobId = null;
+        renderFilteredTasks();
     }
 }
 
@@ -254,12 +334,13 @@ async function scanNowAndNotify() {
     const btn = document.querySelector(".scheduler-btn.notify");
     btn.disabled = true;
     btn.textContent = "Scanning...";
+    taskJobId = null;
 
     try {
         const res = await fetch(`${API_BASE}/api/tasks/scan-now`, { method: "POST" });
         const data = await res.json();
         let msg = `Scanned ${data.total_scanned} posts. Found ${data.new_matches} new matches.`;
-        if (data.notified) msg += " Telegram notification sent!";
+        if (data.notified) msg += ` ${data.queued_notifications} queued for notification.`;
         else if (data.new_matches > 0) msg += " (Telegram not configured)";
         alert(msg);
 